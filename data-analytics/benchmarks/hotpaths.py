@@ -0,0 +1,461 @@
+"""
+Offline benchmarks for the collector hot paths.
+
+Runs without network access against the recorded responses in
+benchmarks/fixtures/: a node_exporter page, an Evernode registry response
+and a set of XRPL currency codes. Database writes go to a fake cursor that
+accepts statements and drains COPY streams, so what is measured is the
+Python side of each write (row building, buffering, COPY encoding); pass
+--postgres to run the insert paths against the configured local databases
+instead, inside transactions that are rolled back.
+
+Results are printed and, with --json, written as machine-readable JSON
+tagged with the git commit; --compare flags benchmarks that got slower
+than a previous results file, so regressions can be tracked between
+commits.
+
+Usage:
+    python benchmarks/hotpaths.py                          # every benchmark
+    python benchmarks/hotpaths.py prometheus evernode      # name prefixes
+    python benchmarks/hotpaths.py --json bench.json
+    python benchmarks/hotpaths.py --compare bench.json --threshold 1.2
+    python benchmarks/hotpaths.py --postgres balance_writer evernode
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+import sys
+import os
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+sys.path.insert(0, ROOT)
+
+from config import DatabaseConfig, Colors
+from utils.common import ttl_cache, decode_currency_code
+from utils.db import BalanceWriter
+from utils.metrics import Collector
+from utils.prometheus import PrometheusParser
+
+
+def load_script(name):
+    """Import a collector script as a module without running its main()"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'scripts', f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fixture(filename):
+    with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+        if filename.endswith('.json'):
+            return json.load(f)
+        return f.read()
+
+
+class FakeCursor:
+    """Stands in for a psycopg2 cursor: keeps the last statement and drains COPY input"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = 0
+        self.copied_bytes = 0
+
+    def execute(self, sql, params=None):
+        self.statements += 1
+        self.last = (sql, params)
+
+    def copy_expert(self, sql, file, size=8192):
+        while True:
+            chunk = file.read(size)
+            if not chunk:
+                break
+            self.copied_bytes += len(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class FakeConnection:
+    """Connection for FakeCursor; `prepare` mimics a pool with DB_POOL_PREPARE"""
+    def __init__(self, prepare=False):
+        self.prepared = set() if prepare else None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class RollbackConnection:
+    """Wraps a real connection so the code under test can commit without keeping anything"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def commit(self):
+        self.conn.rollback()
+
+    def rollback(self):
+        self.conn.rollback()
+
+
+class BenchmarkError(Exception):
+    """A benchmark round did no work, so there is nothing to time"""
+
+
+class Benchmark:
+    """
+    One named benchmark
+
+    `setup(args)` returns a callable that does one round of work and returns
+    how many operations it performed; rounds are timed individually.
+    """
+    def __init__(self, name, setup, description, postgres=False):
+        self.name = name
+        self.setup = setup
+        self.description = description
+        self.postgres = postgres  # Runs against a real database with --postgres
+
+    def run(self, args):
+        round_fn = self.setup(args)
+        for _ in range(args.warmup):
+            round_fn()
+        timings = []
+        ops = 0
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            ops = round_fn()
+            timings.append(time.perf_counter() - started)
+            if not ops:
+                raise BenchmarkError("a round performed 0 operations")
+        per_op = [t / ops * 1e6 for t in timings]
+        return {
+            'description': self.description,
+            'ops_per_round': ops,
+            'rounds': args.rounds,
+            'median_us_per_op': statistics.median(per_op),
+            'min_us_per_op': min(per_op),
+            'stdev_us_per_op': statistics.stdev(per_op) if len(per_op) > 1 else 0.0,
+            'ops_per_second': ops / statistics.median(timings),
+        }
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, description, postgres=False):
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, setup, description, postgres))
+        return setup
+    return register
+
+
+# --- ttl_cache ---------------------------------------------------------
+
+@benchmark('ttl_cache.hit', "decorated call, every key cached")
+def bench_ttl_cache_hit(args):
+    @ttl_cache(maxsize=1024, ttl=3600)
+    def price(symbol):
+        return 1.0
+
+    keys = [f"TOKEN{i}" for i in range(512)]
+    for key in keys:
+        price(key)
+
+    def round_fn():
+        for key in keys:
+            price(key)
+        return len(keys)
+    return round_fn
+
+
+@benchmark('ttl_cache.churn', "decorated call, skewed keys over a cache smaller than the key space")
+def bench_ttl_cache_churn(args):
+    @ttl_cache(maxsize=256, ttl=3600)
+    def price(symbol):
+        return 1.0
+
+    rng = random.Random(0)
+    keys = [f"TOKEN{int(rng.paretovariate(1.2))}" for _ in range(4096)]
+
+    def round_fn():
+        for key in keys:
+            price(key)
+        return len(keys)
+    return round_fn
+
+
+@benchmark('ttl_cache.expiry', "set() purging an expired entry on every insert")
+def bench_ttl_cache_expiry(args):
+    cache = ttl_cache(maxsize=4096, ttl=0)
+    keys = [("TOKEN", i) for i in range(4096)]
+
+    def round_fn():
+        for key in keys:
+            cache.set(key, 1.0)
+        return len(keys)
+    return round_fn
+
+
+# --- metrics -----------------------------------------------------------
+
+@benchmark('metrics.stage', "Collector.stage() around an empty block (instrumentation overhead)")
+def bench_metrics_stage(args):
+    instruments = Collector('benchmark')
+    stages = ['fetch', 'price', 'insert', 'commit'] * 256
+
+    def round_fn():
+        for stage in stages:
+            with instruments.stage(stage):
+                pass
+        return len(stages)
+    return round_fn
+
+
+# --- decode_currency_code ----------------------------------------------
+
+@benchmark('decode_currency_code', "recorded XRPL/Xahau currency codes (standard, non-standard, LP, invalid)")
+def bench_decode_currency_code(args):
+    codes = fixture('currency_codes.json') * 100
+
+    def round_fn():
+        for code in codes:
+            decode_currency_code(code)
+        return len(codes)
+    return round_fn
+
+
+# --- Prometheus parser -------------------------------------------------
+
+def prometheus_lines():
+    return fixture('node_exporter.prom').splitlines()
+
+
+@benchmark('prometheus.parse.cold', "node_exporter page with a fresh parser (labels parsed)")
+def bench_prometheus_cold(args):
+    lines = prometheus_lines()
+
+    def round_fn():
+        for _ in PrometheusParser().parse(lines):
+            pass
+        return len(lines)
+    return round_fn
+
+
+@benchmark('prometheus.parse.warm', "node_exporter page with series interned by an earlier scrape")
+def bench_prometheus_warm(args):
+    lines = prometheus_lines()
+    parser = PrometheusParser()
+    for _ in parser.parse(lines):
+        pass
+
+    def round_fn():
+        for _ in parser.parse(lines):
+            pass
+        return len(lines)
+    return round_fn
+
+
+@benchmark('prometheus.parse_metrics', "pi_data_collector.parse_metrics on the node_exporter page (warm)")
+def bench_parse_metrics(args):
+    collector = load_script('pi_data_collector')
+    lines = prometheus_lines()
+    collector.parse_metrics(lines)
+
+    def round_fn():
+        collector.parse_metrics(lines)
+        return len(lines)
+    return round_fn
+
+
+# --- Evernode ----------------------------------------------------------
+
+def evernode_hosts(count):
+    """Registry hosts from the fixture, repeated with distinct addresses up to `count`"""
+    hosts = [entry for entry in fixture('evernode_hosts.json')['data'] if 'cpuModelName' in entry]
+    return [dict(hosts[i % len(hosts)], address=f"{hosts[i % len(hosts)]['address']}{i}")
+            for i in range(count)]
+
+
+@benchmark('evernode.host_rows', "build COLUMNS-ordered rows for a registry snapshot")
+def bench_evernode_host_rows(args):
+    collector = load_script('evernode_host_stats')
+    hosts = evernode_hosts(args.hosts)
+    execution_ts = datetime.now(timezone.utc)
+
+    def round_fn():
+        for _ in collector.host_rows(hosts, execution_ts):
+            pass
+        return len(hosts)
+    return round_fn
+
+
+@benchmark('evernode.insert_hosts', "insert_hosts: row building and COPY encoding of a snapshot", postgres=True)
+def bench_evernode_insert_hosts(args):
+    collector = load_script('evernode_host_stats')
+    hosts = evernode_hosts(args.hosts)
+    execution_ts = datetime.now(timezone.utc)
+    conn = database_connection(args, DatabaseConfig.EVERNODE_HOST_STATS)
+
+    def round_fn():
+        return collector.insert_hosts(conn, hosts, execution_ts)
+    return round_fn
+
+
+# --- Balance inserts ---------------------------------------------------
+
+def balance_rows(count):
+    rng = random.Random(1)
+    rows = []
+    for i in range(count):
+        balance = rng.uniform(0, 1e6)
+        price = rng.choice([None, rng.uniform(0.0001, 100)])
+        rows.append(('xrpl', f"rAccount{i % 25}", f"wallet{i % 25}", f"TOKEN{i % 40}", balance,
+                     price, balance * price if price is not None else None, 'example.com'))
+    return rows
+
+
+BENCHMARK_EXECUTION_ID = 0  # asset_balances.execution_id is a BIGINT; rows are rolled back anyway
+
+
+def balance_writer_bench(prepare):
+    def setup(args):
+        rows = balance_rows(args.balances)
+        conn = database_connection(args, DatabaseConfig.ASSET_BALANCES, prepare)
+        ts = datetime.now(timezone.utc)
+
+        def round_fn():
+            writer = BalanceWriter(conn, BENCHMARK_EXECUTION_ID, max_rows=len(rows))
+            for row in rows:
+                writer.add(*row, ts=ts)
+            writer.close()
+            return writer.written
+        return round_fn
+    return setup
+
+
+benchmark('balance_writer', "BalanceWriter.add for every row, one flush", postgres=True)(
+    balance_writer_bench(prepare=False))
+benchmark('balance_writer.prepared', "BalanceWriter with DB_POOL_PREPARE (PREPARE once, then EXECUTE)",
+          postgres=True)(balance_writer_bench(prepare=True))
+
+
+def database_connection(args, dbname, prepare=False):
+    """FakeConnection, or with --postgres a pooled connection whose commits roll back"""
+    if not args.postgres:
+        return FakeConnection(prepare)
+    conn = DatabaseConfig.get_pool(dbname).getconn()
+    if prepare and conn.prepared is None:
+        conn.prepared = set()
+    elif not prepare:
+        conn.prepared = None
+    return RollbackConnection(conn)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous, threshold):
+    """Print the change against a previous results file; returns the names that regressed"""
+    regressed = []
+    print(f"{Colors.CYAN}Compared with {previous.get('commit') or 'previous run'}:{Colors.RESET}")
+    for name, result in results.items():
+        before = previous.get('benchmarks', {}).get(name)
+        if not before:
+            print(f"    {name:28} new")
+            continue
+        ratio = result['median_us_per_op'] / before['median_us_per_op']
+        color = Colors.RED if ratio > threshold else Colors.GREEN if ratio < 1 / threshold else ''
+        print(f"    {name:28} {color}{ratio:6.2f}x{Colors.RESET if color else ''}")
+        if ratio > threshold:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark collector hot paths offline")
+    parser.add_argument('names', nargs='*', help="benchmark names or prefixes (default: all)")
+    parser.add_argument('--rounds', type=int, default=20, help="timed rounds per benchmark")
+    parser.add_argument('--warmup', type=int, default=3, help="untimed rounds first")
+    parser.add_argument('--hosts', type=int, default=2000, help="Evernode hosts per snapshot")
+    parser.add_argument('--balances', type=int, default=1000, help="balance rows per flush")
+    parser.add_argument('--postgres', action='store_true',
+                        help="run insert benchmarks against the configured databases (rolled back)")
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON")
+    parser.add_argument('--compare', metavar='PATH', help="previous --json output to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown ratio that counts as a regression (exit status 1)")
+    parser.add_argument('--list', action='store_true', help="list benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for bench in BENCHMARKS:
+            print(f"{bench.name:28} {bench.description}")
+        return
+
+    selected = [bench for bench in BENCHMARKS
+                if not args.names or any(bench.name.startswith(name) for name in args.names)]
+    if args.postgres:
+        selected = [bench for bench in selected if bench.postgres]
+    if not selected:
+        parser.error("no benchmarks match")
+
+    results = {}
+    failed = []
+    for bench in selected:
+        try:
+            result = results[bench.name] = bench.run(args)
+        except (psycopg2.Error, BenchmarkError) as e:
+            print(f"{Colors.RED}{bench.name:28} failed: {str(e).strip()}{Colors.RESET}")
+            failed.append(bench.name)
+            continue
+        print(f"{bench.name:28} {result['median_us_per_op']:10.3f} us/op "
+              f"(min {result['min_us_per_op']:.3f}, {result['ops_per_second']:,.0f} ops/s)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'postgres': args.postgres,
+                'benchmarks': results,
+                'failed': failed,
+            }, f, indent=2)
+        print(f"Wrote {args.json}")
+    if failed:
+        sys.exit(1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, json.load(f), args.threshold)
+        if regressed:
+            print(f"{Colors.RED}Slower than {args.threshold:g}x: {', '.join(regressed)}{Colors.RESET}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
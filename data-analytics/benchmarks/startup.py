@@ -0,0 +1,136 @@
+"""
+Startup-time benchmark for the collector scripts.
+
+Imports each script (without running its main) in a fresh interpreter under
+`python -X importtime`, and reports the wall time over the bare interpreter
+plus the slowest imports, so a heavy dependency creeping into a cheap
+collector's import path shows up before it ships.
+
+Usage:
+    python benchmarks/startup.py                          # every script
+    python benchmarks/startup.py pi_latency_collector     # selected scripts
+    python benchmarks/startup.py --repeat 5 --top 5 --json startup.json
+    python benchmarks/startup.py pi_latency_collector --budget-ms 150
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(ROOT, 'scripts')
+
+# Executes the script's top level only; `if __name__ == "__main__"` blocks are skipped
+IMPORT_SNIPPET = "import runpy, sys; runpy.run_path(sys.argv[1], run_name='__startup_benchmark__')"
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output
+
+    Returns:
+        list: (module, depth, self_us, cumulative_us) in import order
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        name = name[1:]  # One space follows the separator; nesting adds two per level
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return imports
+
+
+def time_import(path, repeat):
+    """Import `path` `repeat` times in fresh interpreters; returns wall times (ms) and the last run's imports"""
+    args = [sys.executable, '-X', 'importtime', '-c', IMPORT_SNIPPET, path]
+    walls = []
+    imports = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(args, cwd=ROOT, capture_output=True, text=True)
+        walls.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"exit status {result.returncode}")
+        imports = parse_importtime(result.stderr)
+    return walls, imports
+
+
+def baseline(repeat):
+    """
+    Measure an interpreter that imports nothing
+
+    Returns:
+        tuple: (median wall time in ms, names of modules imported at startup)
+    """
+    walls = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'],
+                                capture_output=True, text=True, check=True)
+        walls.append((time.perf_counter() - started) * 1000)
+    return statistics.median(walls), {name for name, _, _, _ in parse_importtime(result.stderr)}
+
+
+def main():
+    scripts = sorted(f[:-3] for f in os.listdir(SCRIPTS_DIR) if f.endswith('.py'))
+    parser = argparse.ArgumentParser(description="Measure collector import (startup) time")
+    parser.add_argument('scripts', nargs='*', help="script names without .py (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per script; the median is reported")
+    parser.add_argument('--top', type=int, default=8, help="slowest imports to list per script")
+    parser.add_argument('--json', metavar='PATH', help="also write results as JSON")
+    parser.add_argument('--budget-ms', type=float,
+                        help="exit non-zero if any script's startup exceeds this many ms over baseline")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scripts if name not in scripts]
+    if unknown:
+        parser.error(f"unknown scripts: {', '.join(unknown)}")
+
+    base, startup_modules = baseline(args.repeat)
+    print(f"Interpreter baseline: {base:.1f} ms (median of {args.repeat})\n")
+    results = {'baseline_ms': base, 'scripts': {}}
+    over_budget = []
+    for name in args.scripts or scripts:
+        try:
+            walls, imports = time_import(os.path.join(SCRIPTS_DIR, f"{name}.py"), args.repeat)
+        except RuntimeError as e:
+            print(f"{name}: failed to import ({e})\n")
+            results['scripts'][name] = {'error': str(e)}
+            continue
+
+        startup = statistics.median(walls) - base
+        imports = [i for i in imports if i[0] not in startup_modules]
+        slowest = sorted(imports, key=lambda i: i[3], reverse=True)
+        # Only the outermost package of each chain, so one heavy import isn't listed N times
+        top = [i for i in slowest if i[1] == 0][:args.top]
+        print(f"{name}: {startup:.1f} ms over baseline ({len(imports)} modules imported)")
+        for module, _, _, cumulative_us in top:
+            print(f"    {cumulative_us / 1000:8.1f} ms  {module}")
+        print()
+        results['scripts'][name] = {
+            'startup_ms': startup,
+            'wall_ms': walls,
+            'modules': len(imports),
+            'top_imports': [{'module': m, 'cumulative_ms': c / 1000, 'self_ms': s / 1000}
+                            for m, _, s, c in top],
+        }
+        if args.budget_ms is not None and startup > args.budget_ms:
+            over_budget.append(name)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.json}")
+    if over_budget:
+        print(f"Over the {args.budget_ms:g} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,111 @@
 """
 Centralized configuration management for the data collection system.
 Loads settings from environment variables via .env file.
+
+Settings are resolved on first access rather than at import time, so a
+collector only pays for (and only fails on) the sections it actually
+uses, and the .env file is read once, on the first setting accessed.
 """
 import os
-from dotenv import load_dotenv
+import threading
+
+_env_loaded = False
+_env_lock = threading.Lock()
+_UNSET = object()
+
+
+def load_env():
+    """Load the .env file into the environment once (called on first setting access)"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
 
-# Load environment variables from .env file
-load_dotenv()
+class setting:
+    """
+    Class attribute read from the environment on first access
+
+    Args:
+        name: Environment variable to read
+        default: Value used when the variable is unset (not parsed)
+        parse: Conversion applied to the variable's string value (e.g. int)
+        compute: Callable building a derived value, used instead of `name`
+    """
+    def __init__(self, name=None, default=None, parse=None, compute=None):
+        self.name = name
+        self.default = default
+        self.parse = parse
+        self.compute = compute
+        self.value = _UNSET
+
+    def __get__(self, instance, owner):
+        if self.value is _UNSET:
+            load_env()
+            if self.compute is not None:
+                self.value = self.compute()
+            else:
+                raw = os.getenv(self.name)
+                self.value = self.default if raw is None else (self.parse(raw) if self.parse else raw)
+        return self.value
+
+
+def flag(value):
+    """Parse a true/false environment value"""
+    return value.lower() == 'true'
 
 # Database Configuration
 class DatabaseConfig:
     """Database connection settings"""
-    HOST = os.getenv('DB_HOST', 'localhost')
-    PORT = int(os.getenv('DB_PORT', 5432))
-    USER = os.getenv('DB_USER', 'root')
-    PASSWORD = os.getenv('DB_PASSWORD', '')
+    HOST = setting('DB_HOST', 'localhost')
+    PORT = setting('DB_PORT', 5432, int)
+    USER = setting('DB_USER', 'root')
+    PASSWORD = setting('DB_PASSWORD', '')
     
     # Database names
-    ASSET_BALANCES = os.getenv('DB_ASSET_BALANCES', 'asset_balances')
-    ENVIRONMENT_METRICS = os.getenv('DB_ENVIRONMENT_METRICS', 'environment_metrics')
-    EVERNODE_HOST_STATS = os.getenv('DB_EVERNODE_HOST_STATS', 'evernode_host_stats')
-    ISS_METRICS = os.getenv('DB_ISS_METRICS', 'iss_metrics')
+    ASSET_BALANCES = setting('DB_ASSET_BALANCES', 'asset_balances')
+    ENVIRONMENT_METRICS = setting('DB_ENVIRONMENT_METRICS', 'environment_metrics')
+    EVERNODE_HOST_STATS = setting('DB_EVERNODE_HOST_STATS', 'evernode_host_stats')
+    ISS_METRICS = setting('DB_ISS_METRICS', 'iss_metrics')
+    DATABASES = ('ASSET_BALANCES', 'ENVIRONMENT_METRICS', 'EVERNODE_HOST_STATS', 'ISS_METRICS')
+    
+    # Connections kept per database by the shared pool, and how long a caller
+    # waits (seconds) for one when all are in use
+    POOL_SIZE = setting('DB_POOL_SIZE', 4, int)
+    POOL_TIMEOUT = setting('DB_POOL_TIMEOUT', 30.0, float)
+    # Replace connections older than this; health-check ones idle longer than this (seconds)
+    POOL_MAX_LIFETIME = setting('DB_POOL_MAX_LIFETIME', 3600.0, float)
+    POOL_CHECK_AFTER = setting('DB_POOL_CHECK_AFTER', 30.0, float)
+    # Server-side prepared statements for hot inserts (disable behind pgbouncer
+    # in transaction pooling mode)
+    POOL_PREPARE = setting('DB_POOL_PREPARE', False, flag)
+    
+    @staticmethod
+    def resolve_name(name):
+        """Database name for a setting name ('ASSET_BALANCES') or a database name"""
+        if name in DatabaseConfig.DATABASES:
+            return getattr(DatabaseConfig, name)
+        return name
+    
+    @staticmethod
+    def get_pool(name):
+        """Shared connection pool for a database (see utils.db.ConnectionPool)
+        
+        Usage:
+            with DatabaseConfig.get_pool(DatabaseConfig.ASSET_BALANCES).connection() as conn:
+                ...
+        """
+        from utils.db import get_pool  # utils.db imports this module
+        return get_pool(DatabaseConfig.resolve_name(name))
+    
+    @staticmethod
+    def connection(name):
+        """Borrow a pooled connection: `with DatabaseConfig.connection('ASSET_BALANCES') as conn:`"""
+        return DatabaseConfig.get_pool(name).connection()
     
     @staticmethod
     def get_db_config(dbname):
@@ -39,8 +124,8 @@ class DatabaseConfig:
 # API Keys
 class APIKeys:
     """External API authentication"""
-    MORALIS = os.getenv('MORALIS_API_KEY')
-    ALCHEMY = os.getenv('ALCHEMY_API_KEY')
+    MORALIS = setting('MORALIS_API_KEY')
+    ALCHEMY = setting('ALCHEMY_API_KEY')
 
 
 # Blockchain Configuration
@@ -48,9 +133,17 @@ class BlockchainConfig:
     """Blockchain RPC endpoints and account lists"""
     
     # RPC URLs
-    XRPL_RPC_URL = os.getenv('XRPL_RPC_URL', 'https://s2.ripple.com:51234/')
-    XAHAU_RPC_URL = os.getenv('XAHAU_RPC_URL', 'https://xahau.network')
-    WEB3_PROVIDER_URL = os.getenv('WEB3_PROVIDER_URL')
+    XRPL_RPC_URL = setting('XRPL_RPC_URL', 'https://s2.ripple.com:51234/')
+    XAHAU_RPC_URL = setting('XAHAU_RPC_URL', 'https://xahau.network')
+    WEB3_PROVIDER_URL = setting('WEB3_PROVIDER_URL')
+    
+    # XRPL worker pool size and per-endpoint request budget (requests/second)
+    XRPL_WORKERS = setting('XRPL_WORKERS', 4, int)
+    XRPL_RATE_LIMIT = setting('XRPL_RATE_LIMIT', 5.0, float)
+    XRPL_RATE_BURST = setting('XRPL_RATE_BURST', 10, int)
+    
+    # Trust lines per account_lines page (XRPL and Xahau; servers allow 10-400)
+    ACCOUNT_LINES_LIMIT = setting('ACCOUNT_LINES_LIMIT', 400, int)
     
     @staticmethod
     def parse_accounts(env_var_name):
@@ -59,6 +152,7 @@ class BlockchainConfig:
         Format: ADDRESS:NAME,ADDRESS:NAME,...
         Returns: [{"address": "...", "name": "..."}, ...]
         """
+        load_env()
         accounts_str = os.getenv(env_var_name, '')
         if not accounts_str:
             return []
@@ -92,31 +186,156 @@ class BlockchainConfig:
 # Evernode Configuration
 class EvernodeConfig:
     """Evernode API settings"""
-    API_URL = os.getenv('EVERNODE_API_URL', 'https://api.evernode.network/registry/hosts/YOUR_DOMAIN')
+    API_URL = setting('EVERNODE_API_URL', 'https://api.evernode.network/registry/hosts/YOUR_DOMAIN')
+    # Write full rows only for changed hosts; heartbeat-only rows for the rest
+    DELTA_SNAPSHOTS = setting('EVERNODE_DELTA_SNAPSHOTS', False, flag)
+    # Force a full row per host at least this often (seconds) even if unchanged
+    FULL_SNAPSHOT_INTERVAL = setting('EVERNODE_FULL_SNAPSHOT_INTERVAL', 86400, int)
 
 
 # Raspberry Pi Configuration
 class RaspberryPiConfig:
     """Raspberry Pi monitoring settings"""
-    METRICS_URL = os.getenv('PI_METRICS_URL', 'http://ghost:5000/metrics')
-    PING_TARGET = os.getenv('PI_PING_TARGET', 'ghost')
+    METRICS_URL = setting('PI_METRICS_URL', 'http://ghost:5000/metrics')
+    PING_TARGET = setting('PI_PING_TARGET', 'ghost')
+    # Latency prober: comma-separated targets, probes per target per window
+    PING_TARGETS = setting(compute=lambda: [
+        h.strip() for h in os.getenv('PI_PING_TARGETS', RaspberryPiConfig.PING_TARGET).split(',') if h.strip()
+    ])
+    PING_PROBES = setting('PI_PING_PROBES', 10, int)
+    PING_WINDOW = setting('PI_PING_WINDOW', 60.0, float)  # Seconds
+    PING_TIMEOUT = setting('PI_PING_TIMEOUT', 2.0, float)  # Seconds per probe
+    # Speed test: reuse the chosen server / closest-server list for this long (seconds)
+    SPEEDTEST_SERVER_TTL = setting('SPEEDTEST_SERVER_TTL', 86400, int)
+    SPEEDTEST_SERVER_LIST_TTL = setting('SPEEDTEST_SERVER_LIST_TTL', 604800, int)
+    SPEEDTEST_THREADS = setting('SPEEDTEST_THREADS', None, lambda v: int(v) or None)  # None: speedtest default
+    SPEEDTEST_LATENCY_PROBES = setting('SPEEDTEST_LATENCY_PROBES', 10, int)  # For jitter
+    SCRAPE_INTERVAL = setting('PI_SCRAPE_INTERVAL', 60.0, float)  # Seconds, daemon mode
 
 
 # Polygon Configuration
 class PolygonConfig:
     """Polygon/Matic blockchain settings"""
-    WALLET_ADDRESS = os.getenv('POLYGON_WALLET_ADDRESS')
+    WALLET_ADDRESS = setting('POLYGON_WALLET_ADDRESS')
 
 
 # ISS Configuration (Experimental)
 class ISSConfig:
     """International Space Station telemetry settings"""
-    LS_URL = os.getenv('ISS_LS_URL', 'wss://lightstreamer.nasa.gov/WS')
-    LS_ADAPTER = os.getenv('ISS_LS_ADAPTER', 'ISS_STREAM')
-    LS_USER = os.getenv('ISS_LS_USER', 'USER')
-    LS_PASSWORD = os.getenv('ISS_LS_PASSWORD', 'PASS')
+    LS_URL = setting('ISS_LS_URL', 'wss://lightstreamer.nasa.gov/WS')
+    LS_ADAPTER = setting('ISS_LS_ADAPTER', 'ISS_STREAM')
+    LS_USER = setting('ISS_LS_USER', 'USER')
+    LS_PASSWORD = setting('ISS_LS_PASSWORD', 'PASS')
+    LS_DATA_ADAPTER = setting('ISS_LS_DATA_ADAPTER')  # Optional; server default otherwise
+    # Items to subscribe as ITEM[:METRIC_NAME], comma-separated; one session for all
+    LS_ITEMS = setting('ISS_LS_ITEMS', {'URINE_TANK_LEVEL': 'URINE_TANK_LEVEL'}, lambda v: dict(
+        (item.strip(), (name or item).strip())
+        for item, _, name in (e.partition(':') for e in v.split(','))
+        if item.strip()
+    ))
+    # Field list; the first field is stored as the telemetry level
+    LS_FIELDS = setting('ISS_LS_FIELDS', ['Value', 'TimeStamp'], lambda v: v.replace(',', ' ').split())
+    # Receiver -> writer pipeline: queue bound (rows), flush by size or age (seconds)
+    QUEUE_SIZE = setting('ISS_QUEUE_SIZE', 10000, int)
+    BATCH_SIZE = setting('ISS_BATCH_SIZE', 500, int)
+    FLUSH_INTERVAL = setting('ISS_FLUSH_INTERVAL', 5.0, float)
+    WRITE_RETRIES = setting('ISS_WRITE_RETRIES', 5, int)  # Failed writes of a batch before it is discarded
+    # Reconnect backoff bounds (seconds)
+    RECONNECT_MIN = setting('ISS_RECONNECT_MIN', 1.0, float)
+    RECONNECT_MAX = setting('ISS_RECONNECT_MAX', 60.0, float)
+
+
+# HTTP Configuration
+class HTTPConfig:
+    """Shared HTTP session settings"""
+    POOL_SIZE = setting('HTTP_POOL_SIZE', 10, int)  # Keep-alive connections per host
+
+
+# Cache Configuration
+class CacheConfig:
+    """On-disk cache settings shared by collector processes"""
+    DIR = setting('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+    PRICE_TTL = setting('PRICE_CACHE_TTL', 300, int)              # Serve without refreshing
+    PRICE_MAX_STALE = setting('PRICE_CACHE_MAX_STALE', 3600, int)  # Serve while refreshing
+    COIN_INDEX_MAX_AGE = setting('COIN_INDEX_MAX_AGE', 86400, int)  # Coin list refresh interval
+    COIN_INDEX_RETRY = setting('COIN_INDEX_RETRY', 900, int)        # Wait after a failed refresh
+
+
+# Partitioning & Retention Configuration
+class PartitionConfig:
+    """Time-partitioning and retention policy per table"""
+    PREMAKE = setting('PARTITION_PREMAKE', 3, int)  # Future partitions kept ready
+    ARCHIVE_SCHEMA = setting('PARTITION_ARCHIVE_SCHEMA', 'archive')
+    
+    # interval: day | week | month; retention_days: 0 keeps everything;
+    # expire: drop | archive (detach and move into ARCHIVE_SCHEMA)
+    POLICIES = setting(compute=lambda: {
+        'pi_environment_samples': {
+            'database': DatabaseConfig.ENVIRONMENT_METRICS, 'column': 'ts', 'interval': 'month',
+            'retention_days': int(os.getenv('RETENTION_PI_METRICS_DAYS', 365)), 'expire': 'drop'
+        },
+        'pi4_environment_samples': {
+            'database': DatabaseConfig.ENVIRONMENT_METRICS, 'column': 'ts', 'interval': 'month',
+            'retention_days': int(os.getenv('RETENTION_PI_METRICS_DAYS', 365)), 'expire': 'drop'
+        },
+        'asset_balances': {
+            'database': DatabaseConfig.ASSET_BALANCES, 'column': 'ts', 'interval': 'month',
+            'retention_days': int(os.getenv('RETENTION_ASSET_BALANCES_DAYS', 0)), 'expire': 'archive'
+        },
+        'evernode_hosts': {
+            'database': DatabaseConfig.EVERNODE_HOST_STATS, 'column': 'execution_ts', 'interval': 'month',
+            'retention_days': int(os.getenv('RETENTION_EVERNODE_HOSTS_DAYS', 365)), 'expire': 'archive'
+        },
+        'evernode_host_heartbeats': {
+            'database': DatabaseConfig.EVERNODE_HOST_STATS, 'column': 'execution_ts', 'interval': 'month',
+            'retention_days': int(os.getenv('RETENTION_EVERNODE_HOSTS_DAYS', 365)), 'expire': 'drop'
+        },
+        'telemetry': {
+            'database': DatabaseConfig.ISS_METRICS, 'column': 'timestamp', 'interval': 'week',
+            'retention_days': int(os.getenv('RETENTION_ISS_TELEMETRY_DAYS', 90)), 'expire': 'drop'
+        },
+    })
+
+
+# Rollup Configuration
+class RollupConfig:
+    """Incremental aggregate settings (scripts/rollup_metrics.py)"""
+    # Stay this far behind now so rows from in-flight transactions aren't skipped
+    LAG_SECONDS = setting('ROLLUP_LAG_SECONDS', 120, int)
+    # Days of buckets kept per resolution; 0 keeps everything
+    RETENTION_DAYS = setting(compute=lambda: {
+        '1m': int(os.getenv('ROLLUP_1M_RETENTION_DAYS', 14)),
+        '1h': int(os.getenv('ROLLUP_1H_RETENTION_DAYS', 400)),
+        '1d': int(os.getenv('ROLLUP_1D_RETENTION_DAYS', 0)),
+    })
 
 
+# Scheduler Configuration
+class SchedulerConfig:
+    """Collector scheduler settings (scripts/scheduler.py)"""
+    WORKERS = setting('SCHEDULER_WORKERS', 4, int)  # Jobs allowed to run at once
+    # Seconds between runs per job; 0 disables the job
+    INTERVALS = setting(compute=lambda: {
+        'pi_metrics': float(os.getenv('SCHEDULE_PI_METRICS', RaspberryPiConfig.SCRAPE_INTERVAL)),
+        'pi_latency': float(os.getenv('SCHEDULE_PI_LATENCY', RaspberryPiConfig.PING_WINDOW)),
+        'speedtest': float(os.getenv('SCHEDULE_SPEEDTEST', 21600)),
+        'xrpl_balances': float(os.getenv('SCHEDULE_XRPL_BALANCES', 3600)),
+        'xahau_balances': float(os.getenv('SCHEDULE_XAHAU_BALANCES', 3600)),
+        'eth_balances': float(os.getenv('SCHEDULE_ETH_BALANCES', 3600)),
+        'evernode_hosts': float(os.getenv('SCHEDULE_EVERNODE_HOSTS', 3600)),
+        'rollups': float(os.getenv('SCHEDULE_ROLLUPS', 300)),
+        'partitions': float(os.getenv('SCHEDULE_PARTITIONS', 86400)),
+    })
+
+
+
+# Metrics Configuration
+class MetricsConfig:
+    """Prometheus instrumentation settings (utils/metrics.py)"""
+    PORT = setting('METRICS_PORT', 0, int)  # /metrics endpoint for long-running processes; 0 disables
+    ADDR = setting('METRICS_ADDR', '127.0.0.1')
+    TEXTFILE_DIR = setting('METRICS_TEXTFILE_DIR')  # node_exporter textfile collector directory; unset disables
+
 # Asset Mapping for CoinGecko
 ASSET_MAP = {
     "XAH": "xahau",
@@ -134,21 +353,27 @@ class Colors:
     RESET = "\033[0m"
 
 
-# Validate critical configuration on import
-def validate_config():
-    """Validate that critical configuration is present"""
-    missing = []
+# Environment variable -> APIKeys attribute, for validate_config
+API_KEY_SETTINGS = {
+    'MORALIS_API_KEY': 'MORALIS',
+    'ALCHEMY_API_KEY': 'ALCHEMY'
+}
+
+
+def validate_config(*env_names):
+    """Warn about missing API keys
     
-    if not APIKeys.MORALIS:
-        missing.append("MORALIS_API_KEY")
+    Nothing is validated on import; collectors call this with the keys they
+    use (e.g. validate_config('MORALIS_API_KEY')). With no arguments every
+    key in API_KEY_SETTINGS is checked.
     
-    if not APIKeys.ALCHEMY:
-        missing.append("ALCHEMY_API_KEY")
+    Returns:
+        list: Names of the missing keys
+    """
+    missing = [name for name in env_names or API_KEY_SETTINGS
+               if not getattr(APIKeys, API_KEY_SETTINGS[name])]
     
     if missing:
         print(f"⚠️  Warning: Missing API keys in .env file: {', '.join(missing)}")
         print("   Some scripts may not function correctly.")
-
-
-# Run validation on import
-validate_config()
\ No newline at end of file
+    return missing
@@ -1,8 +1,3 @@
-from web3 import Web3
-from pycoingecko import CoinGeckoAPI
-import psycopg2
-import requests
-import time
 import random
 from datetime import datetime, timezone
 import sys
@@ -11,14 +6,19 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DatabaseConfig, BlockchainConfig, APIKeys, Colors
+from config import DatabaseConfig, BlockchainConfig, APIKeys, Colors, validate_config
+from utils import BalanceWriter, get_usd_prices_by_id, resolve_coin_id, get_session
+from utils import cancellation
+from utils.metrics import Collector, API_SECONDS
+
+instruments = Collector('eth_balances')
 
 class EthereumBalanceIntegration:
     def __init__(self):
-        self.web3 = Web3(Web3.HTTPProvider(BlockchainConfig.WEB3_PROVIDER_URL))
-        self.cg = CoinGeckoAPI()
+        from web3 import Web3  # Heavy; only imported when the collector runs
+        self.web3 = Web3(Web3.HTTPProvider(BlockchainConfig.WEB3_PROVIDER_URL, session=get_session()))
         self.execution_id = int(datetime.utcnow().strftime('%Y%m%d%H%M%S'))
-        self.db_config = DatabaseConfig.get_db_config(DatabaseConfig.ASSET_BALANCES)
+        self.db_pool = DatabaseConfig.get_pool(DatabaseConfig.ASSET_BALANCES)
     
     def get_all_tokens(self, address: str) -> list:
         """Get ERC20 tokens with balance >0 using Moralis"""
@@ -26,59 +26,51 @@ class EthereumBalanceIntegration:
         headers = {"X-API-Key": APIKeys.MORALIS}
         
         try:
-            response = requests.get(url, headers=headers)
+            with API_SECONDS.time(api='moralis'):
+                response = get_session().get(url, headers=headers, timeout=30)
             response.raise_for_status()
             return [t for t in response.json() if float(t['balance']) > 0]
         except Exception as e:
+            instruments.failed()
             print(f"⚠️ Token fetch error: {str(e)}")
             return []
 
     def get_eth_balance(self, address: str) -> float:
         """Get ETH balance in ether"""
-        return self.web3.from_wei(self.web3.eth.get_balance(address), 'ether')
+        return float(self.web3.from_wei(self.web3.eth.get_balance(address), 'ether'))
 
-    def insert_balance(self, conn, account_data: dict, asset_type: str, 
+    def insert_balance(self, writer, account_data: dict, asset_type: str,
                       balance: float, usd_price: float):
-        """Insert into asset_balances table"""
+        """Buffer a row for the asset_balances table"""
         ts = datetime.now(timezone.utc)
         usd_value = balance * usd_price if usd_price else None
+        writer.add(
+            'ethereum',
+            account_data['address'],
+            account_data.get('name', ''),
+            asset_type,
+            balance,
+            usd_price,
+            usd_value,
+            None,  # Domain not available on Ethereum
+            ts
+        )
 
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO asset_balances 
-                    (source, account, name, asset_type, balance, 
-                     usd_price, usd_value, domain, ts, execution_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    'ethereum',
-                    account_data['address'],
-                    account_data.get('name', ''),
-                    asset_type,
-                    balance,
-                    usd_price,
-                    usd_value,
-                    None,  # Domain not available on Ethereum
-                    ts,
-                    self.execution_id
-                ))
-            conn.commit()
-        except Exception as e:
-            print(f"Database error: {str(e)}")
-            conn.rollback()
+    def token_coin_id(self, token: dict) -> str:
+        """CoinGecko id for an ERC20 token, or None if the coin index doesn't know it"""
+        return resolve_coin_id(token.get('symbol'), token.get('token_address'))
 
-    def process_account(self, conn, account: dict):
-        """Process an Ethereum account"""
-        print(f"\n{Colors.CYAN}Processing {account.get('name', '')} ({account['address']}){Colors.RESET}")
+    def process_account(self, writer, account: dict, eth_balance, tokens: list, prices: dict):
+        """Write ETH and ERC20 balances for an Ethereum account"""
+        print(f"\n{Colors.CYAN}{account.get('name', '')} ({account['address']}){Colors.RESET}")
         
         # Process ETH balance
-        eth_balance = self.get_eth_balance(account['address'])
-        eth_price = self.cg.get_price(ids='ethereum', vs_currencies='usd')['ethereum']['usd']
-        print(f"  ETH: {eth_balance:.4f} (${eth_balance * eth_price:.2f})")
-        self.insert_balance(conn, account, 'ETH', eth_balance, eth_price)
+        eth_price = prices.get('ethereum')
+        eth_value = f"${eth_balance * eth_price:.2f}" if eth_price else "N/A"
+        print(f"  ETH: {eth_balance:.4f} ({eth_value})")
+        self.insert_balance(writer, account, 'ETH', eth_balance, eth_price)
         
         # Process ERC20 tokens
-        tokens = self.get_all_tokens(account['address'])
         print(f"  Found {len(tokens)} tokens with balance >0")
         
         for token in tokens:
@@ -86,42 +78,72 @@ class EthereumBalanceIntegration:
             decimals = int(token.get('decimals', 18))
             raw_balance = int(token.get('balance', 0))
             balance = raw_balance / (10 ** decimals)
+            price = prices.get(self.token_coin_id(token))
             
-            # Get USD price
-            try:
-                price = self.cg.get_price(ids=symbol.lower(), vs_currencies='usd').get(symbol.lower(), {}).get('usd')
-            except Exception as e:
-                print(f"⚠️ Price error for {symbol}: {str(e)}")
-                price = None
-            
-            print(f"  {symbol}: {balance:.4f} (${(balance * price):.2f if price else 'N/A'})")
-            self.insert_balance(conn, account, symbol, balance, price)
-            time.sleep(random.uniform(0.3, 0.7))
+            value = f"${balance * price:.2f}" if price else "N/A"
+            print(f"  {symbol}: {balance:.4f} ({value})")
+            self.insert_balance(writer, account, symbol, balance, price)
 
     def run(self):
         """Main execution flow"""
         try:
-            with psycopg2.connect(**self.db_config) as conn:
-                print(f"\n{Colors.GREEN}Starting Ethereum Balance Integration{Colors.RESET}")
+            with instruments.run():
+                with self.db_pool.connection() as conn, \
+                        BalanceWriter(conn, self.execution_id, metrics=instruments) as writer:
+                    print(f"\n{Colors.GREEN}Starting Ethereum Balance Integration{Colors.RESET}")
+                    validate_config('MORALIS_API_KEY')
+                
+                    # Load accounts from config
+                    accounts = BlockchainConfig.get_eth_accounts()
+                    if not accounts:
+                        print(f"{Colors.YELLOW}No Ethereum accounts configured in .env{Colors.RESET}")
+                        return
                 
-                # Load accounts from config
-                accounts = BlockchainConfig.get_eth_accounts()
-                if not accounts:
-                    print(f"{Colors.YELLOW}No Ethereum accounts configured in .env{Colors.RESET}")
-                    return
+                    # Collect balances for every account first so prices resolve in one request
+                    random.shuffle(accounts)
+                    holdings = []
+                    for index, account in enumerate(accounts):
+                        cancellation.checkpoint()
+                        print(f"Fetching {account.get('name', '')} ({account['address']})")
+                        try:
+                            with instruments.stage('fetch'):
+                                holdings.append((
+                                    account,
+                                    self.get_eth_balance(account['address']),
+                                    self.get_all_tokens(account['address'])
+                                ))
+                        except Exception as e:
+                            # Skip this account; the others are still priced and written
+                            instruments.failed()
+                            print(f"❌ Error fetching {account.get('name', '')}: {str(e)}")
+                        if index < len(accounts) - 1:
+                            print(f"{Colors.YELLOW}Waiting for next account...{Colors.RESET}")
+                            cancellation.sleep(random.randint(4, 8))
                 
-                random.shuffle(accounts)
-                for account in accounts:
-                    self.process_account(conn, account)
-                    print(f"{Colors.YELLOW}Waiting for next account...{Colors.RESET}")
-                    time.sleep(random.randint(4, 8))
+                    # Unknown tokens resolve to None and are never sent to CoinGecko
+                    with instruments.stage('price'):
+                        coin_ids = {'ethereum'}
+                        for _, _, tokens in holdings:
+                            coin_ids.update(self.token_coin_id(token) for token in tokens)
+                        prices = get_usd_prices_by_id(coin_ids)
                 
-                print(f"\n{Colors.GREEN}Completed run {self.execution_id}{Colors.RESET}")
+                    for account, eth_balance, tokens in holdings:
+                        try:
+                            self.process_account(writer, account, eth_balance, tokens, prices)
+                        except Exception as e:
+                            instruments.failed()
+                            print(f"❌ Error processing {account.get('name', '')}: {str(e)}")
+                
+                    writer.flush()
+                    print(f"\n{Colors.GREEN}Completed run {self.execution_id} ({writer.written} rows){Colors.RESET}")
 
         except Exception as e:
             print(f"🚨 Critical error: {str(e)}")
 
-if __name__ == "__main__":
+def main():
     monitor = EthereumBalanceIntegration()
     monitor.run()
 
+if __name__ == "__main__":
+    main()
+
@@ -1,5 +1,7 @@
-import requests
-import psycopg2
+import ijson
+import hashlib
+import json
+import time
 from datetime import datetime, timezone
 import sys
 import os
@@ -7,11 +9,16 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DatabaseConfig, EvernodeConfig
+from config import DatabaseConfig, EvernodeConfig, CacheConfig
+from utils import copy_rows, get_session
+from utils import cancellation
+from utils.metrics import Collector
 
 # Load configuration
-DB_CONFIG = DatabaseConfig.get_db_config(DatabaseConfig.EVERNODE_HOST_STATS)
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.EVERNODE_HOST_STATS)
 API_URL = EvernodeConfig.API_URL
+HASH_INDEX_PATH = os.path.join(CacheConfig.DIR, 'evernode_host_hashes.json')
+instruments = Collector('evernode_hosts')
 
 COLUMNS = [
     "key", "addressKey", "address", "cpuModelName", "cpuCount", "cpuMHz", "cpuMicrosec",
@@ -25,43 +32,126 @@ COLUMNS = [
     "scoreValid", "execution_ts"
 ]
 
+# Fields that change on every heartbeat and are stored in evernode_host_heartbeats
+HEARTBEAT_FIELDS = ["lastHeartbeatIndex"]
+HEARTBEAT_COLUMNS = ["address"] + HEARTBEAT_FIELDS + ["execution_ts"]
+HASHED_FIELDS = [col for col in COLUMNS[:-1] if col not in HEARTBEAT_FIELDS]
+
+def iter_hosts():
+    """Stream host entries from the registry, parsing one entry at a time."""
+    with get_session().get(API_URL, timeout=15, stream=True) as resp:
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        for entry in ijson.items(resp.raw, "data.item"):
+            cancellation.checkpoint()  # Aborts the COPY it feeds; the transaction rolls back
+            if "cpuModelName" in entry:
+                yield entry
+
 def fetch_hosts():
     """Fetch all host entries with host fields."""
-    resp = requests.get(API_URL, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
-    return [
-        entry for entry in data.get("data", [])
-        if "cpuModelName" in entry
-    ]
+    return list(iter_hosts())
+
+def host_rows(hosts, execution_ts):
+    """Build one COLUMNS-ordered row per host."""
+    for h in hosts:
+        values = [h.get(col) for col in COLUMNS[:-1]]  # all columns except execution_ts
+        values.append(execution_ts)
+        yield values
 
 def insert_hosts(conn, hosts, execution_ts):
-    """Insert all host records, one row per host per execution."""
-    placeholders = ', '.join(['%s'] * len(COLUMNS))
-    sql = f"""
-        INSERT INTO evernode_hosts ({', '.join(COLUMNS)})
-        VALUES ({placeholders})
+    """COPY all host records, one row per host per execution.
+
+    `hosts` may be any iterable, including the iter_hosts() stream, so
+    entries flow from the HTTP response into COPY without being buffered
+    (so with the stream, the `insert` stage includes the download).
+    """
+    with instruments.stage('insert'), conn.cursor() as cur:
+        count = copy_rows(cur, "evernode_hosts", COLUMNS, host_rows(hosts, execution_ts))
+    with instruments.stage('commit'):
+        conn.commit()
+    instruments.rows_written("evernode_hosts", count)
+    return count
+
+def host_digest(host):
+    """Hash every stored field except the heartbeat ones."""
+    payload = json.dumps([host.get(col) for col in HASHED_FIELDS], default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def load_hash_index():
+    """Load {address: [digest, last_full_write_epoch]} from the local index."""
+    try:
+        with open(HASH_INDEX_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_hash_index(index):
+    """Atomically write the local hash index."""
+    os.makedirs(os.path.dirname(HASH_INDEX_PATH), exist_ok=True)
+    tmp_path = f"{HASH_INDEX_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, HASH_INDEX_PATH)
+
+def insert_host_deltas(conn, hosts, execution_ts, index):
+    """Write full rows only for changed hosts and heartbeat rows for the rest.
+
+    A host gets a full row when its digest differs from the index, when it
+    is not in the index, or when its last full row is older than
+    EVERNODE_FULL_SNAPSHOT_INTERVAL. The index is only updated after the
+    transaction commits, so a failed run never hides a change.
+
+    Returns:
+        tuple: (full_rows, heartbeat_rows)
     """
-    with conn.cursor() as cur:
+    now = time.time()
+    written = {}
+    heartbeats = []
+
+    def changed(hosts):
         for h in hosts:
-            values = [h.get(col) for col in COLUMNS[:-1]]  # all columns except execution_ts
-            values.append(execution_ts)
-            cur.execute(sql, values)
-    conn.commit()
+            address = h.get("address")
+            digest = host_digest(h)
+            known = index.get(address) if address else None
+            if (known and known[0] == digest
+                    and now - known[1] < EvernodeConfig.FULL_SNAPSHOT_INTERVAL):
+                heartbeats.append([address] + [h.get(f) for f in HEARTBEAT_FIELDS] + [execution_ts])
+                continue
+            if address:
+                written[address] = [digest, now]
+            yield h
+
+    with instruments.stage('insert'), conn.cursor() as cur:
+        full_rows = copy_rows(cur, "evernode_hosts", COLUMNS, host_rows(changed(hosts), execution_ts))
+        heartbeat_rows = copy_rows(cur, "evernode_host_heartbeats", HEARTBEAT_COLUMNS, heartbeats)
+    with instruments.stage('commit'):
+        conn.commit()
+    instruments.rows_written("evernode_hosts", full_rows)
+    instruments.rows_written("evernode_host_heartbeats", heartbeat_rows)
+
+    index.update(written)
+    save_hash_index(index)
+    return full_rows, heartbeat_rows
 
 def main():
     try:
-        execution_ts = datetime.now(timezone.utc)
-        hosts = fetch_hosts()
-        if not hosts:
-            print("No host entries found.")
-            return
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            insert_hosts(conn, hosts, execution_ts)
-            print(f"{len(hosts)} host records inserted at {execution_ts.isoformat()} UTC.")
+        with instruments.run():
+            execution_ts = datetime.now(timezone.utc)
+            with db_pool.connection() as conn:
+                if EvernodeConfig.DELTA_SNAPSHOTS:
+                    full_rows, heartbeat_rows = insert_host_deltas(conn, iter_hosts(), execution_ts, load_hash_index())
+                    count = full_rows + heartbeat_rows
+                    if count:
+                        print(f"{full_rows} changed host records and {heartbeat_rows} heartbeats "
+                              f"inserted at {execution_ts.isoformat()} UTC.")
+                else:
+                    count = insert_hosts(conn, iter_hosts(), execution_ts)
+                    if count:
+                        print(f"{count} host records inserted at {execution_ts.isoformat()} UTC.")
+                if not count:
+                    print("No host entries found.")
     except Exception as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
     main()
-
@@ -1,5 +1,8 @@
 import websockets
 import asyncio
+import json
+import random
+import time
 import psycopg2
 from datetime import datetime
 import sys
@@ -10,6 +13,9 @@ import logging
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import DatabaseConfig, ISSConfig, Colors
+from utils.lightstreamer import LightstreamerClient, LightstreamerError
+from utils.db import execute_prepared
+from utils.metrics import Collector, counter, gauge, export, serve
 
 # Configure logging
 logging.basicConfig(
@@ -18,98 +24,228 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.ISS_METRICS)
+instruments = Collector('iss')
+UPDATES = counter('iss_updates_received_total', "Lightstreamer item updates received")
+DROPPED = counter('iss_rows_dropped_total', "Rows dropped because the write queue was full")
+RECONNECTS = counter('iss_reconnects_total', "Lightstreamer sessions lost and reconnected")
+QUEUE_DEPTH = gauge('iss_write_queue_rows', "Rows waiting in the write queue at the last flush")
+
+def update_row(update):
+    """
+    Convert one Lightstreamer item update into a telemetry row.
+
+    Returns:
+        tuple: (timestamp, level, metric_name, raw_data)
+    """
+    value = update.fields.get(ISSConfig.LS_FIELDS[0])
+    try:
+        level = float(value)
+    except (TypeError, ValueError):
+        level = None  # Non-numeric items are kept in raw_data only
+    metric_name = ISSConfig.LS_ITEMS.get(update.item, update.item)
+    return (datetime.now(), level, metric_name, json.dumps(update.fields)[:500])
+
+def enqueue(queue, row, stats):
+    """Queue a row without waiting; when the queue is full the oldest row is dropped"""
+    while True:
+        try:
+            queue.put_nowait(row)
+            return
+        except asyncio.QueueFull:
+            queue.get_nowait()
+            stats['dropped'] += 1
+            DROPPED.inc()
+            if stats['dropped'] % 1000 == 1:
+                logger.warning(f"{Colors.YELLOW}⚠️  Write queue full, dropped {stats['dropped']} rows so far{Colors.RESET}")
+
+async def receive(queue, stats):
+    """
+    Receive telemetry forever, reconnecting with exponential backoff.
+
+    Every configured item is subscribed in one MERGE subscription on one
+    session. Message handling only decodes and enqueues; it never waits on
+    Postgres.
+    """
+    delay = ISSConfig.RECONNECT_MIN
+    while True:
+        client = LightstreamerClient(ISSConfig.LS_URL, ISSConfig.LS_ADAPTER,
+                                     ISSConfig.LS_USER, ISSConfig.LS_PASSWORD)
+        try:
+            logger.info(f"{Colors.YELLOW}Connecting to ISS Lightstreamer: {ISSConfig.LS_URL}{Colors.RESET}")
+            session_id = await client.connect()
+            logger.info(f"{Colors.GREEN}✓ Session {session_id} created{Colors.RESET}")
+            await client.subscribe(list(ISSConfig.LS_ITEMS), ISSConfig.LS_FIELDS,
+                                   data_adapter=ISSConfig.LS_DATA_ADAPTER)
+            logger.info(f"{Colors.CYAN}Subscribed to {len(ISSConfig.LS_ITEMS)} ISS telemetry items{Colors.RESET}")
+
+            async for update in client.updates():
+                delay = ISSConfig.RECONNECT_MIN
+                stats['received'] += 1
+                UPDATES.inc()
+                try:
+                    enqueue(queue, update_row(update), stats)
+                except Exception as e:
+                    logger.error(f"{Colors.RED}Error processing update: {str(e)}{Colors.RESET}")
+
+                # Log progress every 100 updates
+                if stats['received'] % 100 == 0:
+                    logger.info(f"{Colors.CYAN}Processed {stats['received']} updates, "
+                                f"wrote {stats['written']} rows{Colors.RESET}")
+        except LightstreamerError as e:
+            logger.error(f"{Colors.RED}Lightstreamer error: {str(e)}{Colors.RESET}")
+        except asyncio.TimeoutError:
+            logger.warning(f"{Colors.YELLOW}⚠️  No data or keepalive for {client.idle_timeout:g} seconds{Colors.RESET}")
+        except (websockets.exceptions.WebSocketException, OSError) as e:
+            logger.error(f"{Colors.RED}WebSocket error: {str(e)}{Colors.RESET}")
+        finally:
+            try:
+                await client.close()
+            except (websockets.exceptions.WebSocketException, OSError):
+                pass
+
+        RECONNECTS.inc()
+        # Full jitter keeps restarts from hammering the server in lockstep
+        wait = random.uniform(0, delay)
+        logger.info(f"Reconnecting in {wait:.1f}s")
+        await asyncio.sleep(wait)
+        delay = min(delay * 2, ISSConfig.RECONNECT_MAX)
+
+# Errors caused by the values of a row rather than by the connection or the
+# statement; retrying the same batch can never succeed
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+def insert_telemetry(cur, rows):
+    execute_prepared(cur, "insert_telemetry", """
+        INSERT INTO telemetry (timestamp, level, metric_name, raw_data)
+        SELECT * FROM unnest(%s::timestamp[], %s::float8[], %s::text[], %s::text[])
+    """, [list(column) for column in zip(*rows)])
+
+def write_rows(rows):
+    """
+    Insert a batch of telemetry rows in one transaction (runs in a worker thread)
+
+    If a row is rejected by a constraint or column type, the batch is
+    retried one row per savepoint and only the rejected rows are discarded.
+
+    Returns:
+        int: Number of rows written
+    """
+    with db_pool.connection() as conn:
+        try:
+            with instruments.stage('insert'), conn.cursor() as cur:
+                insert_telemetry(cur, rows)
+            written = len(rows)
+        except ROW_ERRORS as e:
+            logger.error(f"{Colors.RED}Database error: {str(e).strip()} (retrying {len(rows)} rows one at a time){Colors.RESET}")
+            conn.rollback()
+            written = 0
+            with instruments.stage('insert'), conn.cursor() as cur:
+                for row in rows:
+                    cur.execute("SAVEPOINT telemetry_row")
+                    try:
+                        insert_telemetry(cur, [row])
+                    except ROW_ERRORS as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT telemetry_row")
+                        logger.error(f"{Colors.RED}Database error: {str(e).strip()} (discarded {row[2]} at {row[0]}){Colors.RESET}")
+                        continue
+                    cur.execute("RELEASE SAVEPOINT telemetry_row")
+                    written += 1
+        with instruments.stage('commit'):
+            conn.commit()
+    instruments.rows_written("telemetry", written)
+    if written < len(rows):
+        instruments.rows_discarded("telemetry", len(rows) - written)
+    return written
+
+async def write_batches(queue, stats):
+    """
+    Drain the queue into Postgres, flushing every BATCH_SIZE rows or FLUSH_INTERVAL seconds.
+
+    A batch that fails to write is kept and retried on a fresh pooled
+    connection, up to ISS_WRITE_RETRIES times before it is discarded;
+    meanwhile the bounded queue keeps absorbing new rows. A
+    write is shielded from cancellation, so on shutdown the batch it is
+    reading is waited for and never flushed a second time.
+    """
+    loop = asyncio.get_running_loop()
+    batch = []
+    in_flight = None  # Executor future writing `batch`
+    failures = 0  # Failed attempts at writing `batch`
+    try:
+        while True:
+            deadline = time.monotonic() + ISSConfig.FLUSH_INTERVAL
+            while len(batch) < ISSConfig.BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            if not batch:
+                continue
+            QUEUE_DEPTH.set(queue.qsize())
+            in_flight = loop.run_in_executor(None, write_rows, batch)
+            try:
+                stats['written'] += await asyncio.shield(in_flight)
+                batch = []
+                failures = 0
+                export()
+            except psycopg2.Error as e:
+                failures += 1
+                if failures > ISSConfig.WRITE_RETRIES:
+                    instruments.rows_discarded("telemetry", len(batch))
+                    logger.error(f"{Colors.RED}Database error: {str(e)} ({len(batch)} rows discarded "
+                                 f"after {failures} attempts){Colors.RESET}")
+                    batch = []
+                    failures = 0
+                    export()
+                    continue
+                logger.error(f"{Colors.RED}Database error: {str(e)} ({len(batch)} rows pending){Colors.RESET}")
+                await asyncio.sleep(ISSConfig.RECONNECT_MIN)
+            finally:
+                if in_flight.done():
+                    in_flight = None
+    finally:
+        # A write interrupted by cancellation is still running in its thread
+        if in_flight is not None:
+            try:
+                stats['written'] += await in_flight
+                batch = []
+            except psycopg2.Error as e:
+                logger.error(f"{Colors.RED}Database error: {str(e)} ({len(batch)} rows pending){Colors.RESET}")
+        # Best-effort final flush on shutdown, into a list no thread holds
+        remaining = list(batch)
+        while not queue.empty():
+            remaining.append(queue.get_nowait())
+        if remaining:
+            try:
+                stats['written'] += write_rows(remaining)
+            except psycopg2.Error as e:
+                instruments.rows_discarded("telemetry", len(remaining))
+                logger.error(f"{Colors.RED}Database error: {str(e)} ({len(remaining)} rows lost){Colors.RESET}")
+
 async def connect_to_iss():
     """
     Connect to ISS Lightstreamer feed and collect telemetry data.
-    
+
     This is an experimental feature for collecting real-time data from the
     International Space Station via NASA's public Lightstreamer API.
+    The receiver and the database writer run as separate tasks joined by a
+    bounded queue.
     """
-    db_config = DatabaseConfig.get_db_config(DatabaseConfig.ISS_METRICS)
-    conn = None
-    
+    queue = asyncio.Queue(maxsize=ISSConfig.QUEUE_SIZE)
+    stats = {'received': 0, 'written': 0, 'dropped': 0}
+    writer = asyncio.ensure_future(write_batches(queue, stats))
     try:
-        # Connect to database
-        conn = psycopg2.connect(**db_config)
-        logger.info(f"{Colors.GREEN}Connected to ISS metrics database{Colors.RESET}")
-        
-        # Connect to ISS Lightstreamer WebSocket
-        logger.info(f"{Colors.YELLOW}Connecting to ISS Lightstreamer: {ISSConfig.LS_URL}{Colors.RESET}")
-        
-        async with websockets.connect(ISSConfig.LS_URL) as ws:
-            # Send authentication
-            auth_msg = f"LS_user={ISSConfig.LS_USER}&LS_password={ISSConfig.LS_PASSWORD}&LS_adapter_set={ISSConfig.LS_ADAPTER}"
-            await ws.send(auth_msg)
-            logger.info(f"{Colors.GREEN}✓ Authenticated with Lightstreamer{Colors.RESET}")
-            
-            # Subscribe to telemetry stream
-            # Note: The actual subscription message may need adjustment based on NASA's API
-            subscribe_msg = "LS_mode=MERGE&LS_items=URINE_TANK_LEVEL&LS_fields=Value TimeStamp"
-            await ws.send(subscribe_msg)
-            logger.info(f"{Colors.CYAN}Subscribed to ISS telemetry stream{Colors.RESET}")
-            
-            message_count = 0
-            
-            # Receive and process messages
-            while True:
-                try:
-                    response = await asyncio.wait_for(ws.recv(), timeout=30.0)
-                    message_count += 1
-                    
-                    # Parse the response
-                    # Format may vary - this is a simple parser
-                    if "URINE_TANK_LEVEL" in response or "|" in response:
-                        parts = response.split("|")
-                        
-                        # Try to extract numeric value
-                        for part in parts:
-                            try:
-                                tank_level = float(part)
-                                timestamp = datetime.now()
-                                
-                                # Insert into database
-                                with conn.cursor() as cur:
-                                    cur.execute("""
-                                        INSERT INTO telemetry (timestamp, level, metric_name, raw_data)
-                                        VALUES (%s, %s, %s, %s)
-                                    """, (timestamp, tank_level, 'URINE_TANK_LEVEL', response[:500]))
-                                    conn.commit()
-                                
-                                logger.info(f"{Colors.GREEN}✓ Recorded: Tank Level = {tank_level}% at {timestamp}{Colors.RESET}")
-                                break
-                            except ValueError:
-                                continue
-                    
-                    # Log progress every 10 messages
-                    if message_count % 10 == 0:
-                        logger.info(f"{Colors.CYAN}Processed {message_count} messages{Colors.RESET}")
-                
-                except asyncio.TimeoutError:
-                    logger.warning(f"{Colors.YELLOW}⚠️  No data received for 30 seconds, checking connection...{Colors.RESET}")
-                    # Send ping to keep connection alive
-                    await ws.ping()
-                
-                except Exception as e:
-                    logger.error(f"{Colors.RED}Error processing message: {str(e)}{Colors.RESET}")
-                    continue
-    
-    except websockets.exceptions.WebSocketException as e:
-        logger.error(f"{Colors.RED}WebSocket error: {str(e)}{Colors.RESET}")
-        logger.info("Note: This is an experimental feature. The ISS Lightstreamer API may require specific authentication or have changed.")
-    
-    except psycopg2.Error as e:
-        logger.error(f"{Colors.RED}Database error: {str(e)}{Colors.RESET}")
-    
-    except KeyboardInterrupt:
-        logger.info(f"\n{Colors.YELLOW}Shutting down ISS collector...{Colors.RESET}")
-    
-    except Exception as e:
-        logger.error(f"{Colors.RED}Unexpected error: {str(e)}{Colors.RESET}")
-    
+        await receive(queue, stats)
     finally:
-        if conn:
-            conn.close()
-            logger.info(f"{Colors.GREEN}Database connection closed{Colors.RESET}")
+        writer.cancel()
+        try:
+            await writer
+        except asyncio.CancelledError:
+            pass
 
 def main():
     """Main entry point"""
@@ -120,7 +256,8 @@ def main():
     logger.warning(f"{Colors.YELLOW}⚠️  This is an experimental feature.{Colors.RESET}")
     logger.warning(f"{Colors.YELLOW}The ISS Lightstreamer API may require updates or specific credentials.{Colors.RESET}")
     logger.info("")
-    
+
+    serve()
     try:
         asyncio.run(connect_to_iss())
     except KeyboardInterrupt:
@@ -128,4 +265,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,353 @@
+"""
+Partition maintenance for the time-series tables.
+
+Converts heap tables to native range partitions on their time column,
+keeps future partitions created ahead of time, and drops or archives
+partitions that fall outside each table's retention policy
+(config.PartitionConfig.POLICIES). Each partitioned table also has a
+`<table>_default` partition, so inserts keep working if this job falls
+more than PARTITION_PREMAKE periods behind; its rows are moved into their
+range partition when that partition is created.
+
+Usage:
+    python scripts/manage_partitions.py --convert     # one-time conversion (locks each table)
+    python scripts/manage_partitions.py               # daily: pre-create + expire
+    python scripts/manage_partitions.py --dry-run asset_balances
+"""
+import argparse
+import re
+import psycopg2
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DatabaseConfig, PartitionConfig, Colors
+from utils.metrics import Collector
+from utils import cancellation
+
+instruments = Collector('partitions')
+
+PARTITION_NAME = re.compile(r'^(?P<table>.+)_p(?P<start>\d{8})$')
+
+DEPENDENT_VIEWS_SQL = """
+WITH RECURSIVE deps(oid, depth) AS (
+    SELECT DISTINCT r.ev_class, 1
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE d.refobjid = %(table)s::regclass AND r.ev_class <> %(table)s::regclass
+    UNION
+    SELECT DISTINCT r.ev_class, deps.depth + 1
+    FROM deps
+    JOIN pg_depend d ON d.refobjid = deps.oid
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE r.ev_class <> deps.oid
+)
+SELECT c.relname, c.relkind, pg_get_viewdef(c.oid, true), obj_description(c.oid, 'pg_class')
+FROM deps
+JOIN pg_class c ON c.oid = deps.oid
+WHERE c.relkind IN ('v', 'm')
+GROUP BY c.oid, c.relname, c.relkind
+ORDER BY MAX(deps.depth)
+"""
+
+
+def period_start(ts, interval):
+    """Start of the partition period containing ts"""
+    ts = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'day':
+        return ts
+    if interval == 'week':
+        return ts - timedelta(days=ts.weekday())
+    if interval == 'month':
+        return ts.replace(day=1)
+    raise ValueError(f"Unsupported partition interval: {interval}")
+
+
+def next_period(start, interval):
+    """Start of the period following `start`"""
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if interval == 'week':
+        return start + timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def relkind(cur, table):
+    """'r' for a heap table, 'p' for a partitioned table, None if missing"""
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = %s AND n.nspname = current_schema()
+    """, (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def existing_partitions(cur, table):
+    """Names of partitions currently attached to table"""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (table,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def create_partitions(cur, table, column, interval, first, last):
+    """Create any missing partitions covering periods from `first` through `last`"""
+    existing = existing_partitions(cur, table)
+    default = default_partition_name(table)
+    created = 0
+    start = period_start(first, interval)
+    while start <= last:
+        end = next_period(start, interval)
+        name = partition_name(table, start)
+        if name in existing:
+            pass
+        elif default in existing:
+            attach_from_default(cur, table, column, name, start, end)
+            created += 1
+        else:
+            cur.execute(
+                f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+                (start, end)
+            )
+            print(f"  + {name} [{start:%Y-%m-%d}, {end:%Y-%m-%d})")
+            created += 1
+        start = end
+    return created
+
+
+def attach_from_default(cur, table, column, name, start, end):
+    """
+    Create a range partition on a table that has a default partition
+
+    Postgres refuses a new range while the default partition holds rows in
+    it, so the partition is built standalone, any such rows are moved into
+    it from the default, and it is then attached.
+    """
+    default = default_partition_name(table)
+    cur.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cur.execute(f'''
+        WITH moved AS (
+            DELETE FROM "{default}" WHERE "{column}" >= %s AND "{column}" < %s RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+    ''', (start, end))
+    moved = cur.rowcount
+    cur.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+                (start, end))
+    note = f", {moved} rows moved from {default}" if moved else ""
+    print(f"  + {name} [{start:%Y-%m-%d}, {end:%Y-%m-%d}){note}")
+
+
+def ensure_default_partition(cur, table, column):
+    """Create the table's default partition if missing and report rows that landed in it"""
+    name = default_partition_name(table)
+    if name not in existing_partitions(cur, table):
+        cur.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" DEFAULT')
+        print(f"  + {name} (default)")
+        return
+    cur.execute(f'SELECT COUNT(*), MIN("{column}"), MAX("{column}") FROM "{name}"')
+    count, oldest, newest = cur.fetchone()
+    if count:
+        print(f"  {Colors.YELLOW}{count} rows in {name} ({oldest} to {newest}) "
+              f"outside every range partition{Colors.RESET}")
+
+
+def horizon(now, interval):
+    """Last period start that should already exist"""
+    last = period_start(now, interval)
+    for _ in range(PartitionConfig.PREMAKE):
+        last = next_period(last, interval)
+    return last
+
+
+def convert_table(cur, table, policy, now):
+    """Rebuild a heap table as a range-partitioned table, preserving views, indexes and sequences"""
+    column = policy['column']
+    interval = policy['interval']
+    staging = f"{table}__partitioned"
+
+    cur.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE')
+
+    cur.execute(DEPENDENT_VIEWS_SQL, {'table': table})
+    views = cur.fetchall()
+    cur.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+    """, (table,))
+    indexes = cur.fetchall()
+    cur.execute("""
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'f', 'u')
+    """, (table,))
+    constraints = cur.fetchall()
+    cur.execute("""
+        SELECT a.attname, pg_get_serial_sequence(%s, a.attname)
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+    """, (table, table))
+    sequences = [(col, seq) for col, seq in cur.fetchall() if seq]
+    cur.execute("SELECT obj_description(%s::regclass, 'pg_class')", (table,))
+    table_comment = cur.fetchone()[0]
+
+    constraint_indexes = {name for name, _, _ in constraints}
+    cur.execute(
+        f'CREATE TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE ("{column}")'
+    )
+
+    cur.execute(f'SELECT MIN("{column}") FROM "{table}"')
+    oldest = cur.fetchone()[0] or now
+    create_partitions(cur, staging, column, interval, oldest, horizon(now, interval))
+
+    cur.execute(f'INSERT INTO "{staging}" SELECT * FROM "{table}"')
+    print(f"  copied {cur.rowcount} rows")
+
+    for _, seq in sequences:
+        cur.execute(f"ALTER SEQUENCE {seq} OWNED BY NONE")
+    cur.execute(f'DROP TABLE "{table}" CASCADE')
+    cur.execute(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+    for name in existing_partitions(cur, table):
+        start = datetime.strptime(PARTITION_NAME.match(name).group('start'), '%Y%m%d')
+        cur.execute(f'ALTER TABLE "{name}" RENAME TO "{partition_name(table, start)}"')
+    for col, seq in sequences:
+        cur.execute(f'ALTER SEQUENCE {seq} OWNED BY "{table}"."{col}"')
+    ensure_default_partition(cur, table, column)
+
+    # Unique constraints on a partitioned table must include the partition key
+    for name, contype, definition in constraints:
+        if contype in ('p', 'u'):
+            cols = re.search(r'\((.*)\)', definition).group(1)
+            if column not in [c.strip().strip('"') for c in cols.split(',')]:
+                cols = f'{cols}, "{column}"'
+            kind = 'PRIMARY KEY' if contype == 'p' else 'UNIQUE'
+            cur.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {kind} ({cols})')
+        else:
+            cur.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+    for name, definition in indexes:
+        if name in constraint_indexes:
+            continue
+        cur.execute(definition)
+
+    if table_comment:
+        cur.execute(f'COMMENT ON TABLE "{table}" IS %s', (table_comment,))
+
+    for name, kind, definition, comment in views:
+        materialized = 'MATERIALIZED ' if kind == 'm' else ''
+        cur.execute(f'CREATE {materialized}VIEW "{name}" AS {definition}')
+        if comment:
+            cur.execute(f'COMMENT ON {materialized}VIEW "{name}" IS %s', (comment,))
+    if views:
+        print(f"  recreated {len(views)} dependent views")
+
+
+def expire_partitions(cur, table, policy, now):
+    """Drop or archive partitions that end before the retention cutoff"""
+    if not policy['retention_days']:
+        return 0
+    cutoff = now - timedelta(days=policy['retention_days'])
+    expired = 0
+    for name in sorted(existing_partitions(cur, table)):
+        match = PARTITION_NAME.match(name)
+        if not match:
+            continue
+        start = datetime.strptime(match.group('start'), '%Y%m%d')
+        if next_period(start, policy['interval']) > cutoff:
+            continue
+        if policy['expire'] == 'archive':
+            cur.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{PartitionConfig.ARCHIVE_SCHEMA}"')
+            cur.execute(f'ALTER TABLE "{name}" SET SCHEMA "{PartitionConfig.ARCHIVE_SCHEMA}"')
+            print(f"  → archived {name} to {PartitionConfig.ARCHIVE_SCHEMA}")
+        else:
+            cur.execute(f'DROP TABLE "{name}"')
+            print(f"  - dropped {name}")
+        expired += 1
+    return expired
+
+
+def maintain_table(conn, table, policy, convert=False, dry_run=False):
+    """Run conversion (optional), pre-creation and expiry for one table in one transaction"""
+    print(f"{Colors.CYAN}{table}{Colors.RESET} ({policy['database']})")
+    try:
+        with instruments.stage('maintain'), conn.cursor() as cur:
+            cur.execute("SELECT LOCALTIMESTAMP")
+            now = cur.fetchone()[0]
+            kind = relkind(cur, table)
+            if kind is None:
+                print(f"  {Colors.YELLOW}table not found, skipping{Colors.RESET}")
+                return
+            if kind == 'r':
+                if not convert:
+                    print(f"  {Colors.YELLOW}not partitioned (run with --convert){Colors.RESET}")
+                    return
+                convert_table(cur, table, policy, now)
+            else:
+                create_partitions(cur, table, policy['column'], policy['interval'],
+                                  now, horizon(now, policy['interval']))
+                ensure_default_partition(cur, table, policy['column'])
+            expire_partitions(cur, table, policy, now)
+        if dry_run:
+            conn.rollback()
+            print(f"  {Colors.YELLOW}dry run, rolled back{Colors.RESET}")
+        else:
+            with instruments.stage('commit'):
+                conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        instruments.failed()
+        print(f"  {Colors.RED}Database error: {str(e)}{Colors.RESET}")
+
+
+def run(tables=None, convert=False, dry_run=False):
+    """Maintain the given tables (default: every table with a policy), grouped by database"""
+    by_database = {}
+    for table in tables or PartitionConfig.POLICIES:
+        by_database.setdefault(PartitionConfig.POLICIES[table]['database'], []).append(table)
+
+    with instruments.run():
+        for dbname, db_tables in by_database.items():
+            try:
+                with DatabaseConfig.connection(dbname) as conn:
+                    for table in db_tables:
+                        cancellation.checkpoint()
+                        maintain_table(conn, table, PartitionConfig.POLICIES[table], convert, dry_run)
+            except psycopg2.Error as e:
+                # Table-level errors are handled in maintain_table; this is connecting
+                instruments.failed()
+                print(f"Failed to connect to database {dbname}: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition and retention maintenance for time-series tables")
+    parser.add_argument('tables', nargs='*', help="tables to maintain (default: every table with a policy)")
+    parser.add_argument('--convert', action='store_true',
+                        help="convert unpartitioned tables (takes an exclusive lock while copying)")
+    parser.add_argument('--dry-run', action='store_true', help="run everything, then roll back")
+    args = parser.parse_args()
+
+    unknown = [t for t in args.tables if t not in PartitionConfig.POLICIES]
+    if unknown:
+        parser.error(f"no partition policy for: {', '.join(unknown)}")
+
+    run(args.tables, args.convert, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
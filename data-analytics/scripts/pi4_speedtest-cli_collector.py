@@ -1,95 +1,142 @@
-import psycopg2
+import json
+import time
+import requests
 import speedtest
-from psycopg2.extras import execute_values
-from datetime import datetime
 import sys
 import os
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DatabaseConfig
+from config import DatabaseConfig, RaspberryPiConfig, CacheConfig
+from utils.series import SeriesRegistry, ensure_series_schema, insert_samples
+from utils.stats import LatencyHistogram
+from utils.http import get_session
+from utils.metrics import Collector
 
 # Load configuration
-DB_CONFIG = DatabaseConfig.get_db_config(DatabaseConfig.ENVIRONMENT_METRICS)
-
-print(f"Connecting to database: {DB_CONFIG['dbname']}")
-
-# SQL to create the table if it doesn't exist
-create_table_sql = """
-CREATE TABLE IF NOT EXISTS pi4_environment_metrics (
-    id SERIAL PRIMARY KEY,
-    metric VARCHAR(255) NOT NULL,
-    labels TEXT,
-    value DOUBLE PRECISION NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-"""
-
-# SQL for bulk insert
-insert_sql = """
-INSERT INTO pi4_environment_metrics (metric, labels, value)
-VALUES %s
-"""
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.ENVIRONMENT_METRICS)
+instruments = Collector('speedtest')
 
-def run_speedtest():
-    """Run speedtest and return download/upload speeds in Mbps"""
+SAMPLES_TABLE = "pi4_environment_samples"
+SERVER_CACHE_PATH = os.path.join(CacheConfig.DIR, "speedtest_servers.json")
+
+# speedtest-cli scores an unreachable server as ~1.8M ms instead of failing
+UNREACHABLE_PING_MS = 60000
+
+def load_server_cache():
+    """Load {closest, closest_at, best, best_at} from the local cache."""
     try:
-        st = speedtest.Speedtest()
-        st.get_best_server()
-        
-        # Run tests
-        download = st.download() / 1_000_000  # Convert to Mbps
-        upload = st.upload() / 1_000_000
-        
-        return download, upload
-    except Exception as e:
-        print(f"Speedtest failed: {str(e)}")
-        return None, None
+        with open(SERVER_CACHE_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-# Prepare data for insertion
-metrics_list = []
+def save_server_cache(cache):
+    """Atomically write the server cache."""
+    os.makedirs(os.path.dirname(SERVER_CACHE_PATH), exist_ok=True)
+    tmp_path = f"{SERVER_CACHE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, SERVER_CACHE_PATH)
 
-# Run speedtest and get results
-download_speed, upload_speed = run_speedtest()
+def is_fresh(cache, key, ttl):
+    return bool(cache.get(key)) and time.time() - cache.get(f"{key}_at", 0) < ttl
 
-if download_speed is not None:
-    metrics_list.append((
-        "internet_download_speed_mbps", 
-        None,  # No labels
-        download_speed
-    ))
+def select_server(st, cache):
+    """
+    Pick the test server, reusing the cached choice while it is fresh
 
-if upload_speed is not None:
-    metrics_list.append((
-        "internet_upload_speed_mbps",
-        None,  # No labels
-        upload_speed
-    ))
+    Falls back from the cached best server, to re-probing the cached
+    closest servers, to downloading the full server list.
+    """
+    now = time.time()
+    if is_fresh(cache, "best", RaspberryPiConfig.SPEEDTEST_SERVER_TTL):
+        server = st.get_best_server([cache["best"]])
+        if st.results.ping < UNREACHABLE_PING_MS:
+            return server
+        print(f"Cached server {cache['best'].get('id')} unreachable, reselecting")
+
+    if not is_fresh(cache, "closest", RaspberryPiConfig.SPEEDTEST_SERVER_LIST_TTL):
+        st.get_servers()
+        cache["closest"] = st.get_closest_servers()
+        cache["closest_at"] = now
+
+    server = st.get_best_server(cache["closest"])
+    cache["best"] = server
+    cache["best_at"] = now
+    save_server_cache(cache)
+    return server
+
+def measure_latency(server, probes):
+    """Time `probes` requests to the server's latency.txt; returns a histogram"""
+    histogram = LatencyHistogram()
+    url = f"{os.path.dirname(server['url'])}/latency.txt"
+    session = get_session()
+    for i in range(probes):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params={"x": f"{int(time.time() * 1000)}.{i}"}, timeout=5)
+            ok = response.status_code == 200 and response.content.startswith(b"test=test")
+        except requests.RequestException:
+            ok = False
+        histogram.record((time.perf_counter() - start) * 1000 if ok else None)
+    return histogram
+
+def run_speedtest():
+    """Run speedtest and return (metric, labels, value) rows, or [] on failure"""
+    try:
+        with instruments.stage('fetch'):
+            st = speedtest.Speedtest()
+            server = select_server(st, load_server_cache())
+            ping = st.results.ping
+            latency = measure_latency(server, RaspberryPiConfig.SPEEDTEST_LATENCY_PROBES)
+
+            # Run tests
+            threads = RaspberryPiConfig.SPEEDTEST_THREADS
+            download = st.download(threads=threads) / 1_000_000  # Convert to Mbps
+            upload = st.upload(threads=threads) / 1_000_000
+    except Exception as e:
+        instruments.failed()
+        print(f"Speedtest failed: {str(e)}")
+        return []
+
+    print(f"Server {server.get('id')} ({server.get('sponsor')}, {server.get('name')}): "
+          f"{download:.2f} down / {upload:.2f} up Mbps, ping {ping:.1f}ms")
+    rows = [
+        ("internet_download_speed_mbps", None, download),
+        ("internet_upload_speed_mbps", None, upload),
+        ("internet_ping_ms", None, ping),
+        ("internet_download_bytes", None, st.results.bytes_received),
+        ("internet_upload_bytes", None, st.results.bytes_sent),
+        ("internet_speedtest_server_id", None, float(server["id"])),
+    ]
+    if latency.jitter is not None:
+        rows.append(("internet_jitter_ms", None, latency.jitter))
+    return rows
 
 # Insert metrics into PostgreSQL
-def insert_metrics_to_db(db_config, data):
-    conn = None
+def insert_metrics_to_db(data):
+    with db_pool.connection() as conn:
+        with instruments.stage('insert'), conn.cursor() as cur:
+            ensure_series_schema(cur, SAMPLES_TABLE)
+            insert_samples(cur, SeriesRegistry(), SAMPLES_TABLE, data)
+        with instruments.stage('commit'):
+            conn.commit()
+    instruments.rows_written(SAMPLES_TABLE, len(data))
+    print(f"Inserted {len(data)} metrics successfully")
+
+def main():
+    print(f"Connecting to database: {db_pool.db_config['dbname']}")
     try:
-        conn = psycopg2.connect(**db_config)
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(create_table_sql)
-                execute_values(
-                    cur,
-                    insert_sql,
-                    data,
-                    template="(%s, %s, %s)"
-                )
-        print(f"Inserted {len(data)} metrics successfully")
+        with instruments.run():
+            metrics_list = run_speedtest()
+            if metrics_list:
+                insert_metrics_to_db(metrics_list)
+            else:
+                print("No speedtest results to insert")
     except Exception as e:
         print(f"Database error: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
-
-if metrics_list:
-    insert_metrics_to_db(DB_CONFIG, metrics_list)
-else:
-    print("No speedtest results to insert")
 
+if __name__ == "__main__":
+    main()
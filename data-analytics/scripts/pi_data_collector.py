@@ -1,7 +1,8 @@
-import re
+import math
+import time
+import argparse
 import requests
 import psycopg2
-from psycopg2.extras import execute_values
 import sys
 import os
 
@@ -9,89 +10,108 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import DatabaseConfig, RaspberryPiConfig
+from utils.prometheus import PrometheusParser
+from utils.series import SeriesRegistry, ensure_series_schema, insert_samples
+from utils.http import get_session
+from utils.metrics import Collector, serve
 
 # Load configuration
-DB_CONFIG = DatabaseConfig.get_db_config(DatabaseConfig.ENVIRONMENT_METRICS)
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.ENVIRONMENT_METRICS)
 
-print(f"Connecting to database: {DB_CONFIG['dbname']}")
+SAMPLES_TABLE = "pi_environment_samples"
 
-# SQL to create the table if it doesn't exist
-create_table_sql = """
-CREATE TABLE IF NOT EXISTS pi_environment_metrics (
-    id SERIAL PRIMARY KEY,
-    metric VARCHAR(255) NOT NULL,
-    labels TEXT,
-    value DOUBLE PRECISION NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-"""
+# Parser instance is kept for the life of the process so series interned
+# on the first scrape are reused by every later scrape in daemon mode
+metrics_parser = PrometheusParser()
+series_registry = SeriesRegistry()
+instruments = Collector('pi_metrics')
 
-# SQL for bulk insert
-insert_sql = """
-INSERT INTO pi_environment_metrics (metric, labels, value)
-VALUES %s
-"""
+def fetch_metrics(session):
+    """Fetch the metrics page from the endpoint as a stream of lines"""
+    response = session.get(RaspberryPiConfig.METRICS_URL, timeout=10, stream=True)
+    response.raise_for_status()
+    response.encoding = response.encoding or 'utf-8'
+    return response.iter_lines(decode_unicode=True)
 
-# Regular expression to parse Prometheus metrics
-pattern = re.compile(
-    r'^(?P<name>[a-zA-Z0-9_:]+)'
-    r'(?:{(?P<labels>[^}]+)})?\s+'
-    r'(?P<value>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)',
-    re.MULTILINE
-)
+def parse_metrics(lines):
+    """Parse Prometheus metrics into (metric, labels, value) rows"""
+    metrics = {}
+    for sample in metrics_parser.parse(lines):
+        # NaN/Inf samples would poison the AVG/MIN/MAX views
+        if math.isfinite(sample.value):
+            metrics[(sample.name, sample.labels)] = sample.value
+    return [(metric, labels, value) for (metric, labels), value in metrics.items()]
 
-# Fetch metrics from the endpoint
-response = requests.get(RaspberryPiConfig.METRICS_URL)
-data = response.text
+def insert_metrics_to_db(conn, data, ensure_table=True):
+    """Insert metrics in one transaction, creating the tables first if requested"""
+    try:
+        with instruments.stage('insert'), conn.cursor() as cur:
+            if ensure_table:
+                ensure_series_schema(cur, SAMPLES_TABLE)
+            insert_samples(cur, series_registry, SAMPLES_TABLE, data)
+        with instruments.stage('commit'):
+            conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        # Series ids created in the rolled-back transaction don't exist
+        series_registry.clear()
+        raise
+    instruments.rows_written(SAMPLES_TABLE, len(data))
 
-# Parse metrics into a dictionary
-metrics = {}
-for match in pattern.finditer(data):
-    groups = match.groupdict()
-    name = groups['name']
-    labels = groups['labels']
-    value = float(groups['value'])
+def scrape_once(session, conn, ensure_table=True):
+    """Fetch, parse and store one scrape; returns the number of metrics inserted"""
+    with instruments.stage('fetch'):  # Parsing consumes the response stream
+        metrics_list = parse_metrics(fetch_metrics(session))
+    insert_metrics_to_db(conn, metrics_list, ensure_table)
+    return len(metrics_list)
 
-    if labels:
-        # Parse labels into tuple of key-value pairs
-        label_pairs = []
-        for label in labels.split(','):
-            k, v = label.split('=')
-            label_pairs.append((k.strip(), v.strip().strip('"')))
-        labels_tuple = tuple(label_pairs)
-    else:
-        labels_tuple = None
+def run_once():
+    """Single scrape using the shared session and connection pool (cron and scheduler mode)"""
+    try:
+        with instruments.run(), db_pool.connection() as conn:
+            count = scrape_once(get_session(), conn)
+        print(f"Inserted {count} metrics successfully")
+    except requests.RequestException as e:
+        print(f"Metrics fetch error: {str(e)}")
+    except Exception as e:
+        print(f"Database error: {str(e)}")
 
-    metrics[(name, labels_tuple)] = value
+def run_daemon(interval):
+    """Scrape every `interval` seconds, reusing the shared HTTP session and pooled connection"""
+    session = get_session()
+    table_ready = False
+    print(f"Scraping {RaspberryPiConfig.METRICS_URL} every {interval:g}s")
+    while True:
+        started = time.monotonic()
+        try:
+            # A broken connection is discarded by the pool; the next scrape reconnects
+            with instruments.run(), db_pool.connection() as conn:
+                count = scrape_once(session, conn, ensure_table=not table_ready)
+            table_ready = True
+            print(f"Inserted {count} metrics successfully")
+        except requests.RequestException as e:
+            print(f"Metrics fetch error: {str(e)}")
+        except psycopg2.Error as e:
+            print(f"Database error: {str(e)}")
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
 
-# Prepare data for insertion
-metrics_list = []
-for (metric, labels), value in metrics.items():
-    if labels is None:
-        labels_str = None
-    else:
-        labels_str = ','.join(f'{k}="{v}"' for k, v in labels)
-    metrics_list.append((metric, labels_str, value))
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Prometheus metrics from the Pi into PostgreSQL")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and scrape on an interval instead of once")
+    parser.add_argument('--interval', type=float, default=RaspberryPiConfig.SCRAPE_INTERVAL,
+                        help="seconds between scrapes in daemon mode (default: PI_SCRAPE_INTERVAL)")
+    args = parser.parse_args()
 
-# Insert metrics into PostgreSQL
-def insert_metrics_to_db(db_config, data):
-    conn = None
+    print(f"Connecting to database: {db_pool.db_config['dbname']}")
     try:
-        conn = psycopg2.connect(**db_config)
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(create_table_sql)
-                execute_values(
-                    cur,
-                    insert_sql,
-                    data,
-                    template="(%s, %s, %s)"
-                )
-        print(f"Inserted {len(data)} metrics successfully")
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+        if args.daemon:
+            serve()
+            run_daemon(args.interval)
+        else:
+            run_once()
+    except KeyboardInterrupt:
+        print("Stopped")
 
-insert_metrics_to_db(DB_CONFIG, metrics_list)
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import time
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 from ping3 import ping
 from datetime import datetime
@@ -8,51 +12,150 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import DatabaseConfig, RaspberryPiConfig
+from utils.series import SeriesRegistry, insert_samples
+from utils.stats import LatencyHistogram
+from utils.metrics import Collector, serve
+from utils import cancellation
 
 # Load configuration
-DB_CONFIG = DatabaseConfig.get_db_config(DatabaseConfig.ENVIRONMENT_METRICS)
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.ENVIRONMENT_METRICS)
 
-def insert_ping_metric(host, response_time):
-    """Insert ping results into the database"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        with conn:
-            with conn.cursor() as cur:
-                # Use parameterized query to prevent SQL injection
-                cur.execute("""
-                    INSERT INTO pi_environment_metrics 
-                    (metric, labels, value, timestamp)
-                    VALUES (%s, %s, %s, %s)
-                """, (
-                    'ping_response_time',
-                    f'host="{host}"',
-                    response_time if response_time is not None else -1,
-                    datetime.now()
-                ))
-        print(f"Inserted ping result for {host}")
-    except Exception as e:
-        print(f"Database error: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
+SAMPLES_TABLE = "pi_environment_samples"
+
+# Window statistic -> metric name; ping_response_time keeps the p50 (or -1
+# when every probe was lost) so existing views and dashboards keep working
+WINDOW_METRICS = (
+    ("min", "ping_rtt_min_ms"),
+    ("p50", "ping_rtt_p50_ms"),
+    ("p95", "ping_rtt_p95_ms"),
+    ("p99", "ping_rtt_p99_ms"),
+    ("max", "ping_rtt_max_ms"),
+    ("jitter", "ping_jitter_ms"),
+    ("loss", "ping_loss_percent"),
+    ("sent", "ping_probes_sent"),
+)
+
+series_registry = SeriesRegistry()
+instruments = Collector('pi_latency')
 
 def ping_host(host):
-    """Ping a host and return response time in milliseconds"""
+    """Ping a host and return response time in milliseconds (None if lost)"""
     try:
-        response = ping(host, timeout=2, unit='ms')
-        return response
+        response = ping(host, timeout=RaspberryPiConfig.PING_TIMEOUT, unit='ms')
     except Exception as e:
-        print(f"Ping error: {e}")
+        print(f"Ping error ({host}): {e}")
         return None
+    # ping3 returns None on timeout and False when the host can't be resolved
+    return response if response else None
 
-if __name__ == "__main__":
-    target_host = RaspberryPiConfig.PING_TARGET
-    response_time = ping_host(target_host)
-    
-    if response_time is not None:
-        print(f"Ping to {target_host} succeeded: {response_time:.2f}ms")
-    else:
-        print(f"Ping to {target_host} failed")
-    
-    insert_ping_metric(target_host, response_time)
+async def probe_target(host, probes, spacing):
+    """Send `probes` pings to one host, `spacing` seconds apart, into a histogram"""
+    loop = asyncio.get_running_loop()
+    histogram = LatencyHistogram()
+    pending = []
+    for i in range(probes):
+        if i:
+            await asyncio.sleep(spacing)
+        pending.append(loop.run_in_executor(None, ping_host, host))
+    for result in await asyncio.gather(*pending):
+        histogram.record(result)
+    return histogram
+
+async def probe_window(targets, probes, window):
+    """Probe every target concurrently over one window; returns {host: histogram}"""
+    spacing = window / probes
+    results = await asyncio.gather(*(probe_target(host, probes, spacing) for host in targets))
+    return dict(zip(targets, results))
+
+def window_samples(histograms):
+    """Flatten per-target histograms into (metric, labels, value) rows"""
+    samples = []
+    for host, histogram in histograms.items():
+        labels = (('host', host),)
+        stats = histogram.summary()
+        samples.append(('ping_response_time', labels, stats['p50'] if stats['p50'] is not None else -1))
+        for stat, metric in WINDOW_METRICS:
+            if stats[stat] is not None:
+                samples.append((metric, labels, stats[stat]))
+    return samples
+
+def insert_window(samples, ts):
+    """Write one window's rows in a single transaction on a pooled connection"""
+    try:
+        with db_pool.connection() as conn:
+            with instruments.stage('insert'), conn.cursor() as cur:
+                insert_samples(cur, series_registry, SAMPLES_TABLE, samples, ts=ts)
+            with instruments.stage('commit'):
+                conn.commit()
+    except psycopg2.Error:
+        # Series ids created in the rolled-back transaction don't exist
+        series_registry.clear()
+        raise
+    instruments.rows_written(SAMPLES_TABLE, len(samples))
 
+def report(histograms):
+    for host, histogram in histograms.items():
+        stats = histogram.summary()
+        if stats['p50'] is None:
+            print(f"Ping to {host} failed ({stats['sent']} probes lost)")
+        else:
+            jitter = stats['jitter'] or 0.0
+            print(f"Ping to {host}: p50 {stats['p50']:.2f}ms, p95 {stats['p95']:.2f}ms, "
+                  f"max {stats['max']:.2f}ms, jitter {jitter:.2f}ms, loss {stats['loss']:.0f}%")
+
+async def run(targets, probes, window, daemon):
+    """Probe windows back to back, writing each window's rows as one batch"""
+    loop = asyncio.get_running_loop()
+    # One probe thread per target plus one for the database
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=len(targets) + 1))
+    print(f"Pinging {', '.join(targets)}: {probes} probes per {window:g}s window")
+    while True:
+        started = time.monotonic()
+        try:
+            with instruments.run():
+                with instruments.stage('fetch'):  # The probe window
+                    histograms = await probe_window(targets, probes, window)
+                report(histograms)
+                cancellation.checkpoint()
+                # The pool keeps the connection open between windows; a broken
+                # one is discarded and the next window reconnects
+                samples = window_samples(histograms)
+                await loop.run_in_executor(None, insert_window, samples, datetime.now())
+            print(f"Inserted {len(samples)} rows")
+        except psycopg2.Error as e:
+            print(f"Database error: {str(e)}")
+        if not daemon:
+            break
+        # Probes finish within the window plus one timeout; keep windows aligned
+        await asyncio.sleep(max(0.0, window - (time.monotonic() - started)))
+
+def run_once():
+    """Probe the configured targets for one window (scheduler entry point)"""
+    asyncio.run(run(RaspberryPiConfig.PING_TARGETS, RaspberryPiConfig.PING_PROBES,
+                    RaspberryPiConfig.PING_WINDOW, daemon=False))
+
+def main():
+    parser = argparse.ArgumentParser(description="Ping targets and store latency statistics in PostgreSQL")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep probing window after window instead of once")
+    parser.add_argument('--targets', default=','.join(RaspberryPiConfig.PING_TARGETS),
+                        help="comma-separated hosts (default: PI_PING_TARGETS)")
+    parser.add_argument('--probes', type=int, default=RaspberryPiConfig.PING_PROBES,
+                        help="probes per target per window (default: PI_PING_PROBES)")
+    parser.add_argument('--window', type=float, default=RaspberryPiConfig.PING_WINDOW,
+                        help="window length in seconds (default: PI_PING_WINDOW)")
+    args = parser.parse_args()
+
+    targets = [host.strip() for host in args.targets.split(',') if host.strip()]
+    if not targets or args.probes < 1 or args.window <= 0:
+        parser.error("need at least one target, one probe and a positive window")
+
+    if args.daemon:
+        serve()
+    try:
+        asyncio.run(run(targets, args.probes, args.window, args.daemon))
+    except KeyboardInterrupt:
+        print("Stopped")
+
+if __name__ == "__main__":
+    main()
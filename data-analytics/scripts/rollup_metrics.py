@@ -0,0 +1,157 @@
+"""
+Fold new raw rows into the 1-minute / 1-hour / 1-day rollup tables.
+
+Each dataset keeps a watermark, so a run only scans rows written since the
+previous run. Dashboards and summary views read the rollup tables instead of
+aggregating raw history on every refresh.
+
+Usage:
+    python scripts/rollup_metrics.py                 # every dataset
+    python scripts/rollup_metrics.py pi_samples      # selected datasets
+"""
+import argparse
+import psycopg2
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DatabaseConfig, RollupConfig, Colors
+from utils.rollup import fold_dataset, missing_rollup_tables, prune_rollups
+from utils.metrics import Collector, counter
+from utils import cancellation
+
+instruments = Collector('rollups')
+FOLDED = counter('rollup_rows_folded_total', "Raw rows folded into the rollup tables", ('dataset',))
+
+# Each source yields (key, ts, value); the watermark filter is applied to ts.
+# `lag` overrides RollupConfig.LAG_SECONDS for collectors whose timestamps
+# are taken well before their rows commit, and `clock` names the time zone
+# ts is stored in (utils.rollup.CLOCKS; the default is the server's).
+DATASETS = {
+    DatabaseConfig.ENVIRONMENT_METRICS: {
+        'pi_samples': {
+            'source': "SELECT jsonb_build_object('series_id', series_id) AS key, ts, value "
+                      "FROM pi_environment_samples",
+        },
+        'pi4_samples': {
+            'source': "SELECT jsonb_build_object('series_id', series_id) AS key, ts, value "
+                      "FROM pi4_environment_samples",
+        },
+        # Successful pings only (lost probes are stored as -1)
+        'pi_ping_ok': {
+            'source': "SELECT jsonb_build_object('series_id', p.series_id) AS key, p.ts, p.value "
+                      "FROM pi_environment_samples p JOIN series s ON s.id = p.series_id "
+                      "WHERE s.metric = 'ping_response_time' AND p.value > 0",
+        },
+    },
+    # ts is stamped when an account starts; BalanceWriter may hold the row
+    # for up to a minute more, behind RPC retries and inter-account delays
+    DatabaseConfig.ASSET_BALANCES: {
+        'xahau_balance': {
+            'source': "SELECT jsonb_build_object('account', account, 'name', name, 'asset_type', asset_type) AS key, "
+                      "ts, balance::double precision AS value "
+                      "FROM asset_balances WHERE source = 'xahau'",
+            'lag': 900,
+            'clock': 'utc',
+        },
+        'xahau_usd_value': {
+            'source': "SELECT jsonb_build_object('account', account, 'name', name, 'asset_type', asset_type) AS key, "
+                      "ts, usd_value::double precision AS value "
+                      "FROM asset_balances WHERE source = 'xahau'",
+            'lag': 900,
+            'clock': 'utc',
+        },
+    },
+    # execution_ts is stamped before the registry download, so allow for long runs
+    DatabaseConfig.EVERNODE_HOST_STATS: {
+        'evernode_active_instances': {
+            'source': "SELECT jsonb_build_object('domain', domain) AS key, execution_ts AS ts, "
+                      "activeinstances::double precision AS value "
+                      "FROM evernode_host_snapshots WHERE domain IS NOT NULL",
+            'lag': 900,
+            'clock': 'utc',
+        },
+        'evernode_max_instances': {
+            'source': "SELECT jsonb_build_object('domain', domain) AS key, execution_ts AS ts, "
+                      "maxinstances::double precision AS value "
+                      "FROM evernode_host_snapshots WHERE domain IS NOT NULL",
+            'lag': 900,
+            'clock': 'utc',
+        },
+        'evernode_reputation': {
+            'source': "SELECT jsonb_build_object('domain', domain) AS key, execution_ts AS ts, "
+                      "hostreputation::double precision AS value "
+                      "FROM evernode_host_snapshots WHERE domain IS NOT NULL",
+            'lag': 900,
+            'clock': 'utc',
+        },
+    },
+}
+
+
+def roll_up_database(dbname, datasets):
+    """Fold each dataset in its own transaction, then prune expired buckets"""
+    try:
+        with DatabaseConfig.connection(dbname) as conn:
+            with conn.cursor() as cur:
+                missing = missing_rollup_tables(cur)
+            if missing:
+                instruments.failed()
+                print(f"{Colors.RED}❌ {dbname}: missing {', '.join(missing)}; "
+                      f"apply sql/rollups.sql to this database{Colors.RESET}")
+                return
+
+            for name, dataset in datasets.items():
+                cancellation.checkpoint()
+                try:
+                    with instruments.stage('fold'), conn.cursor() as cur:
+                        lag = max(RollupConfig.LAG_SECONDS, dataset.get('lag', 0))
+                        folded = fold_dataset(cur, name, dataset['source'], lag,
+                                              clock=dataset.get('clock', 'local'))
+                    with instruments.stage('commit'):
+                        conn.commit()
+                    FOLDED.inc(folded, dataset=name)
+                    print(f"{Colors.CYAN}{name}{Colors.RESET}: folded {folded} rows")
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    instruments.failed()
+                    print(f"{Colors.RED}❌ {name}: {str(e)}{Colors.RESET}")
+
+            with instruments.stage('prune'), conn.cursor() as cur:
+                deleted = prune_rollups(cur, RollupConfig.RETENTION_DAYS)
+            with instruments.stage('commit'):
+                conn.commit()
+            if deleted:
+                print(f"Pruned {deleted} expired rollup rows from {dbname}")
+    except psycopg2.Error as e:
+        instruments.failed()
+        print(f"Database error ({dbname}): {str(e)}")
+
+
+def run(names=None):
+    """Fold the named datasets (default: all), one database at a time"""
+    with instruments.run():
+        for dbname, datasets in DATASETS.items():
+            if names:
+                datasets = {name: d for name, d in datasets.items() if name in names}
+            if datasets:
+                roll_up_database(dbname, datasets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally maintain rollup tables")
+    parser.add_argument('datasets', nargs='*', help="datasets to fold (default: all)")
+    args = parser.parse_args()
+
+    known = {name for datasets in DATASETS.values() for name in datasets}
+    unknown = [name for name in args.datasets if name not in known]
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)}")
+
+    run(args.datasets)
+
+
+if __name__ == "__main__":
+    main()
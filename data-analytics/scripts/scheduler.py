@@ -0,0 +1,278 @@
+"""
+Run every collector from one long-lived process on its own schedule.
+
+Replaces the per-script cron entries. Each collector is imported on its
+job's first run (so a job that never runs never loads web3 or xrpl) and
+then stays loaded; it runs as a job with its own interval (config.SchedulerConfig.INTERVALS), a random
+start jitter and a timeout. Jobs share the process-wide Postgres pools
+(DatabaseConfig.get_pool), HTTP session (utils.http.get_session) and price
+caches, so connections, keep-alive sockets and cached prices carry over
+from one run to the next. Collector metrics (utils.metrics) share one
+registry too, served on METRICS_PORT and/or written to
+METRICS_TEXTFILE_DIR/scheduler.prom.
+
+A job never overlaps itself: if its previous run is still going when it is
+due, that run is skipped. A run that exceeds its timeout is cancelled
+cooperatively (utils.cancellation): the collector stops with Cancelled at
+its next checkpoint, between accounts, pages, batches or datasets, never
+inside shared state such as a pool checkout. Single-step jobs (pi_metrics,
+speedtest) are bounded by their request timeouts instead.
+
+Usage:
+    python scripts/scheduler.py                        # every enabled job, forever
+    python scripts/scheduler.py pi_metrics rollups     # selected jobs
+    python scripts/scheduler.py --once xrpl_balances   # run once and exit
+    python scripts/scheduler.py --list
+"""
+import argparse
+import importlib.util
+import logging
+import random
+import signal
+import threading
+import time
+import traceback
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SchedulerConfig, RaspberryPiConfig, Colors
+from utils.db import close_pools
+from utils import cancellation, metrics
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TICK = 1.0  # Seconds between schedule checks
+SHUTDOWN_GRACE = 10.0  # Seconds running jobs get to finish after a stop signal
+
+JOB_RUNS = metrics.counter('scheduler_job_runs_total', "Scheduled job runs by outcome", ('job', 'outcome'))
+
+# name: (script, entry point, jitter seconds, timeout seconds)
+# The ISS collector is a streaming client rather than a periodic job and
+# keeps running as its own process.
+JOBS = {
+    'pi_metrics': ('pi_data_collector.py', 'run_once', 5, 50),
+    'pi_latency': ('pi_latency_collector.py', 'run_once', 0,
+                   RaspberryPiConfig.PING_WINDOW + RaspberryPiConfig.PING_TIMEOUT + 30),
+    'speedtest': ('pi4_speedtest-cli_collector.py', 'main', 600, 600),
+    'xrpl_balances': ('xrpl_check_balances.py', 'main', 300, 1800),
+    'xahau_balances': ('xahau_check_balances.py', 'main', 300, 1800),
+    'eth_balances': ('eth_check_balances.py', 'main', 300, 1800),
+    'evernode_hosts': ('evernode_host_stats.py', 'main', 120, 600),
+    'rollups': ('rollup_metrics.py', 'run', 30, 600),
+    'partitions': ('manage_partitions.py', 'run', 600, 3600),
+}
+
+
+def load_script(filename):
+    """Import a collector script as a module (file names aren't valid module names)"""
+    name = os.path.splitext(filename)[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Job:
+    """One collector entry point with its schedule and run state"""
+    def __init__(self, name, script, entry, interval, jitter, timeout):
+        self.name = name
+        self.script = script
+        self.entry = entry
+        self.func = None
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.thread = None
+        self.started = None
+        self.token = None  # CancelToken of the current run
+        self.slot = None
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+
+    @property
+    def running(self):
+        # Thread liveness, not a flag, so an interrupt landing during
+        # cleanup can never leave the job marked as running forever
+        return self.thread is not None and self.thread.is_alive()
+
+    def schedule_first(self, now):
+        self.slot = now
+        self.next_run = now + random.uniform(0, self.jitter)
+
+    def schedule_next(self, now):
+        """Advance to the next slot, skipping slots missed while the process was busy"""
+        if self.interval <= 0:
+            self.next_run = float('inf')  # Disabled; only runs with --once
+            return
+        self.slot += self.interval
+        if self.slot < now:
+            self.slot += (now - self.slot) // self.interval * self.interval + self.interval
+        self.next_run = self.slot + random.uniform(0, self.jitter)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.token = cancellation.CancelToken()
+        self.thread = threading.Thread(target=self._execute, name=f"job-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _execute(self):
+        logger.info(f"{Colors.CYAN}▶ {self.name}{Colors.RESET}")
+        try:
+            if self.func is None:
+                # Import failures (e.g. a missing SDK) fail this run and are retried next time
+                self.func = getattr(load_script(self.script), self.entry)
+            with cancellation.scope(self.token):
+                self.func()
+            self.runs += 1
+            JOB_RUNS.inc(job=self.name, outcome="success")
+            logger.info(f"{Colors.GREEN}✓ {self.name} finished in "
+                        f"{time.monotonic() - self.started:.1f}s{Colors.RESET}")
+        except cancellation.Cancelled:
+            self.failures += 1
+            JOB_RUNS.inc(job=self.name, outcome="interrupted")
+            logger.error(f"{Colors.RED}❌ {self.name} interrupted ({self.token.reason}){Colors.RESET}")
+        except Exception:
+            self.failures += 1
+            JOB_RUNS.inc(job=self.name, outcome="failure")
+            logger.error(f"{Colors.RED}❌ {self.name} failed:\n{traceback.format_exc()}{Colors.RESET}")
+        finally:
+            metrics.export()
+
+    def interrupt(self, reason):
+        """Cancel the current run; it stops at its next checkpoint"""
+        if self.running and not self.token.cancelled:
+            self.token.cancel(reason)
+
+    def check_timeout(self, now):
+        if self.running and not self.token.cancelled and now - self.started > self.timeout:
+            logger.warning(f"{Colors.YELLOW}⚠️  {self.name} exceeded {self.timeout:g}s, interrupting{Colors.RESET}")
+            self.interrupt(f"{self.timeout:g}s timeout")
+
+
+def load_jobs(names):
+    """Build Job objects for the selected names; scripts are imported on first run"""
+    jobs = []
+    for name in names:
+        script, entry, jitter, timeout = JOBS[name]
+        jobs.append(Job(name, script, entry, SchedulerConfig.INTERVALS[name], jitter, timeout))
+    return jobs
+
+
+def run(jobs, stop, once=False):
+    """
+    Start due jobs until `stop` is set (or, with `once`, until each job ran once)
+
+    At most SchedulerConfig.WORKERS jobs run at the same time; a due job
+    that finds no free worker starts on a later tick.
+    """
+    now = time.monotonic()
+    pending = set(job.name for job in jobs)
+    for job in jobs:
+        job.schedule_first(now)
+        if once:
+            job.next_run = now
+
+    while not stop.is_set():
+        now = time.monotonic()
+        active = sum(job.running for job in jobs)
+        for job in jobs:
+            job.check_timeout(now)
+            if once and job.name not in pending:
+                continue
+            if now < job.next_run:
+                continue
+            if job.running:
+                job.skipped += 1
+                JOB_RUNS.inc(job=job.name, outcome="skipped")
+                logger.warning(f"{Colors.YELLOW}⚠️  {job.name} still running, skipping this run{Colors.RESET}")
+                job.schedule_next(now)
+                continue
+            if active >= SchedulerConfig.WORKERS:
+                continue
+            job.start()
+            active += 1
+            pending.discard(job.name)
+            job.schedule_next(now)
+        if once and not pending and not any(job.running for job in jobs):
+            break
+        stop.wait(TICK)
+    shutdown(jobs)
+
+
+def shutdown(jobs):
+    """Give running jobs a chance to finish, then interrupt the rest"""
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    for job in jobs:
+        if job.running:
+            job.thread.join(max(0.0, deadline - time.monotonic()))
+    for job in jobs:
+        if job.running:
+            logger.warning(f"{Colors.YELLOW}⚠️  Interrupting {job.name} for shutdown{Colors.RESET}")
+            job.interrupt("shutdown")
+            job.thread.join(SHUTDOWN_GRACE)
+            if job.running:
+                # Daemon thread; it ends with the process
+                logger.warning(f"{Colors.YELLOW}⚠️  {job.name} did not reach a checkpoint, "
+                               f"abandoning it{Colors.RESET}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the data collectors on a schedule from one process")
+    parser.add_argument('jobs', nargs='*', help="jobs to run (default: every job with a non-zero interval)")
+    parser.add_argument('--once', action='store_true', help="run each selected job once, then exit")
+    parser.add_argument('--list', action='store_true', help="list jobs and their schedules")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.jobs if name not in JOBS]
+    if unknown:
+        parser.error(f"unknown jobs: {', '.join(unknown)}")
+
+    if args.list:
+        for name, (script, entry, jitter, timeout) in JOBS.items():
+            interval = SchedulerConfig.INTERVALS[name]
+            schedule = f"every {interval:g}s (+{jitter:g}s jitter)" if interval else "disabled"
+            print(f"{name:16} {script + ':' + entry:42} {schedule}, timeout {timeout:g}s")
+        return
+
+    names = args.jobs or list(JOBS)
+    if not args.once:
+        disabled = [name for name in names if SchedulerConfig.INTERVALS[name] <= 0]
+        if disabled and args.jobs:
+            logger.warning(f"{Colors.YELLOW}⚠️  Interval is 0, not scheduling: {', '.join(disabled)}{Colors.RESET}")
+        names = [name for name in names if name not in disabled]
+    jobs = load_jobs(names)
+    if not jobs:
+        logger.error(f"{Colors.RED}No jobs to run{Colors.RESET}")
+        sys.exit(1)
+
+    # Before any collector is imported, so the process is named "scheduler"
+    metrics.init('scheduler')
+    metrics.serve()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    logger.info(f"{Colors.CYAN}Scheduling {len(jobs)} jobs "
+                f"({SchedulerConfig.WORKERS} at a time): {', '.join(job.name for job in jobs)}{Colors.RESET}")
+    try:
+        run(jobs, stop, once=args.once)
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+        shutdown(jobs)
+    finally:
+        close_pools()
+        for job in jobs:
+            logger.info(f"{job.name}: {job.runs} runs, {job.failures} failed, {job.skipped} skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,5 @@
-from xahau.clients import JsonRpcClient
-from xahau.models import AccountLines, AccountInfo
+import functools
 import psycopg2
-import time
 import random
 from datetime import datetime, timezone
 import sys
@@ -10,90 +8,96 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import DatabaseConfig, BlockchainConfig, Colors
-from utils import safe_hex_to_str, make_request_with_retry, get_usd_price
+from config import DatabaseConfig, BlockchainConfig, Colors, ASSET_MAP
+from utils import make_request_with_retry, get_usd_price, get_usd_prices, BalanceWriter
+from utils import cancellation
+from utils.ledger import fetch_account_snapshot
+from utils.metrics import Collector
 
 # Load configuration
-DB_CONFIG = DatabaseConfig.get_db_config(DatabaseConfig.ASSET_BALANCES)
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.ASSET_BALANCES)
 accounts = BlockchainConfig.get_xahau_accounts()
-client = JsonRpcClient(BlockchainConfig.XAHAU_RPC_URL)
+instruments = Collector('xahau_balances')
 
-def insert_balance(conn, source, account, name, asset_type, balance, usd_price, usd_value, domain, ts, execution_id):
-    """Insert balance data into PostgreSQL with execution_id."""
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO asset_balances 
-                (source, account, name, asset_type, balance, usd_price, usd_value, domain, ts, execution_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (source, account, name, asset_type, balance, usd_price, usd_value, domain, ts, execution_id))
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Database error: {str(e)}")
-        conn.rollback()
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """JSON-RPC client, created on first use"""
+    from xahau.clients import JsonRpcClient  # Heavy; only imported when the collector runs
+    return JsonRpcClient(BlockchainConfig.XAHAU_RPC_URL)
+
+def rpc_request(request):
+    """Send an RPC request with rate-limit retries, then pause to stay under the node's limits"""
+    cancellation.checkpoint()  # Between requests, so between trust line pages too
+    with instruments.stage('fetch'):
+        response = make_request_with_retry(lambda: get_client().request(request))
+    cancellation.sleep(1)
+    return response
+
+def process_account(writer, account):
+    """Process a single account with rate limit handling.
 
-def process_account(conn, account, execution_id):
-    """Process a single account with rate limit handling."""
+    Lines with a negative balance are tokens the account has issued (owed
+    to the holder, not held) and are counted instead of written.
+    """
     address = account["address"]
     name = account["name"]
     ts = datetime.now(timezone.utc)
-    domain = None
+    issued = 0
 
     try:
-        # Get AccountInfo with retry
-        info_response = make_request_with_retry(
-            lambda: client.request(AccountInfo(account=address))
-        )
-        time.sleep(1)
+        # XAH balance and domain from the latest validated ledger; trust
+        # lines are read page by page from the same ledger
+        from xahau import models  # Imported on first use, like the client
+        snapshot = fetch_account_snapshot(rpc_request, models, address,
+                                          BlockchainConfig.ACCOUNT_LINES_LIMIT)
+        domain = snapshot.domain
 
-        # Extract domain and XAH balance
-        account_data = info_response.result.get("account_data", {})
-        domain_hex = account_data.get("Domain")
-        domain = safe_hex_to_str(domain_hex) if domain_hex else None
-        
         # Process XAH balance using cached price
-        xah_balance = int(account_data.get("Balance", 0))
-        xah_balance_xah = xah_balance / 1_000_000
-        xah_price = get_usd_price("XAH")  # From cache
-        xah_usd_value = xah_balance_xah * xah_price if xah_price is not None else None
-        print(f"  XAH Balance: {xah_balance_xah} | USD Price: ${xah_price or 'N/A'}")
-        insert_balance(conn, 'xahau', address, name, 'XAH', xah_balance_xah, xah_price, xah_usd_value, domain, ts, execution_id)
-
-        # Get token balances
-        lines_response = make_request_with_retry(
-            lambda: client.request(AccountLines(account=address))
-        )
-        time.sleep(1)
+        with instruments.stage('price'):
+            xah_price = get_usd_price("XAH")  # From cache
+        xah_usd_value = snapshot.balance * xah_price if xah_price is not None else None
+        print(f"  XAH Balance: {snapshot.balance} | USD Price: ${xah_price or 'N/A'}")
+        writer.add('xahau', address, name, 'XAH', snapshot.balance, xah_price, xah_usd_value, domain, ts)
 
-        if lines_response.result.get("lines"):
-            for line in lines_response.result["lines"]:
-                token = line['currency']
-                balance = float(line['balance'])
+        # Token balances, written as each page arrives
+        for line in snapshot.lines:
+            token = line['currency']
+            balance = float(line['balance'])
+            if balance < 0:
+                issued += 1
+                continue
+            with instruments.stage('price'):
                 token_price = get_usd_price(token)  # Uses cache for EVR
-                token_usd_value = balance * token_price if token_price is not None else None
-                print(f"  Token: {token}, Balance: {balance} | USD Price: ${token_price or 'N/A'}")
-                insert_balance(conn, 'xahau', address, name, token, balance, token_price, token_usd_value, domain, ts, execution_id)
+            token_usd_value = balance * token_price if token_price is not None else None
+            print(f"  Token: {token}, Balance: {balance} | USD Price: ${token_price or 'N/A'}")
+            writer.add('xahau', address, name, token, balance, token_price, token_usd_value, domain, ts)
+        if issued:
+            print(f"  Issued trust lines (not stored): {issued}")
 
     except Exception as e:
+        instruments.failed()
         print(f"❌ Error processing {name}: {str(e)}")
 
 def main():
     try:
-        execution_id = int(datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+        with instruments.run():
+            execution_id = int(datetime.utcnow().strftime('%Y%m%d%H%M%S'))
         
-        # Pre-fetch prices to prime the cache
-        xah_price = get_usd_price("XAH")
-        evr_price = get_usd_price("EVR")
+            # Pre-fetch every mapped price in one request to prime the cache
+            with instruments.stage('price'):
+                get_usd_prices(ASSET_MAP.keys())
         
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            print(f"Loaded {len(accounts)} accounts.")
-            random.shuffle(accounts)
-            for index, account in enumerate(accounts):
-                print(f"{index+1}/{len(accounts)} {Colors.CYAN}{account['name']}{Colors.RESET} ({account['address']})")
-                process_account(conn, account, execution_id)
-                print(f"⏳ Adding inter-account delay")
-                time.sleep(random.uniform(4, 8))
-                print("-" * 40)
+            with db_pool.connection() as conn, BalanceWriter(conn, execution_id, metrics=instruments) as writer:
+                print(f"Loaded {len(accounts)} accounts.")
+                random.shuffle(accounts)
+                for index, account in enumerate(accounts):
+                    print(f"{index+1}/{len(accounts)} {Colors.CYAN}{account['name']}{Colors.RESET} ({account['address']})")
+                    process_account(writer, account)
+                    print(f"⏳ Adding inter-account delay")
+                    cancellation.sleep(random.uniform(4, 8))
+                    print("-" * 40)
+                writer.flush()
+                print(f"Wrote {writer.written} balance rows for run {execution_id}.")
                 
     except psycopg2.OperationalError as e:
         print(f"Failed to connect to database: {str(e)}")
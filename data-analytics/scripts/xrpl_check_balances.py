@@ -1,9 +1,7 @@
-from xrpl.clients import JsonRpcClient
-from xrpl.models import AccountLines, AccountInfo
-from xrpl.account import get_balance
+import functools
 import psycopg2
-import time
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 import sys
 import os
@@ -12,82 +10,103 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import DatabaseConfig, BlockchainConfig, Colors
-from utils import decode_currency_code, safe_hex_to_str, make_request_with_retry
+from utils import decode_currency_code, make_request_with_retry, get_rate_limiter, BalanceWriter
+from utils import cancellation
+from utils.ledger import fetch_account_snapshot
+from utils.metrics import Collector
 
 # Load configuration
-DB_CONFIG = DatabaseConfig.get_db_config(DatabaseConfig.ASSET_BALANCES)
+db_pool = DatabaseConfig.get_pool(DatabaseConfig.ASSET_BALANCES)
 accounts = BlockchainConfig.get_xrpl_accounts()
-client = JsonRpcClient(BlockchainConfig.XRPL_RPC_URL)
+rpc_limiter = get_rate_limiter(
+    BlockchainConfig.XRPL_RPC_URL,
+    BlockchainConfig.XRPL_RATE_LIMIT,
+    BlockchainConfig.XRPL_RATE_BURST
+)
+instruments = Collector('xrpl_balances')
 
-def insert_balance(conn, source, account, name, asset_type, balance, domain, ts):
-    """Insert balance data into PostgreSQL"""
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO asset_balances
-                (source, account, name, asset_type, balance, domain, ts)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (source, account, name, asset_type, balance, domain, ts))
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Database error: {str(e)}")
-        conn.rollback()
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """JSON-RPC client, created on first use"""
+    from xrpl.clients import JsonRpcClient  # Heavy; only imported when the collector runs
+    return JsonRpcClient(BlockchainConfig.XRPL_RPC_URL)
+
+def rpc_request(request):
+    """Send an RPC request once the shared endpoint rate limiter allows it, retrying on rate limits"""
+    def send():
+        rpc_limiter.acquire()
+        return get_client().request(request)
+    cancellation.checkpoint()  # Between requests, so between trust line pages too
+    with instruments.stage('fetch'):
+        return make_request_with_retry(send)
+
+def process_account(writer, account):
+    """Write one account's balances; runs in a worker thread
 
-def process_account(conn, account):
-    """Process a single account with rate limit handling"""
+    Trust lines are streamed page by page into the (thread-safe) writer,
+    so an account with any number of lines holds one page in memory.
+    Lines with a negative balance are tokens the account has issued
+    (owed to the holder, not held) and are counted instead of written.
+
+    Returns:
+        tuple: (XRP balance, or None if account_info failed; rows written;
+            issued lines skipped)
+    """
     address = account["address"]
     name = account["name"]
     ts = datetime.now(timezone.utc)
-    domain = None
+    xrp_balance = None
+    rows = 0
+    issued = 0
 
     try:
-        # Get validated XRP balance using official method
-        xrp_balance = get_balance(address, client) / 1_000_000
-        print(f" XRP Balance: {xrp_balance}")
-        insert_balance(conn, 'xrpl', address, name, 'XRP', xrp_balance, domain, ts)
-
-        # Get account info for domain
-        info_response = make_request_with_retry(
-            lambda: client.request(AccountInfo(
-                account=address,
-                ledger_index="validated"
-            ))
-        )
-        account_data = info_response.result.get("account_data", {})
-        domain_hex = account_data.get("Domain")
-        domain = safe_hex_to_str(domain_hex) if domain_hex else None
+        # XRP balance and domain from the latest validated ledger; trust
+        # lines are read page by page from the same ledger
+        from xrpl import models  # Imported on first use, like the client
+        snapshot = fetch_account_snapshot(rpc_request, models, address,
+                                          BlockchainConfig.ACCOUNT_LINES_LIMIT)
+        domain = snapshot.domain
+        xrp_balance = snapshot.balance
+        writer.add('xrpl', address, name, 'XRP', snapshot.balance, domain=domain, ts=ts)
+        rows += 1
 
-        # Get token balances with currency code decoding
-        lines_response = make_request_with_retry(
-            lambda: client.request(AccountLines(
-                account=address,
-                ledger_index="validated"
-            ))
-        )
-        time.sleep(1)
-
-        if lines_response.result.get("lines"):
-            for line in lines_response.result["lines"]:
-                raw_token = line['currency']
-                token = decode_currency_code(raw_token)
-                balance = float(line['balance'])
-                print(f" Token: {token} ({raw_token}), Balance: {balance}")
-                insert_balance(conn, 'xrpl', address, name, token, balance, domain, ts)
+        # Token balances with currency code decoding
+        for line in snapshot.lines:
+            balance = float(line['balance'])
+            if balance < 0:
+                issued += 1
+                continue
+            token = decode_currency_code(line['currency'])
+            writer.add('xrpl', address, name, token, balance, domain=domain, ts=ts)
+            rows += 1
 
     except Exception as e:
-        print(f"❌ Error processing {name}: {str(e)}")
+        instruments.failed()
+        print(f"❌ Error processing {name} ({rows} rows written): {str(e)}")
+
+    return xrp_balance, rows, issued
 
 def main():
     try:
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            print(f"Loaded {len(accounts)} accounts.")
-            random.shuffle(accounts)
-            for index, account in enumerate(accounts):
-                print(f"{index+1}/{len(accounts)} {Colors.CYAN}{account['name']}{Colors.RESET} ({account['address']})")
-                process_account(conn, account)
-                print(f"⏳ Adding inter-account delay")
-                time.sleep(random.uniform(4, 8))
-                print("-" * 40)
+        with instruments.run():
+            execution_id = int(datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+
+            with db_pool.connection() as conn, BalanceWriter(conn, execution_id, metrics=instruments) as writer:
+                print(f"Loaded {len(accounts)} accounts ({BlockchainConfig.XRPL_WORKERS} workers, "
+                      f"{BlockchainConfig.XRPL_RATE_LIMIT:g} req/s).")
+                random.shuffle(accounts)
+                with ThreadPoolExecutor(max_workers=BlockchainConfig.XRPL_WORKERS) as pool:
+                    futures = {pool.submit(cancellation.bind(process_account), writer, account): account for account in accounts}
+                    for index, future in enumerate(as_completed(futures)):
+                        account = futures[future]
+                        xrp_balance, rows, issued = future.result()
+                        print(f"{index+1}/{len(accounts)} {Colors.CYAN}{account['name']}{Colors.RESET} ({account['address']})")
+                        if xrp_balance is not None:
+                            print(f" XRP Balance: {xrp_balance}, trust lines: {max(rows - 1, 0)}"
+                                  + (f", issued (not stored): {issued}" if issued else ""))
+                        print("-" * 40)
+                writer.flush()
+                print(f"Wrote {writer.written} balance rows for run {execution_id}.")
     except psycopg2.OperationalError as e:
         print(f"Failed to connect to database: {str(e)}")
     except Exception as e:
@@ -95,4 +114,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
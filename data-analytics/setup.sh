@@ -70,6 +70,12 @@ create_database "${DB_ISS_METRICS:-iss_metrics}"
 # Create tables
 echo -e "${YELLOW}=== Creating Tables ===${NC}"
 
+# Rollup tables first: schema and view files read from them
+echo -e "${YELLOW}Creating rollup tables...${NC}"
+execute_sql "${DB_ASSET_BALANCES:-asset_balances}" "sql/rollups.sql"
+execute_sql "${DB_ENVIRONMENT_METRICS:-environment_metrics}" "sql/rollups.sql"
+execute_sql "${DB_EVERNODE_HOST_STATS:-evernode_host_stats}" "sql/rollups.sql"
+
 # asset_balances schema
 echo -e "${YELLOW}Creating asset_balances tables...${NC}"
 execute_sql "${DB_ASSET_BALANCES:-asset_balances}" "sql/asset_balances.sql"
@@ -27,9 +27,35 @@ CREATE INDEX IF NOT EXISTS idx_asset_balances_ts ON asset_balances(ts DESC);
 CREATE INDEX IF NOT EXISTS idx_asset_balances_execution_id ON asset_balances(execution_id);
 CREATE INDEX IF NOT EXISTS idx_asset_balances_composite ON asset_balances(source, account, asset_type, ts DESC);
 
+-- Create the current_balances table: latest row per account/asset, upserted by the
+-- collectors (utils.db.BalanceWriter) in the same statement as the history insert
+CREATE TABLE IF NOT EXISTS current_balances (
+    source VARCHAR(50) NOT NULL,
+    account VARCHAR(255) NOT NULL,
+    asset_type VARCHAR(50) NOT NULL,
+    id INTEGER NOT NULL,                   -- asset_balances.id of the latest row
+    name VARCHAR(255),
+    balance NUMERIC(30, 10) NOT NULL,
+    usd_price NUMERIC(20, 8),
+    usd_value NUMERIC(30, 2),
+    domain VARCHAR(255),
+    ts TIMESTAMP NOT NULL,
+    execution_id BIGINT,
+    PRIMARY KEY (source, account, asset_type)
+);
+
+-- Backfill from history (only inserts keys that aren't tracked yet)
+INSERT INTO current_balances
+    (source, account, asset_type, id, name, balance, usd_price, usd_value, domain, ts, execution_id)
+SELECT DISTINCT ON (source, account, asset_type)
+    source, account, asset_type, id, name, balance, usd_price, usd_value, domain, ts, execution_id
+FROM asset_balances
+ORDER BY source, account, asset_type, ts DESC, id DESC
+ON CONFLICT (source, account, asset_type) DO NOTHING;
+
 -- Create a view for latest balances per account/asset
 CREATE OR REPLACE VIEW latest_balances AS
-SELECT DISTINCT ON (source, account, asset_type)
+SELECT
     id,
     source,
     account,
@@ -41,8 +67,7 @@ SELECT DISTINCT ON (source, account, asset_type)
     domain,
     ts,
     execution_id
-FROM asset_balances
-ORDER BY source, account, asset_type, ts DESC;
+FROM current_balances;
 
 -- Create a view for total portfolio value by source
 CREATE OR REPLACE VIEW portfolio_summary AS
@@ -57,6 +82,7 @@ WHERE usd_value IS NOT NULL
 GROUP BY source;
 
 COMMENT ON TABLE asset_balances IS 'Stores cryptocurrency balance data from multiple blockchain sources';
+COMMENT ON TABLE current_balances IS 'Latest balance per source/account/asset, maintained on insert';
 COMMENT ON COLUMN asset_balances.execution_id IS 'Groups records collected in the same batch run';
 COMMENT ON VIEW latest_balances IS 'Shows the most recent balance for each account/asset combination';
 COMMENT ON VIEW portfolio_summary IS 'Summarizes total portfolio value by blockchain source';
\ No newline at end of file
@@ -1,82 +1,168 @@
 -- Environment Metrics Database Schema
 -- Stores Raspberry Pi system metrics and monitoring data
+--
+-- Samples are stored normalized: each distinct (metric, labels) pair is a row
+-- in `series`, and sample tables only hold (series_id, ts, value).
+-- pi_environment_metrics / pi4_environment_metrics are compatibility views
+-- with the original (metric, labels, value, timestamp) columns.
 
--- Create the pi_environment_metrics table
-CREATE TABLE IF NOT EXISTS pi_environment_metrics (
+-- Create the series dimension table (shared by all devices)
+CREATE TABLE IF NOT EXISTS series (
     id SERIAL PRIMARY KEY,
     metric VARCHAR(255) NOT NULL,                -- Metric name (e.g., cpu_temp, memory_usage)
-    labels TEXT,                                 -- Prometheus-style labels (e.g., 'host="ghost"')
-    value DOUBLE PRECISION NOT NULL,             -- Metric value
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- Time of collection
+    labels JSONB NOT NULL DEFAULT '{}'::jsonb,   -- Prometheus labels as an object
+    labels_text TEXT,                            -- Prometheus-style labels (e.g., 'host="ghost"')
+    CONSTRAINT series_metric_labels_key UNIQUE (metric, labels)
 );
 
--- Create the pi4_environment_metrics table (for secondary Pi device)
-CREATE TABLE IF NOT EXISTS pi4_environment_metrics (
-    id SERIAL PRIMARY KEY,
-    metric VARCHAR(255) NOT NULL,                -- Metric name
-    labels TEXT,                                 -- Prometheus-style labels
-    value DOUBLE PRECISION NOT NULL,             -- Metric value
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- Time of collection
+-- Create the pi_environment_samples table
+CREATE TABLE IF NOT EXISTS pi_environment_samples (
+    series_id INTEGER NOT NULL REFERENCES series(id),
+    ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,  -- Time of collection
+    value DOUBLE PRECISION NOT NULL                   -- Metric value
+);
+
+-- Create the pi4_environment_samples table (for secondary Pi device)
+CREATE TABLE IF NOT EXISTS pi4_environment_samples (
+    series_id INTEGER NOT NULL REFERENCES series(id),
+    ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,  -- Time of collection
+    value DOUBLE PRECISION NOT NULL                   -- Metric value
 );
 
 -- Create indexes for better query performance
-CREATE INDEX IF NOT EXISTS idx_pi_env_metric ON pi_environment_metrics(metric);
-CREATE INDEX IF NOT EXISTS idx_pi_env_timestamp ON pi_environment_metrics(timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_pi_env_metric_timestamp ON pi_environment_metrics(metric, timestamp DESC);
+-- (series_id, ts DESC) INCLUDE (value) serves latest-value lookups index-only
+CREATE INDEX IF NOT EXISTS idx_series_metric ON series(metric);
+CREATE INDEX IF NOT EXISTS idx_pi_environment_samples_series_ts ON pi_environment_samples(series_id, ts DESC) INCLUDE (value);
+CREATE INDEX IF NOT EXISTS idx_pi_environment_samples_ts ON pi_environment_samples(ts DESC);
+CREATE INDEX IF NOT EXISTS idx_pi4_environment_samples_series_ts ON pi4_environment_samples(series_id, ts DESC) INCLUDE (value);
+CREATE INDEX IF NOT EXISTS idx_pi4_environment_samples_ts ON pi4_environment_samples(ts DESC);
+
+-- Migrate data from the original pi_environment_metrics / pi4_environment_metrics
+-- tables (if they still exist as tables) into series + samples, then drop them.
+-- Dropping cascades to views built on them; re-run sql/pi_metrics_views.sql afterwards.
+DO $$
+DECLARE
+    device TEXT;
+    legacy TEXT;
+BEGIN
+    FOREACH device IN ARRAY ARRAY['pi', 'pi4'] LOOP
+        legacy := device || '_environment_metrics';
+        IF EXISTS (
+            SELECT 1 FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname = legacy AND c.relkind = 'r' AND n.nspname = current_schema()
+        ) THEN
+            RAISE NOTICE 'Migrating % into series + %_environment_samples', legacy, device;
+
+            EXECUTE format($sql$
+                CREATE TEMP TABLE legacy_series ON COMMIT DROP AS
+                SELECT DISTINCT m.metric, m.labels AS labels_text, l.labels
+                FROM %I m
+                CROSS JOIN LATERAL (
+                    SELECT COALESCE(jsonb_object_agg(kv[1], kv[2]), '{}'::jsonb) AS labels
+                    FROM regexp_matches(COALESCE(m.labels, ''), '(\w+)="([^"]*)"', 'g') AS kv
+                ) l
+            $sql$, legacy);
+
+            EXECUTE $sql$
+                INSERT INTO series (metric, labels, labels_text)
+                SELECT DISTINCT ON (metric, labels) metric, labels, labels_text
+                FROM legacy_series
+                ON CONFLICT (metric, labels) DO NOTHING
+            $sql$;
+
+            EXECUTE format($sql$
+                INSERT INTO %I (series_id, ts, value)
+                SELECT s.id, COALESCE(m.timestamp, CURRENT_TIMESTAMP), m.value
+                FROM %I m
+                JOIN legacy_series ls
+                    ON ls.metric = m.metric AND ls.labels_text IS NOT DISTINCT FROM m.labels
+                JOIN series s
+                    ON s.metric = ls.metric AND s.labels = ls.labels
+            $sql$, device || '_environment_samples', legacy);
+
+            EXECUTE 'DROP TABLE legacy_series';
+            EXECUTE format('DROP TABLE %I CASCADE', legacy);
+        END IF;
+    END LOOP;
+END
+$$;
+
+-- Create compatibility views with the original row shape
+CREATE OR REPLACE VIEW pi_environment_metrics AS
+SELECT
+    p.series_id,
+    s.metric,
+    s.labels_text AS labels,
+    p.value,
+    p.ts AS timestamp
+FROM pi_environment_samples p
+JOIN series s ON s.id = p.series_id;
 
-CREATE INDEX IF NOT EXISTS idx_pi4_env_metric ON pi4_environment_metrics(metric);
-CREATE INDEX IF NOT EXISTS idx_pi4_env_timestamp ON pi4_environment_metrics(timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_pi4_env_metric_timestamp ON pi4_environment_metrics(metric, timestamp DESC);
+CREATE OR REPLACE VIEW pi4_environment_metrics AS
+SELECT
+    p.series_id,
+    s.metric,
+    s.labels_text AS labels,
+    p.value,
+    p.ts AS timestamp
+FROM pi4_environment_samples p
+JOIN series s ON s.id = p.series_id;
 
--- Create view for latest metrics (pi)
+-- Create view for latest metrics (pi): one index lookup per series
 CREATE OR REPLACE VIEW latest_pi_metrics AS
-SELECT DISTINCT ON (metric, labels)
-    id,
-    metric,
-    labels,
-    value,
-    timestamp
-FROM pi_environment_metrics
-ORDER BY metric, labels, timestamp DESC;
+SELECT
+    s.id AS series_id,
+    s.metric,
+    s.labels_text AS labels,
+    l.value,
+    l.ts AS timestamp
+FROM series s
+CROSS JOIN LATERAL (
+    SELECT value, ts
+    FROM pi_environment_samples p
+    WHERE p.series_id = s.id
+    ORDER BY ts DESC
+    LIMIT 1
+) l;
 
 -- Create view for latest metrics (pi4)
 CREATE OR REPLACE VIEW latest_pi4_metrics AS
-SELECT DISTINCT ON (metric, labels)
-    id,
-    metric,
-    labels,
-    value,
-    timestamp
-FROM pi4_environment_metrics
-ORDER BY metric, labels, timestamp DESC;
+SELECT
+    s.id AS series_id,
+    s.metric,
+    s.labels_text AS labels,
+    l.value,
+    l.ts AS timestamp
+FROM series s
+CROSS JOIN LATERAL (
+    SELECT value, ts
+    FROM pi4_environment_samples p
+    WHERE p.series_id = s.id
+    ORDER BY ts DESC
+    LIMIT 1
+) l;
 
--- Create view for metric summary
+-- Create view for metric summary (from the daily rollups; run sql/rollups.sql first)
 CREATE OR REPLACE VIEW metrics_summary AS
-SELECT 
-    'pi' as device,
-    metric,
-    COUNT(*) as reading_count,
-    AVG(value) as avg_value,
-    MIN(value) as min_value,
-    MAX(value) as max_value,
-    MIN(timestamp) as first_reading,
-    MAX(timestamp) as last_reading
-FROM pi_environment_metrics
-GROUP BY metric
-UNION ALL
-SELECT 
-    'pi4' as device,
-    metric,
-    COUNT(*) as reading_count,
-    AVG(value) as avg_value,
-    MIN(value) as min_value,
-    MAX(value) as max_value,
-    MIN(timestamp) as first_reading,
-    MAX(timestamp) as last_reading
-FROM pi4_environment_metrics
-GROUP BY metric;
+SELECT
+    CASE r.dataset WHEN 'pi_samples' THEN 'pi' ELSE 'pi4' END as device,
+    s.metric,
+    SUM(r.count)::bigint as reading_count,
+    (SUM(r.sum) / SUM(r.count))::double precision as avg_value,
+    MIN(r.min) as min_value,
+    MAX(r.max) as max_value,
+    MIN(r.first_ts) as first_reading,
+    MAX(r.last_ts) as last_reading
+FROM rollup_1d r
+JOIN series s ON s.id = (r.key->>'series_id')::int
+WHERE r.dataset IN ('pi_samples', 'pi4_samples')
+GROUP BY r.dataset, s.metric;
 
-COMMENT ON TABLE pi_environment_metrics IS 'Stores Raspberry Pi system and network metrics';
-COMMENT ON TABLE pi4_environment_metrics IS 'Stores secondary Raspberry Pi (Pi4) system metrics';
+COMMENT ON TABLE series IS 'One row per distinct (metric, labels) pair collected from any Pi';
+COMMENT ON TABLE pi_environment_samples IS 'Stores Raspberry Pi system and network metric samples';
+COMMENT ON TABLE pi4_environment_samples IS 'Stores secondary Raspberry Pi (Pi4) system metric samples';
+COMMENT ON VIEW pi_environment_metrics IS 'Pi samples in the original metric/labels/value/timestamp shape';
+COMMENT ON VIEW pi4_environment_metrics IS 'Pi4 samples in the original metric/labels/value/timestamp shape';
 COMMENT ON VIEW latest_pi_metrics IS 'Shows the most recent value for each metric';
-COMMENT ON VIEW metrics_summary IS 'Provides statistical summary of collected metrics';
\ No newline at end of file
+COMMENT ON VIEW metrics_summary IS 'Provides statistical summary of collected metrics (as of the last rollup run)';
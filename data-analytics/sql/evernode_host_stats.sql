@@ -59,9 +59,21 @@ CREATE INDEX IF NOT EXISTS idx_evernode_active ON evernode_hosts(active);
 CREATE INDEX IF NOT EXISTS idx_evernode_country ON evernode_hosts(countryCode);
 CREATE INDEX IF NOT EXISTS idx_evernode_composite ON evernode_hosts(address, execution_ts DESC);
 
--- Create view for latest host data
-CREATE OR REPLACE VIEW latest_evernode_hosts AS
-SELECT DISTINCT ON (address)
+-- Heartbeat-only snapshots written in delta mode (EVERNODE_DELTA_SNAPSHOTS=true)
+-- for hosts whose other fields did not change since their last full row
+CREATE TABLE IF NOT EXISTS evernode_host_heartbeats (
+    id SERIAL PRIMARY KEY,
+    address VARCHAR(255) NOT NULL,
+    lastHeartbeatIndex BIGINT,
+    execution_ts TIMESTAMP NOT NULL         -- Timestamp of data collection batch
+);
+
+CREATE INDEX IF NOT EXISTS idx_evernode_heartbeats_composite ON evernode_host_heartbeats(address, execution_ts DESC);
+
+-- Create view for every host snapshot: full rows plus heartbeat rows
+-- resolved against the host's latest full row at or before them
+CREATE OR REPLACE VIEW evernode_host_snapshots AS
+SELECT
     id,
     key,
     addressKey,
@@ -109,7 +121,125 @@ SELECT DISTINCT ON (address)
     scoreValid,
     execution_ts
 FROM evernode_hosts
-ORDER BY address, execution_ts DESC;
+UNION ALL
+SELECT
+    h.id,
+    h.key,
+    h.addressKey,
+    h.address,
+    h.cpuModelName,
+    h.cpuCount,
+    h.cpuMHz,
+    h.cpuMicrosec,
+    h.ramMb,
+    h.diskMb,
+    h.email,
+    h.accumulatedRewardAmount,
+    h.uriTokenId,
+    h.countryCode,
+    h.description,
+    h.registrationLedger,
+    h.registrationFee,
+    h.maxInstances,
+    h.activeInstances,
+    hb.lastHeartbeatIndex,
+    h.version,
+    h.isATransferer,
+    h.lastVoteCandidateIdx,
+    h.lastVoteTimestamp,
+    h.supportVoteSent,
+    h.registrationTimestamp,
+    h.hostReputation,
+    h.reputedOnHeartbeat,
+    h.transferTimestamp,
+    h.leaseAmount,
+    h.active,
+    h.domain,
+    h.domainTLD,
+    h.hostRating,
+    h.hostRatingStr,
+    h.scoreMoment,
+    h.scoreNumerator,
+    h.scoreDenominator,
+    h.score,
+    h.score100,
+    h.score255,
+    h.scoreLastResetMoment,
+    h.scoreLastScoredMoment,
+    h.scoreLastUniverseSize,
+    h.scoreValid,
+    hb.execution_ts
+FROM evernode_host_heartbeats hb
+CROSS JOIN LATERAL (
+    SELECT *
+    FROM evernode_hosts e
+    WHERE e.address = hb.address
+        AND e.execution_ts <= hb.execution_ts
+    ORDER BY e.execution_ts DESC
+    LIMIT 1
+) h;
+
+-- Create view for latest host data (latest full row, advanced by any newer heartbeat)
+CREATE OR REPLACE VIEW latest_evernode_hosts AS
+WITH latest_full AS (
+    SELECT DISTINCT ON (address) *
+    FROM evernode_hosts
+    ORDER BY address, execution_ts DESC
+),
+latest_heartbeat AS (
+    SELECT DISTINCT ON (address) address, lastHeartbeatIndex, execution_ts
+    FROM evernode_host_heartbeats
+    ORDER BY address, execution_ts DESC
+)
+SELECT
+    f.id,
+    f.key,
+    f.addressKey,
+    f.address,
+    f.cpuModelName,
+    f.cpuCount,
+    f.cpuMHz,
+    f.cpuMicrosec,
+    f.ramMb,
+    f.diskMb,
+    f.email,
+    f.accumulatedRewardAmount,
+    f.uriTokenId,
+    f.countryCode,
+    f.description,
+    f.registrationLedger,
+    f.registrationFee,
+    f.maxInstances,
+    f.activeInstances,
+    CASE WHEN b.execution_ts > f.execution_ts THEN b.lastHeartbeatIndex ELSE f.lastHeartbeatIndex END AS lastHeartbeatIndex,
+    f.version,
+    f.isATransferer,
+    f.lastVoteCandidateIdx,
+    f.lastVoteTimestamp,
+    f.supportVoteSent,
+    f.registrationTimestamp,
+    f.hostReputation,
+    f.reputedOnHeartbeat,
+    f.transferTimestamp,
+    f.leaseAmount,
+    f.active,
+    f.domain,
+    f.domainTLD,
+    f.hostRating,
+    f.hostRatingStr,
+    f.scoreMoment,
+    f.scoreNumerator,
+    f.scoreDenominator,
+    f.score,
+    f.score100,
+    f.score255,
+    f.scoreLastResetMoment,
+    f.scoreLastScoredMoment,
+    f.scoreLastUniverseSize,
+    f.scoreValid,
+    GREATEST(f.execution_ts, b.execution_ts) AS execution_ts
+FROM latest_full f
+LEFT JOIN latest_heartbeat b ON b.address = f.address;
 
 -- Create view for host statistics summary
 CREATE OR REPLACE VIEW evernode_summary AS
@@ -139,6 +269,8 @@ ORDER BY host_count DESC;
 
 COMMENT ON TABLE evernode_hosts IS 'Stores Evernode network host statistics with historical snapshots';
 COMMENT ON COLUMN evernode_hosts.execution_ts IS 'Timestamp when this batch of data was collected';
+COMMENT ON TABLE evernode_host_heartbeats IS 'Heartbeat-only snapshots for hosts unchanged since their last full row (delta mode)';
+COMMENT ON VIEW evernode_host_snapshots IS 'Every host snapshot, with heartbeat rows filled in from the preceding full row';
 COMMENT ON VIEW latest_evernode_hosts IS 'Shows the most recent data for each host';
 COMMENT ON VIEW evernode_summary IS 'Provides aggregate statistics across all hosts';
 COMMENT ON VIEW evernode_by_country IS 'Summarizes host distribution and stats by country';
\ No newline at end of file
@@ -1,5 +1,5 @@
 -- Enhanced Views for Evernode Host Stats
--- Run on evernode_host_stats database
+-- Run on evernode_host_stats database (after rollups.sql)
 
 -- Latest Evernode host stats
 CREATE OR REPLACE VIEW latest_evernode_stats AS
@@ -17,7 +17,7 @@ SELECT DISTINCT ON (domain)
     countrycode,
     version,
     execution_ts
-FROM evernode_hosts
+FROM latest_evernode_hosts
 WHERE domain LIKE '%YOUR_DOMAIN%'
 ORDER BY domain, execution_ts DESC;
 
@@ -35,17 +35,20 @@ SELECT
 FROM latest_evernode_stats
 ORDER BY domain;
 
--- Host reputation trends
+-- Host reputation trends (hourly rollups: last reading per hour)
 CREATE OR REPLACE VIEW evernode_reputation_history AS
 SELECT 
-    execution_ts as timestamp,
-    domain,
-    hostreputation,
-    activeinstances
-FROM evernode_hosts
-WHERE domain LIKE '%YOUR_DOMAIN%'
-    AND execution_ts > NOW() - INTERVAL '30 days'
-ORDER BY execution_ts DESC;
+    r.bucket as timestamp,
+    (r.key->>'domain')::varchar(255) as domain,
+    r.last_value::numeric(10, 6) as hostreputation,
+    a.last_value::integer as activeinstances
+FROM rollup_1h r
+LEFT JOIN rollup_1h a
+    ON a.dataset = 'evernode_active_instances' AND a.key = r.key AND a.bucket = r.bucket
+WHERE r.dataset = 'evernode_reputation'
+    AND r.key->>'domain' LIKE '%YOUR_DOMAIN%'
+    AND r.bucket > NOW() - INTERVAL '30 days'
+ORDER BY r.bucket DESC;
 
 -- Evernode summary statistics
 CREATE OR REPLACE VIEW evernode_summary AS
@@ -73,18 +76,21 @@ SELECT
 FROM latest_evernode_stats
 ORDER BY hostreputation DESC, domain;
 
--- Instance utilization over time
+-- Instance utilization over time (hourly rollups: last reading per hour)
 CREATE OR REPLACE VIEW evernode_utilization_history AS
 SELECT 
-    execution_ts as timestamp,
-    domain,
-    activeinstances,
-    maxinstances,
-    ROUND((activeinstances::numeric / NULLIF(maxinstances, 0)::numeric * 100), 2) as utilization_pct
-FROM evernode_hosts
-WHERE domain LIKE '%YOUR_DOMAIN%'
-    AND execution_ts > NOW() - INTERVAL '30 days'
-ORDER BY execution_ts DESC;
+    a.bucket as timestamp,
+    (a.key->>'domain')::varchar(255) as domain,
+    a.last_value::integer as activeinstances,
+    m.last_value::integer as maxinstances,
+    ROUND((a.last_value::numeric / NULLIF(m.last_value, 0)::numeric * 100), 2) as utilization_pct
+FROM rollup_1h a
+JOIN rollup_1h m
+    ON m.dataset = 'evernode_max_instances' AND m.key = a.key AND m.bucket = a.bucket
+WHERE a.dataset = 'evernode_active_instances'
+    AND a.key->>'domain' LIKE '%YOUR_DOMAIN%'
+    AND a.bucket > NOW() - INTERVAL '30 days'
+ORDER BY a.bucket DESC;
 
 COMMENT ON VIEW latest_evernode_stats IS 'Current stats for all monitored Evernode hosts';
 COMMENT ON VIEW evernode_host_utilization IS 'Instance utilization metrics per host';
@@ -5,13 +5,18 @@
 CREATE TABLE IF NOT EXISTS telemetry (
     id SERIAL PRIMARY KEY,
     timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
-    level NUMERIC(10, 4),                        -- Urine tank level or other metric
+    level DOUBLE PRECISION,                      -- Item value (NULL for non-numeric items)
     metric_name VARCHAR(255) DEFAULT 'URINE_TANK_LEVEL',  -- Name of the metric being tracked
-    raw_data TEXT,                               -- Store raw data for debugging
-    
-    CONSTRAINT telemetry_check_level CHECK (level >= 0)
+    raw_data TEXT                                -- Item fields as JSON, for debugging
 );
 
+-- Migrate older tables: telemetry items can be negative (e.g. attitude) or exceed
+-- NUMERIC(10, 4). The views below are recreated after the column change.
+DROP VIEW IF EXISTS latest_iss_telemetry;
+DROP VIEW IF EXISTS iss_telemetry_summary;
+ALTER TABLE telemetry DROP CONSTRAINT IF EXISTS telemetry_check_level;
+ALTER TABLE telemetry ALTER COLUMN level TYPE DOUBLE PRECISION;
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_iss_timestamp ON telemetry(timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_iss_metric_name ON telemetry(metric_name);
@@ -43,6 +48,6 @@ WHERE level IS NOT NULL
 GROUP BY metric_name;
 
 COMMENT ON TABLE telemetry IS 'Stores ISS telemetry data from NASA Lightstreamer feed (experimental)';
-COMMENT ON COLUMN telemetry.level IS 'Metric value (e.g., tank level percentage)';
+COMMENT ON COLUMN telemetry.level IS 'Metric value (e.g., tank level percentage); NULL for non-numeric items';
 COMMENT ON VIEW latest_iss_telemetry IS 'Shows the most recent reading for each metric';
 COMMENT ON VIEW iss_telemetry_summary IS 'Provides statistical summary of ISS telemetry data';
\ No newline at end of file
@@ -1,5 +1,6 @@
 -- Additional Views for Enhanced Pi Metrics Dashboard
--- Run this after environment_metrics.sql
+-- Run this after rollups.sql and environment_metrics.sql
+-- Aggregating views read the rollup tables maintained by scripts/rollup_metrics.py
 
 -- Comfort index calculation
 CREATE OR REPLACE VIEW pi_comfort_index AS
@@ -25,22 +26,29 @@ JOIN
   ON DATE_TRUNC('minute', t.timestamp) = DATE_TRUNC('minute', h.timestamp)
 WHERE t.timestamp > NOW() - INTERVAL '30 days';
 
--- Network quality metrics
+-- Network quality per ping target (hourly rollups). Latency comes from the
+-- prober's window medians (pi_ping_ok drops windows where every probe was
+-- lost); loss is the mean of the windows' ping_loss_percent.
 CREATE OR REPLACE VIEW pi_network_quality AS
 WITH ping_stats AS (
   SELECT
-    DATE_TRUNC('hour', timestamp) as hour,
-    AVG(value) FILTER (WHERE value > 0) as avg_ping,
-    MIN(value) FILTER (WHERE value > 0) as min_ping,
-    MAX(value) FILTER (WHERE value > 0) as max_ping,
-    COUNT(*) FILTER (WHERE value = -1)::float / COUNT(*)::float * 100 as packet_loss_pct
-  FROM pi_environment_metrics
-  WHERE metric = 'ping_response_time'
-    AND timestamp > NOW() - INTERVAL '7 days'
-  GROUP BY DATE_TRUNC('hour', timestamp)
+    r.bucket as hour,
+    s.labels->>'host' as host,
+    SUM(r.sum) FILTER (WHERE r.dataset = 'pi_ping_ok')
+      / NULLIF(SUM(r.count) FILTER (WHERE r.dataset = 'pi_ping_ok'), 0) as avg_ping,
+    MIN(r.min) FILTER (WHERE r.dataset = 'pi_ping_ok') as min_ping,
+    MAX(r.max) FILTER (WHERE r.dataset = 'pi_ping_ok') as max_ping,
+    SUM(r.sum) FILTER (WHERE r.dataset = 'pi_samples')
+      / NULLIF(SUM(r.count) FILTER (WHERE r.dataset = 'pi_samples'), 0) as packet_loss_pct
+  FROM rollup_1h r
+  JOIN series s ON s.id = (r.key->>'series_id')::int
+  WHERE (r.dataset = 'pi_ping_ok' OR (r.dataset = 'pi_samples' AND s.metric = 'ping_loss_percent'))
+    AND r.bucket > NOW() - INTERVAL '7 days'
+  GROUP BY r.bucket, s.labels->>'host'
 )
 SELECT 
   hour as timestamp,
+  host,
   avg_ping,
   min_ping,
   max_ping,
@@ -50,18 +58,38 @@ SELECT
     (1 - LEAST(packet_loss_pct / 20, 1))
   ) as network_quality_score
 FROM ping_stats
-ORDER BY hour DESC;
+ORDER BY hour DESC, host;
 
--- Latest network statistics
+-- Latest network statistics, one row per ping target seen in the last 24 hours
 CREATE OR REPLACE VIEW latest_network_stats AS
+WITH ping_24h AS (
+  SELECT
+    s.labels->>'host' as host,
+    SUM(r.sum) FILTER (WHERE r.dataset = 'pi_ping_ok')
+      / NULLIF(SUM(r.count) FILTER (WHERE r.dataset = 'pi_ping_ok'), 0) as avg_ping,
+    SUM(r.sum) FILTER (WHERE r.dataset = 'pi_samples')
+      / NULLIF(SUM(r.count) FILTER (WHERE r.dataset = 'pi_samples'), 0) as packet_loss
+  FROM rollup_1m r
+  JOIN series s ON s.id = (r.key->>'series_id')::int
+  WHERE (r.dataset = 'pi_ping_ok' OR (r.dataset = 'pi_samples' AND s.metric = 'ping_loss_percent'))
+    AND r.bucket > NOW() - INTERVAL '24 hours'
+  GROUP BY s.labels->>'host'
+),
+current_ping AS (
+  SELECT s.labels->>'host' as host, l.value
+  FROM latest_pi_metrics l
+  JOIN series s ON s.id = l.series_id
+  WHERE l.metric = 'ping_response_time'
+)
 SELECT
-  (SELECT value FROM latest_pi_metrics WHERE metric = 'ping_response_time' LIMIT 1) as current_ping_ms,
-  (SELECT AVG(value) FROM pi_environment_metrics 
-   WHERE metric = 'ping_response_time' AND value > 0 AND timestamp > NOW() - INTERVAL '24 hours') as avg_ping_24h,
-  (SELECT COUNT(*) FILTER (WHERE value = -1)::float / COUNT(*)::float * 100
-   FROM pi_environment_metrics WHERE metric = 'ping_response_time' AND timestamp > NOW() - INTERVAL '24 hours') as packet_loss_24h,
+  p.host,
+  c.value as current_ping_ms,
+  p.avg_ping as avg_ping_24h,
+  p.packet_loss as packet_loss_24h,
   (SELECT value FROM latest_pi_metrics WHERE metric = 'internet_download_speed_mbps' LIMIT 1) as download_mbps,
-  (SELECT value FROM latest_pi_metrics WHERE metric = 'internet_upload_speed_mbps' LIMIT 1) as upload_mbps;
+  (SELECT value FROM latest_pi_metrics WHERE metric = 'internet_upload_speed_mbps' LIMIT 1) as upload_mbps
+FROM ping_24h p
+LEFT JOIN current_ping c ON c.host = p.host;
 
 -- Environmental statistics
 CREATE OR REPLACE VIEW latest_environmental_stats AS
@@ -70,25 +98,47 @@ SELECT
   (SELECT value FROM latest_pi_metrics WHERE metric = 'room_humidity_percent' LIMIT 1) as current_humidity,
   (SELECT value FROM latest_pi_metrics WHERE metric = 'forecast_temperature_celsius' LIMIT 1) as forecast_temp,
   (SELECT value FROM latest_pi_metrics WHERE metric = 'forecast_humidity_percent' LIMIT 1) as forecast_humidity,
-  (SELECT AVG(value) FROM pi_environment_metrics 
-   WHERE metric = 'room_temperature_celsius' AND timestamp > NOW() - INTERVAL '24 hours') as avg_temp_24h,
-  (SELECT AVG(value) FROM pi_environment_metrics
-   WHERE metric = 'room_humidity_percent' AND timestamp > NOW() - INTERVAL '24 hours') as avg_humidity_24h;
+  (SELECT SUM(r.sum) / SUM(r.count) FROM rollup_1m r JOIN series s ON s.id = (r.key->>'series_id')::int
+   WHERE r.dataset = 'pi_samples' AND s.metric = 'room_temperature_celsius' AND r.bucket > NOW() - INTERVAL '24 hours') as avg_temp_24h,
+  (SELECT SUM(r.sum) / SUM(r.count) FROM rollup_1m r JOIN series s ON s.id = (r.key->>'series_id')::int
+   WHERE r.dataset = 'pi_samples' AND s.metric = 'room_humidity_percent' AND r.bucket > NOW() - INTERVAL '24 hours') as avg_humidity_24h;
 
 -- Hourly temperature heatmap data
 CREATE OR REPLACE VIEW pi_temp_heatmap AS
 SELECT
-  EXTRACT(HOUR FROM timestamp) as hour_of_day,
-  EXTRACT(DOW FROM timestamp) as day_of_week,
-  AVG(value) as avg_temperature
-FROM pi_environment_metrics
-WHERE metric = 'room_temperature_celsius'
-  AND timestamp > NOW() - INTERVAL '7 days'
-GROUP BY EXTRACT(HOUR FROM timestamp), EXTRACT(DOW FROM timestamp)
+  EXTRACT(HOUR FROM r.bucket) as hour_of_day,
+  EXTRACT(DOW FROM r.bucket) as day_of_week,
+  SUM(r.sum) / SUM(r.count) as avg_temperature
+FROM rollup_1h r
+JOIN series s ON s.id = (r.key->>'series_id')::int
+WHERE r.dataset = 'pi_samples'
+  AND s.metric = 'room_temperature_celsius'
+  AND r.bucket > NOW() - INTERVAL '7 days'
+GROUP BY EXTRACT(HOUR FROM r.bucket), EXTRACT(DOW FROM r.bucket)
 ORDER BY day_of_week, hour_of_day;
 
+-- Rolled-up metrics at every resolution, for dashboard time series:
+--   WHERE resolution = rollup_resolution($__timeFrom(), $__timeTo()) AND $__timeFilter(timestamp)
+CREATE OR REPLACE VIEW pi_metrics_rollup AS
+SELECT
+  r.dataset,
+  CASE WHEN r.dataset = 'pi4_samples' THEN 'pi4' ELSE 'pi' END as device,
+  r.resolution,
+  r.bucket as timestamp,
+  s.metric,
+  s.labels_text as labels,
+  r.count as reading_count,
+  r.sum / r.count as avg_value,
+  r.min as min_value,
+  r.max as max_value,
+  r.last_value
+FROM rollups r
+JOIN series s ON s.id = (r.key->>'series_id')::int
+WHERE r.dataset IN ('pi_samples', 'pi4_samples', 'pi_ping_ok');
+
 COMMENT ON VIEW pi_comfort_index IS 'Calculates comfort level based on temperature and humidity';
-COMMENT ON VIEW pi_network_quality IS 'Hourly network quality metrics with quality score';
-COMMENT ON VIEW latest_network_stats IS 'Current network statistics summary';
+COMMENT ON VIEW pi_network_quality IS 'Hourly network quality metrics with quality score, per ping target';
+COMMENT ON VIEW latest_network_stats IS 'Current network statistics summary, per ping target';
 COMMENT ON VIEW latest_environmental_stats IS 'Current environmental metrics summary';
-COMMENT ON VIEW pi_temp_heatmap IS 'Temperature patterns by hour of day and day of week';
\ No newline at end of file
+COMMENT ON VIEW pi_temp_heatmap IS 'Temperature patterns by hour of day and day of week';
+COMMENT ON VIEW pi_metrics_rollup IS 'Pi metric rollups (avg/min/max/last) at 1m, 1h and 1d resolution';
\ No newline at end of file
@@ -0,0 +1,63 @@
+-- Rollup Tables Schema
+-- Pre-aggregated 1-minute, 1-hour and 1-day buckets maintained incrementally
+-- by scripts/rollup_metrics.py. Run on asset_balances, environment_metrics and
+-- evernode_host_stats before their schema/view files, which read from these tables.
+--
+-- Each row aggregates one dataset key (e.g. {"series_id": 3}) over one bucket.
+-- Averages are sum / count, so buckets can be merged exactly at any resolution.
+
+-- Create the watermark table (raw rows up to the watermark are already folded in)
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    dataset TEXT PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+);
+
+-- Create the rollup tables
+CREATE TABLE IF NOT EXISTS rollup_1m (
+    dataset TEXT NOT NULL,                 -- Dataset name (e.g., pi_samples, xahau_balance)
+    key JSONB NOT NULL,                    -- Dataset key (series id, account, domain, ...)
+    bucket TIMESTAMP NOT NULL,             -- Bucket start
+    count BIGINT NOT NULL,                 -- Number of raw rows
+    sum DOUBLE PRECISION NOT NULL,
+    min DOUBLE PRECISION NOT NULL,
+    max DOUBLE PRECISION NOT NULL,
+    first_ts TIMESTAMP NOT NULL,           -- Earliest raw row in the bucket
+    last_ts TIMESTAMP NOT NULL,            -- Latest raw row in the bucket
+    last_value DOUBLE PRECISION NOT NULL,  -- Value of the latest raw row
+    PRIMARY KEY (dataset, key, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_1h (LIKE rollup_1m INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS rollup_1d (LIKE rollup_1m INCLUDING ALL);
+
+-- Create indexes for time-range scans per dataset
+CREATE INDEX IF NOT EXISTS idx_rollup_1m_dataset_bucket ON rollup_1m(dataset, bucket DESC);
+CREATE INDEX IF NOT EXISTS idx_rollup_1h_dataset_bucket ON rollup_1h(dataset, bucket DESC);
+CREATE INDEX IF NOT EXISTS idx_rollup_1d_dataset_bucket ON rollup_1d(dataset, bucket DESC);
+
+-- Pick a resolution for a dashboard time range (Grafana: $__timeFrom(), $__timeTo()).
+-- IMMUTABLE so the planner folds it and skips the other branches of `rollups`.
+CREATE OR REPLACE FUNCTION rollup_resolution(from_ts TIMESTAMPTZ, to_ts TIMESTAMPTZ)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN to_ts - from_ts <= INTERVAL '12 hours' THEN '1m'
+        WHEN to_ts - from_ts <= INTERVAL '60 days' THEN '1h'
+        ELSE '1d'
+    END
+$$;
+
+-- Create view over all resolutions
+CREATE OR REPLACE VIEW rollups AS
+SELECT '1m'::text AS resolution, r.* FROM rollup_1m r
+UNION ALL
+SELECT '1h'::text AS resolution, r.* FROM rollup_1h r
+UNION ALL
+SELECT '1d'::text AS resolution, r.* FROM rollup_1d r;
+
+COMMENT ON TABLE rollup_watermarks IS 'Per-dataset high-water mark of raw rows folded into the rollups';
+COMMENT ON TABLE rollup_1m IS 'Per-minute aggregates of raw rows, by dataset and key';
+COMMENT ON TABLE rollup_1h IS 'Per-hour aggregates of raw rows, by dataset and key';
+COMMENT ON TABLE rollup_1d IS 'Per-day aggregates of raw rows, by dataset and key';
+COMMENT ON VIEW rollups IS 'All rollup resolutions; filter on resolution = rollup_resolution(from, to)';
@@ -1,9 +1,9 @@
 -- Enhanced Views for Xahau Balances
--- Run on asset_balances database
+-- Run on asset_balances database (after rollups.sql)
 
 -- Latest Xahau balances per account
 CREATE OR REPLACE VIEW latest_xahau_balances AS
-SELECT DISTINCT ON (source, account, asset_type)
+SELECT
     id,
     source,
     account,
@@ -15,9 +15,8 @@ SELECT DISTINCT ON (source, account, asset_type)
     domain,
     ts,
     execution_id
-FROM asset_balances
-WHERE source = 'xahau'
-ORDER BY source, account, asset_type, ts DESC;
+FROM current_balances
+WHERE source = 'xahau';
 
 -- Xahau portfolio summary
 CREATE OR REPLACE VIEW xahau_portfolio_summary AS
@@ -59,18 +58,20 @@ FROM host_accounts
 GROUP BY host_name
 ORDER BY host_name;
 
--- Balance trends for time series
+-- Balance trends for time series (hourly rollups: last reading per hour)
 CREATE OR REPLACE VIEW xahau_balance_trends AS
 SELECT 
-    ts as timestamp,
-    name,
-    asset_type,
-    balance,
-    usd_value
-FROM asset_balances
-WHERE source = 'xahau'
-    AND ts > NOW() - INTERVAL '30 days'
-ORDER BY ts DESC;
+    b.bucket as timestamp,
+    (b.key->>'name')::varchar(255) as name,
+    (b.key->>'asset_type')::varchar(50) as asset_type,
+    b.last_value::numeric(30, 10) as balance,
+    u.last_value::numeric(30, 2) as usd_value
+FROM rollup_1h b
+LEFT JOIN rollup_1h u
+    ON u.dataset = 'xahau_usd_value' AND u.key = b.key AND u.bucket = b.bucket
+WHERE b.dataset = 'xahau_balance'
+    AND b.bucket > NOW() - INTERVAL '30 days'
+ORDER BY b.bucket DESC;
 
 -- Account-level summary (main vs reputationd)
 CREATE OR REPLACE VIEW xahau_account_summary AS
@@ -90,5 +91,5 @@ ORDER BY name;
 COMMENT ON VIEW latest_xahau_balances IS 'Most recent balance for each Xahau account';
 COMMENT ON VIEW xahau_portfolio_summary IS 'Total portfolio metrics across all accounts';
 COMMENT ON VIEW xahau_balance_by_host IS 'Aggregated balances per host (main + reputationd)';
-COMMENT ON VIEW xahau_balance_trends IS 'Historical balance data for time series';
+COMMENT ON VIEW xahau_balance_trends IS 'Hourly balance history for time series (from rollup_1h)';
 COMMENT ON VIEW xahau_account_summary IS 'Per-account summary with account type classification';
\ No newline at end of file
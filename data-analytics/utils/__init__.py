@@ -1,18 +1,49 @@
 """
 Shared utilities for the data collection system
+
+Names are imported from their submodules on first use (PEP 562), so
+`import utils.series` or `from utils import BalanceWriter` doesn't pull in
+pycoingecko, requests or sqlite3 for collectors that never touch prices.
 """
-from .common import (
-    make_request_with_retry,
-    safe_hex_to_str,
-    ttl_cache,
-    get_usd_price,
-    decode_currency_code
-)
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'make_request_with_retry': 'common',
+    'safe_hex_to_str': 'common',
+    'ttl_cache': 'common',
+    'get_usd_price': 'common',
+    'get_usd_prices': 'common',
+    'get_usd_prices_by_id': 'common',
+    'get_coin_index': 'common',
+    'resolve_coin_id': 'common',
+    'decode_currency_code': 'common',
+    'get_coingecko': 'common',
+    'get_price_cache': 'common',
+    'TokenBucket': 'rate_limit',
+    'get_rate_limiter': 'rate_limit',
+    'BalanceWriter': 'db',
+    'copy_rows': 'db',
+    'ConnectionPool': 'db',
+    'get_pool': 'db',
+    'close_pools': 'db',
+    'execute_prepared': 'db',
+    'get_session': 'http',
+    'PriceCache': 'price_cache',
+    'CoinIndex': 'coin_index'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = [
-    'make_request_with_retry',
-    'safe_hex_to_str',
-    'ttl_cache',
-    'get_usd_price',
-    'decode_currency_code'
-]
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
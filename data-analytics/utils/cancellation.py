@@ -0,0 +1,88 @@
+"""
+Cooperative cancellation for scheduled collector runs
+
+The scheduler runs each job under a CancelToken and cancels it when the
+run times out or the process shuts down. Collectors call checkpoint()
+between units of work (accounts, pages, batches, datasets) and sleep()
+for their pauses, so a cancelled run stops with Cancelled at the next
+boundary rather than in the middle of a pool checkout, a lock or a
+transaction. Outside the scheduler there is no token: checkpoint() does
+nothing and sleep() is time.sleep().
+
+Usage:
+    for account in accounts:
+        cancellation.checkpoint()
+        ...
+    with ThreadPoolExecutor() as pool:
+        pool.submit(cancellation.bind(process_account), account)
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_token = contextvars.ContextVar('cancel_token', default=None)
+
+
+class Cancelled(BaseException):
+    """Raised at a checkpoint once the current run has been cancelled
+
+    Derives from BaseException so collectors' `except Exception` handlers
+    don't swallow it; `with` blocks and `finally` clauses still run.
+    """
+
+
+class CancelToken:
+    """Cancellation flag for one run; cancel() may be called from any thread"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self, reason):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    def check(self):
+        if self.event.is_set():
+            raise Cancelled(self.reason)
+
+
+@contextmanager
+def scope(token):
+    """Make `token` the current run's token for the `with` block (in this thread)"""
+    reset = _token.set(token)
+    try:
+        yield token
+    finally:
+        _token.reset(reset)
+
+
+def bind(func):
+    """Wrap `func` to run under the caller's token, for worker threads (contextvars don't follow submit())"""
+    token = _token.get()
+
+    def run(*args, **kwargs):
+        with scope(token):
+            return func(*args, **kwargs)
+    return run
+
+
+def checkpoint():
+    """Raise Cancelled if the current run has been cancelled"""
+    token = _token.get()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds):
+    """time.sleep() that ends early, raising Cancelled, when the current run is cancelled"""
+    token = _token.get()
+    if token is None:
+        time.sleep(seconds)
+    elif token.event.wait(seconds):
+        raise Cancelled(token.reason)
@@ -0,0 +1,119 @@
+"""
+Local index mapping token symbols and contract addresses to CoinGecko ids
+"""
+import json
+import os
+import time
+
+
+class CoinIndex:
+    """
+    On-disk symbol/contract → CoinGecko id index
+
+    Built from CoinGecko's coin list (with platform contract addresses) and
+    stored as JSON. Refreshes merge the latest list into the existing index
+    instead of replacing it, so a failed or partial refresh never loses
+    known mappings. Lookups are plain dict hits with no network access.
+    A failed refresh is not retried for `retry_interval` seconds, so while
+    CoinGecko is down a stale index costs one attempt per interval rather
+    than one per lookup.
+    """
+    def __init__(self, path, max_age=86400, platform='ethereum', retry_interval=900):
+        self.path = path
+        self.max_age = max_age
+        self.platform = platform
+        self.retry_interval = retry_interval
+        self.last_attempt = None  # time.monotonic() of the last refresh attempt in this process
+        self.coins = {}       # coin_id -> [symbol, contract or None]
+        self.updated = 0
+        self.by_contract = {}
+        self.by_symbol = {}
+        self.load()
+
+    def load(self):
+        """Load the index from disk if present"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.coins = data.get("coins", {})
+            self.updated = data.get("updated", 0)
+        except (OSError, ValueError):
+            self.coins = {}
+            self.updated = 0
+        self._build_lookups()
+
+    def _build_lookups(self):
+        self.by_contract = {}
+        symbol_ids = {}
+        for coin_id, (symbol, contract) in self.coins.items():
+            if contract:
+                self.by_contract[contract.lower()] = coin_id
+            symbol_ids.setdefault(symbol.upper(), set()).add(coin_id)
+        # Only unambiguous symbols resolve by symbol alone
+        self.by_symbol = {
+            symbol: next(iter(ids)) for symbol, ids in symbol_ids.items() if len(ids) == 1
+        }
+
+    def save(self):
+        """Atomically write the index to disk"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"updated": self.updated, "coins": self.coins}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_stale(self):
+        return time.time() - self.updated >= self.max_age
+
+    def refresh(self, cg):
+        """
+        Merge CoinGecko's current coin list into the index
+
+        Args:
+            cg: CoinGeckoAPI client
+
+        Returns:
+            int: Number of new or changed entries
+        """
+        changed = 0
+        for coin in cg.get_coins_list(include_platform='true'):
+            contract = (coin.get("platforms") or {}).get(self.platform) or None
+            entry = [coin.get("symbol", ""), contract]
+            if self.coins.get(coin["id"]) != entry:
+                self.coins[coin["id"]] = entry
+                changed += 1
+        self.updated = time.time()
+        self._build_lookups()
+        self.save()
+        return changed
+
+    def ensure_fresh(self, cg):
+        """Refresh the index if it is older than max_age, keeping the old copy on failure"""
+        if not self.is_stale():
+            return
+        now = time.monotonic()
+        if self.last_attempt is not None and now - self.last_attempt < self.retry_interval:
+            return
+        self.last_attempt = now
+        try:
+            changed = self.refresh(cg)
+            print(f"Coin index refreshed ({changed} new/changed, {len(self.coins)} total)")
+        except Exception as e:
+            print(f"⚠️ Coin index refresh error: {str(e)} (next attempt in {self.retry_interval}s)")
+
+    def resolve(self, symbol, contract=None):
+        """
+        Look up the CoinGecko id for a token
+
+        Args:
+            symbol: Token symbol
+            contract: Token contract address on the index platform (optional)
+
+        Returns:
+            str: CoinGecko id, or None if the token is unknown or ambiguous
+        """
+        if contract:
+            coin_id = self.by_contract.get(contract.lower())
+            if coin_id:
+                return coin_id
+        return self.by_symbol.get(symbol.upper()) if symbol else None
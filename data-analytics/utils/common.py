@@ -1,44 +1,307 @@
 """
 Common utility functions shared across data collection scripts
 """
+import functools
+import os
+import threading
 import time
 import random
+from collections import OrderedDict
 from binascii import Error as BinasciiError
-from pycoingecko import CoinGeckoAPI
-from config import ASSET_MAP
+from config import ASSET_MAP, CacheConfig
+from . import cancellation
+from .metrics import API_SECONDS, counter
 
-# Initialize CoinGecko client
-cg = CoinGeckoAPI()
+# CoinGecko client and host-wide price cache, built on first use so that
+# importing this module doesn't load pycoingecko or open the cache
+_cg = None
+_price_cache = None
+_clients_lock = threading.Lock()
+
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+_coin_index = None
+_coin_index_lock = threading.Lock()
+
+RETRIES = counter('request_retries_total', "Rate-limited requests retried by make_request_with_retry")
+RETRIES_EXHAUSTED = counter('request_retries_exhausted_total',
+                            "Requests still rate limited after make_request_with_retry's last attempt")
+PRICE_DISK_LOOKUPS = counter('price_disk_cache_lookups_total',
+                             "Shared disk price cache lookups by result (fresh, stale, miss)", ('result',))
+
+
+def get_coingecko():
+    """Shared CoinGeckoAPI client, created on first use"""
+    global _cg
+    with _clients_lock:
+        if _cg is None:
+            from pycoingecko import CoinGeckoAPI
+            _cg = CoinGeckoAPI()
+        return _cg
+
+
+def get_price_cache():
+    """Host-wide price cache shared with other collector processes, opened on first use"""
+    global _price_cache
+    with _clients_lock:
+        if _price_cache is None:
+            from .price_cache import PriceCache
+            _price_cache = PriceCache(
+                os.path.join(CacheConfig.DIR, 'prices.sqlite'),
+                ttl=CacheConfig.PRICE_TTL,
+                max_stale=CacheConfig.PRICE_MAX_STALE
+            )
+        return _price_cache
 
 
 class ttl_cache:
-    """Custom TTL cache with LRU eviction for price data"""
+    """
+    Thread-safe LRU cache with per-entry TTL for price data
+
+    Entries live in an OrderedDict kept in recency order, so lookups, LRU
+    eviction and expiry are all O(1). Because every entry shares the same
+    TTL, a second OrderedDict in insertion order lets expired entries be
+    purged from its head on each insert.
+    """
+    _KWARGS_MARK = object()
+
     def __init__(self, maxsize=128, ttl=300):
         self.maxsize = maxsize
         self.ttl = ttl
-        self.cache = {}
+        self.cache = OrderedDict()    # key -> (value, expires_at), LRU order
+        self.expiries = OrderedDict()  # key -> expires_at, insertion order
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def __call__(self, func):
-        def wrapped_func(arg):
-            now = time.time()
-            if arg in self.cache:
-                value, timestamp = self.cache[arg]
-                if now - timestamp < self.ttl:
-                    return value
-            value = func(arg)
-            if len(self.cache) >= self.maxsize:
-                oldest_key = min(self.cache, key=lambda k: self.cache[k][1])
+    @classmethod
+    def make_key(cls, *args, **kwargs):
+        """Build a hashable key from positional and keyword arguments"""
+        if not kwargs:
+            return args
+        return args + (cls._KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+
+    def get(self, key):
+        """
+        Look up a key, counting the hit or miss
+
+        Returns:
+            tuple: (found, value)
+        """
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.cache[key]
+                del self.expiries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        """Store a value, purging expired entries and evicting the LRU entry if full"""
+        with self.lock:
+            now = time.monotonic()
+            while self.expiries:
+                oldest_key, expires_at = next(iter(self.expiries.items()))
+                if expires_at > now:
+                    break
+                del self.expiries[oldest_key]
                 del self.cache[oldest_key]
-            self.cache[arg] = (value, now)
+
+            expires_at = now + self.ttl
+            self.cache[key] = (value, expires_at)
+            self.cache.move_to_end(key)
+            self.expiries[key] = expires_at
+            self.expiries.move_to_end(key)
+
+            while len(self.cache) > self.maxsize:
+                lru_key, _ = self.cache.popitem(last=False)
+                del self.expiries[lru_key]
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self.lock:
+            self.cache.clear()
+            self.expiries.clear()
+
+    def info(self):
+        """Return hit/miss/eviction counters and current size"""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.cache),
+                "maxsize": self.maxsize
+            }
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapped_func(*args, **kwargs):
+            key = self.make_key(*args, **kwargs)
+            found, value = self.get(key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            self.set(key, value)
             return value
+        wrapped_func.cache = self
+        wrapped_func.cache_info = self.info
+        wrapped_func.cache_clear = self.clear
         return wrapped_func
 
 
+def _fetch_usd_prices(coin_ids, attempts=3):
+    """Fetch prices for several coins in one CoinGecko call and store them in the disk cache"""
+    for attempt in range(attempts):
+        try:
+            with API_SECONDS.time(api='coingecko'):
+                price_data = get_coingecko().get_price(ids=sorted(coin_ids), vs_currencies='usd')
+            prices = {}
+            for coin_id in coin_ids:
+                price = price_data.get(coin_id, {}).get('usd')
+                if price is not None:
+                    get_price_cache().set(coin_id, price)
+                prices[coin_id] = price
+            return prices
+        except Exception as e:
+            print(f"⚠️ Price check error for {', '.join(sorted(coin_ids))}: {str(e)}")
+            if attempt < attempts - 1:
+                time.sleep(random.uniform(10, 14))
+    return {coin_id: None for coin_id in coin_ids}
+
+
+def _revalidate_in_background(coin_ids):
+    """Refresh stale disk-cache entries without blocking the caller"""
+    with _revalidating_lock:
+        coin_ids = set(coin_ids) - _revalidating
+        if not coin_ids:
+            return
+        _revalidating.update(coin_ids)
+
+    def refresh():
+        try:
+            _fetch_usd_prices(coin_ids, attempts=1)
+        finally:
+            with _revalidating_lock:
+                _revalidating.difference_update(coin_ids)
+
+    threading.Thread(target=refresh, name="price-refresh").start()
+
+
+def get_usd_prices_by_id(coin_ids):
+    """
+    Resolve USD prices for many CoinGecko ids with at most one API call
+    
+    Fresh disk-cache entries are used as-is, stale ones are returned while
+    a single background refresh runs, and every remaining id is fetched
+    together in one synchronous get_price request.
+    
+    Args:
+        coin_ids: Iterable of CoinGecko coin ids
+        
+    Returns:
+        dict: coin_id -> USD price (None if unavailable)
+    """
+    price_cache = get_price_cache()
+    prices = {}
+    stale = []
+    missing = []
+    for coin_id in set(filter(None, coin_ids)):
+        cached_price, age = price_cache.get(coin_id)
+        if price_cache.is_fresh(age):
+            prices[coin_id] = cached_price
+        elif price_cache.is_servable(age):
+            prices[coin_id] = cached_price
+            stale.append(coin_id)
+        else:
+            missing.append(coin_id)
+    
+    PRICE_DISK_LOOKUPS.inc(len(prices) - len(stale), result='fresh')
+    PRICE_DISK_LOOKUPS.inc(len(stale), result='stale')
+    PRICE_DISK_LOOKUPS.inc(len(missing), result='miss')
+    if stale:
+        _revalidate_in_background(stale)
+    if missing:
+        prices.update(_fetch_usd_prices(missing))
+    return prices
+
+
+def get_usd_prices(asset_symbols):
+    """
+    Resolve USD prices for several asset symbols in one batch
+    
+    Results also populate the in-memory cache used by get_usd_price, so
+    later per-symbol lookups in the same run are free.
+    
+    Args:
+        asset_symbols: Iterable of asset symbols (e.g., ['XAH', 'EVR'])
+        
+    Returns:
+        dict: symbol -> USD price (None if not found)
+    """
+    symbols = {symbol.upper() for symbol in asset_symbols}
+    coin_ids = {symbol: ASSET_MAP.get(symbol) for symbol in symbols}
+    prices_by_id = get_usd_prices_by_id(coin_ids.values())
+    
+    prices = {}
+    for symbol, coin_id in coin_ids.items():
+        prices[symbol] = prices_by_id.get(coin_id) if coin_id else None
+        get_usd_price.cache.set(ttl_cache.make_key(symbol), prices[symbol])
+    return prices
+
+
+def get_coin_index():
+    """Get the shared symbol/contract → CoinGecko id index, refreshing it if stale"""
+    global _coin_index
+    with _coin_index_lock:
+        if _coin_index is None:
+            from .coin_index import CoinIndex
+            _coin_index = CoinIndex(
+                os.path.join(CacheConfig.DIR, 'coin_index.json'),
+                max_age=CacheConfig.COIN_INDEX_MAX_AGE,
+                retry_interval=CacheConfig.COIN_INDEX_RETRY
+            )
+        _coin_index.ensure_fresh(get_coingecko())
+        return _coin_index
+
+
+def resolve_coin_id(asset_symbol, contract=None):
+    """
+    Resolve an asset to its CoinGecko id without any price request
+    
+    config.ASSET_MAP takes precedence, then the contract address, then an
+    unambiguous symbol match in the local coin index.
+    
+    Args:
+        asset_symbol: Asset symbol (e.g., 'EVR', 'USDC')
+        contract: Token contract address (optional)
+        
+    Returns:
+        str: CoinGecko id or None if unknown
+    """
+    coin_id = ASSET_MAP.get(asset_symbol.upper()) if asset_symbol else None
+    if coin_id:
+        return coin_id
+    return get_coin_index().resolve(asset_symbol, contract)
+
+
 @ttl_cache(maxsize=10, ttl=300)  # Cache 10 prices for 5 minutes
 def get_usd_price(asset_symbol):
     """
     Get USD price from CoinGecko with caching and TTL
     
+    Prices are read through the on-disk cache shared by all collector
+    processes (see get_usd_prices_by_id). Use get_usd_prices to resolve
+    several symbols with a single request.
+    
     Args:
         asset_symbol: Asset symbol (e.g., 'XAH', 'EVR', 'XRP')
         
@@ -48,15 +311,13 @@ def get_usd_price(asset_symbol):
     coin_id = ASSET_MAP.get(asset_symbol.upper())
     if not coin_id:
         return None
-    
-    for _ in range(3):
-        try:
-            price_data = cg.get_price(ids=coin_id, vs_currencies='usd')
-            return price_data.get(coin_id, {}).get('usd')
-        except Exception as e:
-            print(f"⚠️ Price check error for {asset_symbol}: {str(e)}")
-            time.sleep(random.uniform(10, 14))
-    return None
+    return get_usd_prices_by_id([coin_id]).get(coin_id)
+
+
+# Read from get_usd_price's own counters when metrics are rendered
+counter('price_memory_cache_lookups_total', "get_usd_price in-process cache lookups by result", ('result',),
+        function=lambda: {(result,): get_usd_price.cache_info()[key]
+                          for result, key in (('hit', 'hits'), ('miss', 'misses'))})
 
 
 def make_request_with_retry(request_func, max_retries=5, initial_delay=1):
@@ -81,9 +342,11 @@ def make_request_with_retry(request_func, max_retries=5, initial_delay=1):
             if 'rate limit' in str(e).lower() or 'too many' in str(e).lower():
                 delay = initial_delay * (2 ** attempt) + random.uniform(0, 1)
                 print(f"⚠️ Rate limited. Retry {attempt+1}/{max_retries} in {delay:.1f}s")
-                time.sleep(delay)
+                RETRIES.inc()
+                cancellation.sleep(delay)
             else:
                 raise
+    RETRIES_EXHAUSTED.inc()
     raise Exception("🚨 Max retries exceeded")
 
 
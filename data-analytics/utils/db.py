@@ -0,0 +1,495 @@
+"""
+Database helpers shared across data collection scripts
+"""
+import atexit
+import io
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extensions import STATUS_READY
+from psycopg2.pool import PoolError
+
+from config import DatabaseConfig
+
+BALANCE_COLUMNS = (
+    "source", "account", "name", "asset_type", "balance",
+    "usd_price", "usd_value", "domain", "ts", "execution_id"
+)
+# Array type per column: rows are sent as one array per column, so the
+# statement text is the same for every batch size and can be prepared
+_BALANCE_ARRAY_TYPES = (
+    "text[]", "text[]", "text[]", "text[]", "numeric[]",
+    "numeric[]", "numeric[]", "text[]", "timestamp[]", "int8[]"
+)
+
+_CURRENT_KEY = ("source", "account", "asset_type")
+_CURRENT_UPDATES = ", ".join(
+    f"{col} = EXCLUDED.{col}" for col in ("id",) + BALANCE_COLUMNS if col not in _CURRENT_KEY
+)
+
+# History insert plus write-through upsert of current_balances in one
+# statement; the newest row per key wins, both within the batch and
+# against rows already stored
+BALANCE_INSERT_SQL = f"""
+WITH inserted AS (
+    INSERT INTO asset_balances ({', '.join(BALANCE_COLUMNS)})
+    SELECT * FROM unnest({', '.join('%s::' + t for t in _BALANCE_ARRAY_TYPES)})
+    RETURNING id, {', '.join(BALANCE_COLUMNS)}
+)
+INSERT INTO current_balances AS c (id, {', '.join(BALANCE_COLUMNS)})
+SELECT DISTINCT ON (source, account, asset_type) id, {', '.join(BALANCE_COLUMNS)}
+FROM inserted
+ORDER BY source, account, asset_type, ts DESC, id DESC
+ON CONFLICT (source, account, asset_type) DO UPDATE SET
+    {_CURRENT_UPDATES}
+WHERE EXCLUDED.ts >= c.ts
+"""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that tracks its age, last use and prepared statements"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared = None  # Set of statement names when preparing is enabled
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to one database
+
+    Connections are opened on demand, up to `maxconn`; once all are in use
+    callers wait up to `timeout` seconds for one to be returned. Returned
+    connections are kept open for the next caller, so collectors sharing a
+    process (see scripts/scheduler.py) reuse sessions instead of paying a
+    connect, authentication and backend start per write.
+
+    A connection idle for more than `check_after` seconds is health-checked
+    with `SELECT 1` before it is handed out, and one older than
+    `max_lifetime` seconds is closed and replaced, so server restarts,
+    dropped NAT mappings and slowly growing backends don't outlive the
+    pool. With `prepare`, execute_prepared() keeps server-side prepared
+    statements on each connection.
+
+    Usage:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                ...
+    """
+    def __init__(self, db_config, maxconn=4, timeout=30, max_lifetime=3600,
+                 check_after=30, prepare=False):
+        self.db_config = db_config
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.prepare = prepare
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+
+    def _expired(self, conn, now):
+        return self.max_lifetime and now - conn.created_at > self.max_lifetime
+
+    def _healthy(self, conn, now):
+        """Check an idle connection before reuse; returns False if it should be discarded"""
+        if conn.closed or self._expired(conn, now):
+            return False
+        if now - conn.last_used <= self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=PooledConnection, **self.db_config)
+        if self.prepare:
+            conn.prepared = set()
+        return conn
+
+    def getconn(self):
+        """
+        Take a healthy connection, opening a new one if none is idle
+
+        Raises:
+            PoolError: If no connection is returned within `timeout` seconds
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No connection to {self.db_config['dbname']} "
+                            f"available after {self.timeout:g}s")
+        try:
+            while True:
+                with self.lock:
+                    conn = self.idle.pop() if self.idle else None
+                if conn is None:
+                    return self._connect()
+                if self._healthy(conn, time.monotonic()):
+                    return conn
+                conn.close()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """Return a connection, rolling back any open transaction; broken or expired ones are closed"""
+        try:
+            if conn.closed:
+                return
+            now = time.monotonic()
+            if not discard and conn.status != STATUS_READY:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            if discard or self._expired(conn, now):
+                conn.close()
+            else:
+                conn.last_used = now
+                with self.lock:
+                    self.idle.append(conn)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with block
+
+        Like `with psycopg2.connect(...) as conn`, the transaction is
+        committed when the block exits normally and rolled back on an
+        exception; the connection then goes back to the pool.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.putconn(conn, discard)
+
+    def close(self):
+        """Close every idle connection"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dbname):
+    """
+    Process-wide connection pool for a database, created on first use
+
+    Prefer DatabaseConfig.get_pool(), which also accepts setting names.
+
+    Args:
+        dbname: Database name (e.g. DatabaseConfig.ASSET_BALANCES)
+
+    Returns:
+        ConnectionPool: The same pool for every caller in the process
+    """
+    with _pools_lock:
+        pool = _pools.get(dbname)
+        if pool is None:
+            if not _pools:
+                atexit.register(close_pools)
+            pool = _pools[dbname] = ConnectionPool(
+                DatabaseConfig.get_db_config(dbname),
+                maxconn=DatabaseConfig.POOL_SIZE,
+                timeout=DatabaseConfig.POOL_TIMEOUT,
+                max_lifetime=DatabaseConfig.POOL_MAX_LIFETIME,
+                check_after=DatabaseConfig.POOL_CHECK_AFTER,
+                prepare=DatabaseConfig.POOL_PREPARE
+            )
+        return pool
+
+
+def close_pools():
+    """Close idle connections in every pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+# %s placeholders with an optional type cast, e.g. %s::timestamptz[]
+_PLACEHOLDER = re.compile(r"%s(::\w+(?:\[\])?)?")
+
+
+def execute_prepared(cur, name, sql, params):
+    """
+    Run a statement, as a server-side prepared statement where enabled
+
+    On a pooled connection with preparing enabled (DB_POOL_PREPARE), the
+    statement is PREPAREd under `name` the first time it runs on that
+    connection and EXECUTEd afterwards, so Postgres parses and plans it
+    once per session. Anywhere else it runs as an ordinary query. Write
+    array parameters with an explicit cast (`%s::numeric[]`): EXECUTE
+    arguments only get assignment casts, and an all-NULL list is sent as
+    text[].
+
+    Args:
+        cur: psycopg2 cursor
+        name: Statement name, unique per statement text
+        sql: Statement with %s placeholders (no other % characters)
+        params: Sequence of parameter values
+    """
+    prepared = getattr(cur.connection, "prepared", None)
+    if prepared is None:
+        cur.execute(sql, params)
+        return
+    casts = [match.group(1) or "" for match in _PLACEHOLDER.finditer(sql)]
+    if name not in prepared:
+        numbers = iter(range(1, len(casts) + 1))
+        body = _PLACEHOLDER.sub(lambda match: f"${next(numbers)}{match.group(1) or ''}", sql)
+        cur.execute(f"PREPARE {name} AS {body}")
+        # Prepared statements belong to the session and survive rollbacks
+        prepared.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join('%s' + cast for cast in casts)})", params)
+
+
+# Errors caused by the values of a row (CHECK, NOT NULL, VARCHAR length,
+# numeric overflow) rather than by the connection or the statement
+_ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+
+class BalanceWriter:
+    """
+    Buffered writer for asset_balances rows
+
+    Rows are collected for a single execution_id and written with one
+    statement (prepared, on pools with DB_POOL_PREPARE) and one commit per
+    flush. The same statement
+    upserts current_balances, so the latest-value table never disagrees
+    with the history. A flush happens when
+    the buffer reaches `max_rows`, when the oldest buffered row is older than
+    `max_age` seconds, or when the writer is closed. If a row is rejected
+    (e.g. a negative balance or an over-long asset symbol), the batch is
+    retried row by row and only the rejected rows are dropped. With
+    `metrics` (a utils.metrics.Collector), each flush is timed as `insert`
+    and `commit` stages, committed and discarded rows are counted, and a
+    flush that discards rows marks the run as failed.
+    """
+    def __init__(self, conn, execution_id, max_rows=1000, max_age=60, metrics=None):
+        self.conn = conn
+        self.execution_id = execution_id
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.metrics = metrics
+        self.rows = []
+        self.first_added = None
+        self.written = 0
+        self.lock = threading.Lock()
+        self._naive_utc = (None, None)  # (aware ts, naive UTC ts) of the last add()
+
+    def add(self, source, account, name, asset_type, balance,
+            usd_price=None, usd_value=None, domain=None, ts=None):
+        """
+        Buffer one balance row, flushing if a threshold is reached
+
+        Args:
+            source: Blockchain source (xrpl, xahau, ethereum)
+            account: Wallet address
+            name: Account nickname
+            asset_type: Asset symbol
+            balance: Token balance
+            usd_price: USD price per token (optional)
+            usd_value: Total USD value (optional)
+            domain: Account domain (optional)
+            ts: Collection timestamp (defaults to now, UTC)
+        """
+        if ts is None:
+            ts = datetime.now(timezone.utc)
+        if ts.tzinfo is not None:
+            # `ts` is a TIMESTAMP column holding UTC; sent as timestamptz it
+            # would be converted to the session's TimeZone instead. Rows of
+            # one account share a timestamp, so the last conversion is reused.
+            cached = self._naive_utc
+            if cached[0] is not ts:
+                cached = self._naive_utc = (ts, ts.astimezone(timezone.utc).replace(tzinfo=None))
+            ts = cached[1]
+        with self.lock:
+            if not self.rows:
+                self.first_added = time.monotonic()
+            self.rows.append((source, account, name, asset_type, balance,
+                              usd_price, usd_value, domain, ts, self.execution_id))
+            due = (len(self.rows) >= self.max_rows
+                   or time.monotonic() - self.first_added >= self.max_age)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows in a single transaction
+
+        Returns:
+            int: Number of rows written (0 if the batch failed)
+        """
+        with self.lock:
+            rows, self.rows = self.rows, []
+            if not rows:
+                return 0
+            try:
+                try:
+                    with self._stage("insert"), self.conn.cursor() as cur:
+                        execute_prepared(cur, "insert_balances", BALANCE_INSERT_SQL,
+                                         [list(column) for column in zip(*rows)])
+                    kept = rows
+                except _ROW_ERRORS as e:
+                    # One bad row fails the whole statement; only drop the rows that fail
+                    print(f"Database error: {str(e).strip()} (retrying {len(rows)} rows one at a time)")
+                    self.conn.rollback()
+                    with self._stage("insert"):
+                        kept = self._insert_each(rows)
+                with self._stage("commit"):
+                    self.conn.commit()
+            except psycopg2.Error as e:
+                print(f"Database error: {str(e)} ({len(rows)} rows discarded)")
+                self.conn.rollback()
+                if self.metrics:
+                    self.metrics.rows_discarded("asset_balances", len(rows))
+                return 0
+            self.written += len(kept)
+            if self.metrics:
+                self.metrics.rows_written("asset_balances", len(kept))
+                if len(kept) < len(rows):
+                    self.metrics.rows_discarded("asset_balances", len(rows) - len(kept))
+            return len(kept)
+
+    def _insert_each(self, rows):
+        """
+        Insert rows one statement each, under a savepoint per row
+
+        Rows rejected by a constraint or column type are rolled back to
+        their savepoint and logged; the rest stay in the transaction.
+
+        Returns:
+            list: The rows that were inserted
+        """
+        kept = []
+        with self.conn.cursor() as cur:
+            for row in rows:
+                cur.execute("SAVEPOINT balance_row")
+                try:
+                    execute_prepared(cur, "insert_balances", BALANCE_INSERT_SQL,
+                                     [[value] for value in row])
+                except _ROW_ERRORS as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT balance_row")
+                    source, account, _, asset_type, balance = row[:5]
+                    print(f"Database error: {str(e).strip()} "
+                          f"(discarded {source} {account} {asset_type} {balance})")
+                    continue
+                cur.execute("RELEASE SAVEPOINT balance_row")
+                kept.append(row)
+        return kept
+
+    def _stage(self, stage):
+        return self.metrics.stage(stage) if self.metrics else nullcontext()
+
+    def close(self):
+        """Flush any remaining rows"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def copy_text_value(value):
+    """
+    Encode a Python value as a COPY text-format field
+
+    Args:
+        value: Field value (None becomes NULL; dicts/lists become JSON)
+
+    Returns:
+        str: Escaped field
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+
+class IteratorStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks, for copy_expert"""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def copy_rows(cur, table, columns, rows):
+    """
+    Stream rows into a table with COPY FROM STDIN (text format)
+
+    Rows are encoded lazily as COPY pulls data, so memory stays flat no
+    matter how many rows the iterable yields.
+
+    Args:
+        cur: psycopg2 cursor
+        table: Target table name
+        columns: Column names, in row order
+        rows: Iterable of row sequences
+
+    Returns:
+        int: Number of rows copied
+    """
+    count = 0
+
+    def encoded():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield ("\t".join(copy_text_value(v) for v in row) + "\n").encode("utf-8")
+
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        io.BufferedReader(IteratorStream(encoded()), buffer_size=65536)
+    )
+    return count
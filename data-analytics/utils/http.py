@@ -0,0 +1,36 @@
+"""
+Shared HTTP session for data collection scripts
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTPConfig
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Process-wide requests.Session, created on first use
+
+    The session keeps up to HTTPConfig.POOL_SIZE keep-alive connections per
+    host, so collectors running in the same process (see
+    scripts/scheduler.py) reuse TCP and TLS connections to the APIs they
+    poll instead of opening new ones on every run.
+
+    Returns:
+        requests.Session: The same session for every caller in the process
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTPConfig.POOL_SIZE,
+                                  pool_maxsize=HTTPConfig.POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
@@ -0,0 +1,102 @@
+"""
+Account snapshots for XRPL-protocol ledgers (XRPL and Xahau)
+
+Both networks speak the same JSON-RPC API and their Python SDKs share the
+same request models, so the collectors pass in their own `models` module
+(xrpl.models or xahau.models) and a `send` callable that applies their
+rate limiting and retries.
+"""
+from collections import namedtuple
+
+from .common import safe_hex_to_str
+
+DROPS_PER_UNIT = 1_000_000  # XRP and XAH both have 6 decimal places
+
+AccountSnapshot = namedtuple(
+    "AccountSnapshot", ["address", "ledger_index", "balance", "domain", "flags", "lines"]
+)
+
+
+class LedgerRequestError(Exception):
+    """The server answered with an error (e.g. actNotFound) instead of a result"""
+
+
+def checked_result(response):
+    """Return a response's result, raising LedgerRequestError for error responses"""
+    if not response.is_successful():
+        result = response.result
+        raise LedgerRequestError(result.get("error_message") or result.get("error") or str(result))
+    return response.result
+
+
+def iter_account_lines(send, models, address, ledger_index, limit=None):
+    """
+    Yield an account's trust lines, one account_lines page at a time
+
+    Follows the response `marker` until the last page, so accounts with
+    more lines than one page holds are read completely, and only one page
+    is held in memory. The next page is only requested once the caller has
+    consumed the current one. Every page reads the same `ledger_index`,
+    which must be a fixed (validated) ledger for the marker to stay valid.
+
+    Args:
+        send: Callable taking a request model and returning its response
+        models: Module with AccountLines (xrpl.models or xahau.models)
+        address: Account address
+        ledger_index: Ledger sequence number to read
+        limit: Lines per page (servers clamp it to 10-400; None for the server default)
+
+    Yields:
+        dict: Raw account_lines entries
+
+    Raises:
+        LedgerRequestError: If a page request returns an error
+    """
+    marker = None
+    while True:
+        result = checked_result(send(models.AccountLines(
+            account=address, ledger_index=ledger_index, limit=limit, marker=marker
+        )))
+        yield from result.get("lines", [])
+        marker = result.get("marker")
+        if marker is None:
+            return
+
+
+def fetch_account_snapshot(send, models, address, lines_limit=None):
+    """
+    Fetch an account's balance, domain, flags and trust lines as of one validated ledger
+
+    `account_info` is read at the latest validated ledger and supplies the
+    native balance, Domain and Flags; `account_lines` pages are then pinned
+    to the ledger index that answer came from, so balance and trust lines
+    always describe the same ledger. Trust lines are streamed: the first
+    page is requested when `lines` is first iterated.
+
+    Args:
+        send: Callable taking a request model and returning its response
+        models: Module with AccountInfo and AccountLines (xrpl.models or xahau.models)
+        address: Account address
+        lines_limit: Trust lines per account_lines page
+
+    Returns:
+        AccountSnapshot: balance in XRP/XAH, domain as text (or None),
+            flags as an int, lines as an iterator over the raw account_lines
+            entries (see iter_account_lines)
+
+    Raises:
+        LedgerRequestError: If account_info returns an error
+    """
+    info = checked_result(send(models.AccountInfo(account=address, ledger_index="validated")))
+    ledger_index = info["ledger_index"]
+    account_data = info["account_data"]
+    domain_hex = account_data.get("Domain")
+
+    return AccountSnapshot(
+        address=address,
+        ledger_index=ledger_index,
+        balance=int(account_data["Balance"]) / DROPS_PER_UNIT,
+        domain=safe_hex_to_str(domain_hex) if domain_hex else None,
+        flags=account_data.get("Flags", 0),
+        lines=iter_account_lines(send, models, address, ledger_index, lines_limit)
+    )
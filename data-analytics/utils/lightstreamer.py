@@ -0,0 +1,189 @@
+"""
+Minimal Lightstreamer TLCP client over WebSocket (MERGE subscriptions)
+"""
+import asyncio
+import itertools
+from collections import namedtuple
+from urllib.parse import quote, unquote
+
+import websockets
+
+TLCP_PROTOCOL = "TLCP-2.1.0.lightstreamer.com"
+# Client identifier Lightstreamer documents for custom TLCP clients
+CLIENT_ID = "mgQkwtwdysogQz2BJ4Ji kOj2Bg"
+
+# Notifications that need no action from a streaming client
+IGNORED = {"PROBE", "NOOP", "SYNC", "SERVNAME", "CLIENTIP", "CONS", "PROG",
+           "REQOK", "MSGDONE", "MSGFAIL", "CONF", "EOS", "CS", "UNSUB", "WSOK"}
+
+Update = namedtuple("Update", ["item", "fields", "changed"])
+
+
+class LightstreamerError(Exception):
+    """Session or request refused by the server, or session ended"""
+
+
+def encode_params(params):
+    """Encode request parameters (values percent-encoded, spaces included)"""
+    return "&".join(f"{key}={quote(str(value), safe='')}" for key, value in params.items())
+
+
+def decode_value(token):
+    """Decode one non-empty TLCP field token: '#' is null, '$' is the empty string"""
+    if token == "#":
+        return None
+    if token == "$":
+        return ""
+    return unquote(token)
+
+
+def apply_update(previous, encoded):
+    """
+    Apply a TLCP field-delta update to an item's previous values
+
+    In an update, an empty token leaves one field unchanged and `^N` leaves
+    the next N fields unchanged; other tokens are the new (percent-encoded)
+    value.
+
+    Args:
+        previous: List of current field values (None before the first update)
+        encoded: The `|`-separated values part of a `U` notification
+
+    Returns:
+        tuple: (values, changed) - new value list and indexes of changed fields
+    """
+    values = list(previous)
+    changed = []
+    i = 0
+    for token in encoded.split("|"):
+        if token == "":
+            i += 1
+        elif token[0] == "^" and token[1:].isdigit():
+            i += int(token[1:])
+        else:
+            values[i] = decode_value(token)
+            changed.append(i)
+            i += 1
+    return values, changed
+
+
+class Subscription:
+    """Items, fields and last known values for one MERGE subscription"""
+    def __init__(self, items, fields, data_adapter=None):
+        self.items = list(items)
+        self.fields = list(fields)
+        self.data_adapter = data_adapter
+        self.values = [[None] * len(self.fields) for _ in self.items]
+
+
+class LightstreamerClient:
+    """
+    Single-session TLCP client
+
+    One WebSocket carries the session and every subscription; updates for
+    all items arrive on it as field deltas, and the client keeps each
+    item's full state so callers always see complete field dicts.
+
+    Usage:
+        client = LightstreamerClient("wss://push.lightstreamer.com/lightstreamer", "ISSLIVE")
+        await client.connect()
+        await client.subscribe(["NODE3000005"], ["Value", "TimeStamp"])
+        async for update in client.updates():
+            ...
+    """
+    def __init__(self, url, adapter_set, user=None, password=None,
+                 keepalive_ms=5000, idle_timeout=30.0):
+        self.url = url  # Full WebSocket endpoint, used as given
+        self.adapter_set = adapter_set
+        self.user = user
+        self.password = password
+        self.keepalive_ms = keepalive_ms
+        self.idle_timeout = idle_timeout
+        self.ws = None
+        self.session_id = None
+        self.subscriptions = {}
+        self._ids = itertools.count(1)
+
+    async def _lines(self):
+        """Yield notification lines until the socket closes or the link goes quiet"""
+        while True:
+            message = await asyncio.wait_for(self.ws.recv(), timeout=self.idle_timeout)
+            for line in message.split("\r\n"):
+                if line:
+                    yield line
+
+    async def connect(self):
+        """Open the WebSocket and create a session; returns the session id"""
+        self.ws = await websockets.connect(self.url, subprotocols=[TLCP_PROTOCOL])
+        params = {"LS_cid": CLIENT_ID, "LS_adapter_set": self.adapter_set,
+                  "LS_keepalive_millis": self.keepalive_ms}
+        if self.user:
+            params["LS_user"] = self.user
+        if self.password:
+            params["LS_password"] = self.password
+        await self.ws.send("wsok")
+        await self.ws.send("create_session\r\n" + encode_params(params))
+        async for line in self._lines():
+            kind, _, rest = line.partition(",")
+            if kind == "CONOK":
+                self.session_id = rest.split(",", 1)[0]
+                return self.session_id
+            if kind == "CONERR":
+                raise LightstreamerError(f"Session refused: {rest}")
+
+    async def subscribe(self, items, fields, data_adapter=None, snapshot=True):
+        """Add a MERGE subscription for many items in one request; returns its id"""
+        sub_id = next(self._ids)
+        subscription = Subscription(items, fields, data_adapter)
+        self.subscriptions[sub_id] = subscription
+        params = {
+            "LS_reqId": sub_id,
+            "LS_op": "add",
+            "LS_subId": sub_id,
+            "LS_mode": "MERGE",
+            "LS_group": " ".join(subscription.items),
+            "LS_schema": " ".join(subscription.fields),
+            "LS_snapshot": "true" if snapshot else "false",
+        }
+        if data_adapter:
+            params["LS_data_adapter"] = data_adapter
+        await self.ws.send("control\r\n" + encode_params(params))
+        return sub_id
+
+    def _update(self, rest):
+        sub_id, item_index, encoded = rest.split(",", 2)
+        subscription = self.subscriptions[int(sub_id)]
+        index = int(item_index) - 1
+        values, changed = apply_update(subscription.values[index], encoded)
+        subscription.values[index] = values
+        return Update(
+            subscription.items[index],
+            dict(zip(subscription.fields, values)),
+            {subscription.fields[i] for i in changed}
+        )
+
+    async def updates(self):
+        """
+        Yield an Update for every item change, across all subscriptions
+
+        Raises:
+            LightstreamerError: On request errors or when the server ends the session
+            asyncio.TimeoutError: If nothing (not even a keepalive) arrives in idle_timeout
+        """
+        async for line in self._lines():
+            kind, _, rest = line.partition(",")
+            if kind == "U":
+                yield self._update(rest)
+            elif kind in IGNORED or kind == "SUBOK":
+                continue
+            elif kind in ("REQERR", "ERROR", "CONERR"):
+                raise LightstreamerError(f"{kind}: {rest}")
+            elif kind in ("END", "LOOP"):
+                raise LightstreamerError(f"Session ended ({kind} {rest})")
+            # OV: the server merged updates it couldn't send; deltas stay
+            # relative to the last update received, so nothing to resync
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+            self.ws = None
@@ -0,0 +1,320 @@
+"""
+Prometheus instrumentation for the collectors
+
+Counters, gauges and latency histograms are kept in memory in the process
+and rendered in the text exposition format, either on a local HTTP
+`/metrics` endpoint (METRICS_PORT, for the scheduler and other long-running
+processes) or as a node_exporter textfile rewritten after every run
+(METRICS_TEXTFILE_DIR, for cron). Recording is a lock and a dict update,
+so instrumenting per-account or per-request code costs microseconds.
+Importing a collector never opens a socket: long-running entry points
+call serve() themselves.
+
+Usage:
+    instruments = Collector('xrpl_balances')
+
+    with instruments.run():
+        with instruments.stage('fetch'):
+            ...
+        instruments.rows_written('asset_balances', count)
+
+    metrics.serve()  # In a long-running entry point only
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import MetricsConfig
+from .prometheus import format_labels
+
+# Seconds; from a cached lookup up to a slow speedtest or registry download
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """
+    One metric family with a fixed set of label names
+
+    With `function`, values are read at render time from function(), which
+    returns {label_values_tuple: value}; nothing is recorded on the hot path.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = tuple(zip(self.labelnames, key)) + extra
+        return "{" + format_labels(pairs) + "}" if pairs else ""
+
+    def _items(self):
+        if self.function is not None:
+            return list(self.function().items())
+        with self.lock:
+            return list(self.values.items())
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, value in sorted(self._items()):
+            yield f"{self.name}{self._labels(key)} {format_value(value)}"
+
+
+class Counter(Metric):
+    """Monotonic count; name it with a `_total` suffix"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values (seconds, for latencies) in fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts with +Inf last, then sum
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self.lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+        for key, counts, total in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = (("le", format_value(float(bound))),)
+                yield f"{self.name}_bucket{self._labels(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(key)} {format_value(total)}"
+            yield f"{self.name}_count{self._labels(key)} {cumulative}"
+
+
+class Registry:
+    """Metric families of one process, rendered together"""
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; registering a name again returns the existing one"""
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=(), function=None):
+    return REGISTRY.register(Counter(name, help, labelnames, function))
+
+
+def gauge(name, help, labelnames=(), function=None):
+    return REGISTRY.register(Gauge(name, help, labelnames, function))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+STAGE_SECONDS = histogram('collector_stage_duration_seconds',
+                          "Time spent in each collector stage", ('collector', 'stage'))
+STAGE_ERRORS = counter('collector_stage_errors_total',
+                       "Stages that ended with an exception", ('collector', 'stage'))
+ROWS_WRITTEN = counter('collector_rows_written_total',
+                       "Rows committed to the database", ('collector', 'table'))
+ROWS_DISCARDED = counter('collector_rows_discarded_total',
+                         "Rows rejected by the database or lost with a failed batch", ('collector', 'table'))
+RUNS = counter('collector_runs_total', "Collector runs by outcome", ('collector', 'outcome'))
+API_SECONDS = histogram('api_request_duration_seconds',
+                        "Latency of requests to external APIs", ('api',))
+LAST_SUCCESS = gauge('collector_last_success_timestamp_seconds',
+                     "Unix time the collector last finished a run without an exception", ('collector',))
+
+
+class Collector:
+    """Stage timings, row counts and run outcomes for one collector"""
+    def __init__(self, name):
+        self.name = name
+        self.run_failed = False
+        init(name)
+
+    @contextmanager
+    def stage(self, stage):
+        """Time the `with` block as `stage` (fetch, price, insert, commit, ...); exceptions are counted"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            STAGE_ERRORS.inc(collector=self.name, stage=stage)
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, collector=self.name, stage=stage)
+
+    def rows_written(self, table, count):
+        ROWS_WRITTEN.inc(count, collector=self.name, table=table)
+
+    def rows_discarded(self, table, count):
+        """Count rows that could not be written; the run is marked as failed"""
+        ROWS_DISCARDED.inc(count, collector=self.name, table=table)
+        self.failed()
+
+    def failed(self):
+        """Mark the current run as failed where an error is reported rather than raised"""
+        self.run_failed = True
+
+    @contextmanager
+    def run(self):
+        """One collector run: timed as the `run` stage, then exported to the textfile"""
+        outcome = "failure"
+        self.run_failed = False
+        try:
+            with self.stage("run"):
+                yield
+            if not self.run_failed:
+                outcome = "success"
+                LAST_SUCCESS.set(time.time(), collector=self.name)
+        finally:
+            RUNS.inc(collector=self.name, outcome=outcome)
+            export()
+
+
+# Process-wide exporter state; the first init() names the process
+_process_name = None
+_server = None
+_init_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def init(name):
+    """
+    Name this process's metrics (the textfile is `<name>.prom`)
+
+    Only the first call has an effect, so collectors imported by the
+    scheduler share its textfile.
+    """
+    global _process_name
+    with _init_lock:
+        if _process_name is None:
+            _process_name = name
+
+
+def serve():
+    """
+    Start the /metrics endpoint if METRICS_PORT is set
+
+    For long-running processes (the scheduler, --daemon modes, the ISS
+    collector); one-shot cron runs use the textfile instead, so they never
+    bind the port. Later calls are no-ops.
+    """
+    global _server
+    with _init_lock:
+        if _server is not None or not MetricsConfig.PORT:
+            return
+        try:
+            _server = start_http_server(MetricsConfig.PORT, MetricsConfig.ADDR)
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint not started on {MetricsConfig.ADDR}:{MetricsConfig.PORT}: {e}")
+
+
+def start_http_server(port, addr='127.0.0.1', registry=REGISTRY):
+    """Serve `GET /metrics` from a daemon thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only long-running processes need it
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would drown the collector's own output
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Atomically write the registry for node_exporter's textfile collector"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def export():
+    """Rewrite `<METRICS_TEXTFILE_DIR>/<process name>.prom`, if a directory is configured"""
+    if not MetricsConfig.TEXTFILE_DIR or _process_name is None:
+        return
+    try:
+        os.makedirs(MetricsConfig.TEXTFILE_DIR, exist_ok=True)
+        with _export_lock:  # Scheduler jobs finish concurrently and share one file
+            write_textfile(os.path.join(MetricsConfig.TEXTFILE_DIR, f"{_process_name}.prom"))
+    except OSError as e:
+        print(f"⚠️  Could not write metrics textfile: {e}")
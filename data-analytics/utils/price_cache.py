@@ -0,0 +1,81 @@
+"""
+Persistent price cache shared by all collector processes on the host
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class PriceCache:
+    """
+    SQLite-backed USD price cache
+
+    The database runs in WAL mode so any number of collector processes can
+    read concurrently while one writes. Each entry records when it was
+    fetched; callers decide whether an entry is fresh (younger than `ttl`),
+    stale but still servable (younger than `max_stale`), or unusable.
+    """
+    def __init__(self, path, ttl=300, max_stale=3600):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _conn(self):
+        """Get this thread's connection, creating the schema on first use"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prices (
+                    coin_id TEXT PRIMARY KEY,
+                    usd REAL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self.local.conn = conn
+        return conn
+
+    def get(self, coin_id):
+        """
+        Read a cached price
+
+        Args:
+            coin_id: CoinGecko coin id
+
+        Returns:
+            tuple: (price, age_seconds), or (None, None) if not cached
+        """
+        try:
+            row = self._conn().execute(
+                "SELECT usd, fetched_at FROM prices WHERE coin_id = ?", (coin_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Price cache read error: {str(e)}")
+            return None, None
+        if row is None or row[0] is None:
+            return None, None
+        return row[0], time.time() - row[1]
+
+    def set(self, coin_id, price):
+        """Store a freshly fetched price"""
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO prices (coin_id, usd, fetched_at) VALUES (?, ?, ?)",
+                (coin_id, price, time.time())
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Price cache write error: {str(e)}")
+
+    def is_fresh(self, age):
+        return age is not None and age < self.ttl
+
+    def is_servable(self, age):
+        return age is not None and age < self.max_stale
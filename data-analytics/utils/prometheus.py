@@ -0,0 +1,141 @@
+"""
+Streaming parser for the Prometheus text exposition format
+"""
+import re
+from collections import namedtuple
+
+Sample = namedtuple("Sample", ["name", "labels", "value", "timestamp"])
+
+_LABEL_ESCAPES = {"\\": "\\", '"': '"', "n": "\n"}
+_HELP_ESCAPE = re.compile(r"\\(.)")
+
+
+def parse_labels(text):
+    """
+    Parse the inside of a `{...}` label block
+
+    Handles escaped quotes, backslashes and newlines in values, and commas
+    or braces inside quoted values.
+
+    Args:
+        text: Label block without the surrounding braces
+
+    Returns:
+        tuple: ((name, value), ...) in exposition order
+
+    Raises:
+        ValueError: If the block is malformed
+    """
+    labels = []
+    i = 0
+    length = len(text)
+    while i < length:
+        while i < length and text[i] in " ,":
+            i += 1
+        if i >= length:
+            break
+        eq = text.index("=", i)
+        name = text[i:eq].strip()
+        i = eq + 1
+        while text[i] == " ":
+            i += 1
+        if text[i] != '"':
+            raise ValueError(f"Unquoted label value for {name!r}")
+        i += 1
+        chars = []
+        while True:
+            c = text[i]
+            if c == "\\":
+                chars.append(_LABEL_ESCAPES.get(text[i + 1], "\\" + text[i + 1]))
+                i += 2
+            elif c == '"':
+                i += 1
+                break
+            else:
+                chars.append(c)
+                i += 1
+        labels.append((name, "".join(chars)))
+    return tuple(labels)
+
+
+def format_labels(labels):
+    """Render a labels tuple back into `k="v",...` form with escaping"""
+    return ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+
+
+class PrometheusParser:
+    """
+    Incremental exposition-format parser that interns series across scrapes
+
+    A scrape of the same exporter repeats the same series text on every
+    call, so the parsed (name, labels) pair for each distinct series text is
+    cached and reused: after the first scrape, labels are never re-parsed
+    and identical series share the same name/labels objects. The cache is
+    dropped once it exceeds `max_series` to bound memory under label churn.
+    """
+    def __init__(self, max_series=100000):
+        self.max_series = max_series
+        self.series = {}
+        self.types = {}
+        self.help = {}
+
+    def _series(self, text):
+        series = self.series.get(text)
+        if series is None:
+            brace = text.find("{")
+            if brace == -1:
+                series = (text.strip(), ())
+            else:
+                series = (text[:brace].strip(), parse_labels(text[brace + 1:-1]))
+            if len(self.series) >= self.max_series:
+                self.series.clear()
+            self.series[text] = series
+        return series
+
+    def _metadata(self, line):
+        parts = line[1:].split(None, 2)
+        if len(parts) < 2:
+            return
+        if parts[0] == "TYPE" and len(parts) == 3:
+            self.types[parts[1]] = parts[2].strip()
+        elif parts[0] == "HELP":
+            text = parts[2] if len(parts) == 3 else ""
+            self.help[parts[1]] = _HELP_ESCAPE.sub(
+                lambda m: "\n" if m.group(1) == "n" else m.group(1), text)
+
+    def parse(self, lines):
+        """
+        Parse exposition lines, yielding one Sample per metric line
+
+        Args:
+            lines: Iterable of text lines (e.g. response.iter_lines())
+
+        Yields:
+            Sample: (name, labels, value, timestamp_ms or None)
+        """
+        for line in lines:
+            if not line:
+                continue
+            if line[0] == "#":
+                self._metadata(line)
+                continue
+            brace = line.rfind("}")
+            try:
+                if brace == -1:
+                    parts = line.split()
+                    series_text, rest = parts[0], parts[1:]
+                else:
+                    series_text, rest = line[:brace + 1], line[brace + 1:].split()
+                name, labels = self._series(series_text)
+                value = float(rest[0])
+                timestamp = int(rest[1]) if len(rest) > 1 else None
+            except (ValueError, IndexError):
+                continue
+            yield Sample(name, labels, value, timestamp)
+
+    def parse_text(self, text):
+        """Parse a whole exposition page held in memory"""
+        return self.parse(text.splitlines())
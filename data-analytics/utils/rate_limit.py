@@ -0,0 +1,64 @@
+"""
+Token-bucket rate limiting shared by concurrent collector workers
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens/second"""
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Block until `tokens` are available, then consume them
+
+        A non-positive rate disables limiting entirely.
+
+        Args:
+            tokens: Number of tokens (requests) to consume
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint, rate, capacity=None):
+    """
+    Get the shared token bucket for an RPC endpoint
+
+    Every caller that talks to the same endpoint gets the same bucket, so
+    the combined request rate of all workers stays within the node's limit.
+
+    Args:
+        endpoint: Endpoint URL used as the bucket key
+        rate: Sustained requests per second (<= 0 disables limiting)
+        capacity: Maximum burst size (defaults to max(1, rate))
+
+    Returns:
+        TokenBucket: Shared limiter for the endpoint
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            limiter = TokenBucket(rate, capacity)
+            _limiters[endpoint] = limiter
+        return limiter
@@ -0,0 +1,138 @@
+"""
+Incremental 1-minute / 1-hour / 1-day rollups with a per-dataset watermark
+"""
+
+# Resolution name -> date_trunc unit
+RESOLUTIONS = (("1m", "minute"), ("1h", "hour"), ("1d", "day"))
+
+# Tables fold_dataset and prune_rollups need; sql/rollups.sql defines them
+ROLLUP_TABLES = ("rollup_watermarks",) + tuple(f"rollup_{name}" for name, _ in RESOLUTIONS)
+
+# New raw rows in (watermark, until], pre-aggregated to one row per key and minute
+DELTA_SQL = """
+CREATE TEMP TABLE rollup_delta ON COMMIT DROP AS
+SELECT
+    key,
+    date_trunc('minute', ts) AS bucket,
+    COUNT(*) AS count,
+    SUM(value) AS sum,
+    MIN(value) AS min,
+    MAX(value) AS max,
+    MIN(ts) AS first_ts,
+    MAX(ts) AS last_ts,
+    (array_agg(value ORDER BY ts DESC))[1] AS last_value
+FROM ({source}) src
+WHERE ts > %(since)s AND ts <= %(until)s AND value IS NOT NULL
+GROUP BY key, date_trunc('minute', ts)
+"""
+
+# Fold the delta into one resolution; merging partial aggregates is
+# associative, so a bucket may be topped up by any number of runs
+FOLD_SQL = """
+INSERT INTO rollup_{name} AS r
+    (dataset, key, bucket, count, sum, min, max, first_ts, last_ts, last_value)
+SELECT
+    %(dataset)s,
+    key,
+    date_trunc('{unit}', bucket),
+    SUM(count),
+    SUM(sum),
+    MIN(min),
+    MAX(max),
+    MIN(first_ts),
+    MAX(last_ts),
+    (array_agg(last_value ORDER BY last_ts DESC))[1]
+FROM rollup_delta
+GROUP BY key, date_trunc('{unit}', bucket)
+ON CONFLICT (dataset, key, bucket) DO UPDATE SET
+    count = r.count + EXCLUDED.count,
+    sum = r.sum + EXCLUDED.sum,
+    min = LEAST(r.min, EXCLUDED.min),
+    max = GREATEST(r.max, EXCLUDED.max),
+    first_ts = LEAST(r.first_ts, EXCLUDED.first_ts),
+    last_value = CASE WHEN EXCLUDED.last_ts >= r.last_ts THEN EXCLUDED.last_value ELSE r.last_value END,
+    last_ts = GREATEST(r.last_ts, EXCLUDED.last_ts)
+"""
+
+
+def missing_rollup_tables(cur):
+    """Return the rollup tables that don't exist yet (sql/rollups.sql creates them)"""
+    cur.execute("SELECT name FROM unnest(%s::text[]) AS name WHERE to_regclass(name) IS NULL",
+                (list(ROLLUP_TABLES),))
+    return [row[0] for row in cur.fetchall()]
+
+
+# Clock the watermark is compared against: `local` for timestamps written in
+# the database server's time zone (DEFAULT CURRENT_TIMESTAMP), `utc` for
+# collectors that store naive UTC (asset_balances, evernode execution_ts)
+CLOCKS = {
+    "local": "LOCALTIMESTAMP",
+    "utc": "now() AT TIME ZONE 'UTC'",
+}
+
+
+def fold_dataset(cur, dataset, source, lag=120, params=None, clock="local"):
+    """
+    Fold raw rows newer than the dataset's watermark into every resolution
+
+    Runs inside the caller's transaction: the rollup rows and the new
+    watermark commit together, so each raw row is counted exactly once.
+
+    Args:
+        cur: psycopg2 cursor
+        dataset: Dataset name stored in the rollup tables
+        source: SELECT yielding (key jsonb, ts timestamp, value double precision)
+        lag: Seconds behind the current time to stop at, so rows from
+            transactions still in flight are not skipped
+        params: Extra named query parameters used by `source`
+        clock: Time zone of the source's `ts` ("local" or "utc", see CLOCKS)
+
+    Returns:
+        int: Number of raw rows folded
+    """
+    # Serialize concurrent runs per dataset (the watermark row may not exist yet)
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('rollup:' || %s))", (dataset,))
+    cur.execute("SELECT watermark FROM rollup_watermarks WHERE dataset = %s", (dataset,))
+    row = cur.fetchone()
+    since = row[0] if row else "-infinity"
+    cur.execute(f"SELECT {CLOCKS[clock]} - make_interval(secs => %s)", (lag,))
+    until = cur.fetchone()[0]
+    if row and until <= since:
+        return 0
+
+    cur.execute(DELTA_SQL.format(source=source), dict(params or {}, since=since, until=until))
+    cur.execute("SELECT COALESCE(SUM(count), 0) FROM rollup_delta")
+    folded = int(cur.fetchone()[0])
+    for name, unit in RESOLUTIONS:
+        cur.execute(FOLD_SQL.format(name=name, unit=unit), {"dataset": dataset})
+    cur.execute("DROP TABLE rollup_delta")
+
+    cur.execute("""
+        INSERT INTO rollup_watermarks (dataset, watermark, updated_at)
+        VALUES (%s, %s, LOCALTIMESTAMP)
+        ON CONFLICT (dataset) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = EXCLUDED.updated_at
+    """, (dataset, until))
+    return folded
+
+
+def prune_rollups(cur, retention_days):
+    """
+    Delete rollup buckets older than each resolution's retention
+
+    Args:
+        cur: psycopg2 cursor
+        retention_days: dict of resolution name ('1m', '1h', '1d') -> days; 0 keeps everything
+
+    Returns:
+        int: Number of rollup rows deleted
+    """
+    deleted = 0
+    for name, _ in RESOLUTIONS:
+        days = retention_days.get(name)
+        if days:
+            cur.execute(
+                f"DELETE FROM rollup_{name} WHERE bucket < LOCALTIMESTAMP - make_interval(days => %s)",
+                (days,)
+            )
+            deleted += cur.rowcount
+    return deleted
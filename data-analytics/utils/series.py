@@ -0,0 +1,128 @@
+"""
+Series-normalized metric storage (series dimension + compact sample tables)
+"""
+import json
+
+from psycopg2.extras import execute_values
+
+from .prometheus import format_labels
+from .db import execute_prepared
+
+SERIES_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS series (
+    id SERIAL PRIMARY KEY,
+    metric VARCHAR(255) NOT NULL,
+    labels JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+    labels_text TEXT,
+    CONSTRAINT series_metric_labels_key UNIQUE (metric, labels)
+);
+
+CREATE TABLE IF NOT EXISTS {table} (
+    series_id INTEGER NOT NULL REFERENCES series(id),
+    ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    value DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_{table}_series_ts ON {table}(series_id, ts DESC) INCLUDE (value);
+CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table}(ts DESC);
+"""
+
+
+class SeriesRegistry:
+    """
+    Client-side cache of series ids keyed by (metric, labels)
+
+    Labels are tuples of (name, value) pairs as produced by
+    utils.prometheus, or None/() for unlabelled series. Unknown series are
+    created in bulk with one INSERT ... ON CONFLICT DO NOTHING and one
+    lookup query. Call clear() after rolling back a transaction that may
+    have created series, since their ids were never committed.
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.ids = {}
+
+    def clear(self):
+        self.ids.clear()
+
+    def resolve_many(self, cur, keys):
+        """
+        Resolve series ids for many (metric, labels) keys
+
+        Args:
+            cur: psycopg2 cursor
+            keys: Iterable of (metric, labels) pairs
+
+        Returns:
+            dict: (metric, labels) -> series id
+        """
+        keys = [(metric, labels or ()) for metric, labels in keys]
+        resolved = {key: self.ids[key] for key in keys if key in self.ids}
+        missing = list({key for key in keys if key not in resolved})
+        if missing:
+            rows = [
+                (i, metric, json.dumps(dict(labels)), format_labels(labels) or None)
+                for i, (metric, labels) in enumerate(missing)
+            ]
+            execute_values(
+                cur,
+                "INSERT INTO series (metric, labels, labels_text) VALUES %s "
+                "ON CONFLICT (metric, labels) DO NOTHING",
+                [row[1:] for row in rows],
+                template="(%s, %s::jsonb, %s)"
+            )
+            found = execute_values(
+                cur,
+                "SELECT v.idx, s.id FROM (VALUES %s) AS v(idx, metric, labels) "
+                "JOIN series s ON s.metric = v.metric AND s.labels = v.labels::jsonb",
+                [row[:3] for row in rows],
+                fetch=True
+            )
+            if len(self.ids) + len(found) > self.max_size:
+                self.ids.clear()
+            for idx, series_id in found:
+                resolved[missing[idx]] = series_id
+                self.ids[missing[idx]] = series_id
+        return resolved
+
+    def resolve(self, cur, metric, labels=None):
+        """Resolve a single series id"""
+        key = (metric, labels or ())
+        return self.resolve_many(cur, [key])[key]
+
+
+def ensure_series_schema(cur, table):
+    """Create the series table and a samples table if they don't exist"""
+    cur.execute(SERIES_SCHEMA_SQL.format(table=table))
+
+
+def insert_samples(cur, registry, table, samples, ts=None):
+    """
+    Insert samples as (series_id, ts, value) rows
+
+    Args:
+        cur: psycopg2 cursor
+        registry: SeriesRegistry used to resolve series ids
+        table: Samples table (e.g. pi_environment_samples)
+        samples: Iterable of (metric, labels, value)
+        ts: Sample timestamp (defaults to the database's LOCALTIMESTAMP)
+
+    Returns:
+        int: Number of samples inserted
+    """
+    samples = list(samples)
+    if not samples:
+        return 0
+    ids = registry.resolve_many(cur, [(metric, labels) for metric, labels, _ in samples])
+    # One array per column keeps the statement text fixed, so it can be prepared
+    execute_prepared(
+        cur,
+        f"insert_{table}",
+        f"INSERT INTO {table} (series_id, ts, value) "
+        f"SELECT series_id, COALESCE(%s::timestamp, LOCALTIMESTAMP), value "
+        f"FROM unnest(%s::int4[], %s::float8[]) AS s(series_id, value)",
+        (ts,
+         [ids[(metric, labels or ())] for metric, labels, _ in samples],
+         [value for _, _, value in samples])
+    )
+    return len(samples)
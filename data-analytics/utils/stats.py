@@ -0,0 +1,111 @@
+"""
+Streaming statistics for probe results
+"""
+import math
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed streaming histogram of latencies with loss and jitter
+
+    Samples are counted into buckets whose bounds grow by `growth` per
+    bucket, so quantiles are accurate to within about (growth - 1) / 2
+    relative error while memory stays bounded by the value range rather
+    than the number of samples. Min, max and mean are exact.
+
+    Jitter is the mean absolute difference between consecutive successful
+    samples, in the order they were recorded.
+    """
+    def __init__(self, growth=1.02, floor=0.01):
+        self.growth = growth
+        self.floor = floor
+        self._log_growth = math.log(growth)
+        self.reset()
+
+    def reset(self):
+        self.buckets = {}
+        self.count = 0
+        self.lost = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._previous = None
+        self._jitter_total = 0.0
+        self._jitter_count = 0
+
+    def _index(self, value):
+        if value <= self.floor:
+            return 0
+        return int(math.ceil(math.log(value / self.floor) / self._log_growth))
+
+    def _bound(self, index):
+        return self.floor * self.growth ** index
+
+    def record(self, value):
+        """Record one probe result; None counts as a lost probe"""
+        if value is None:
+            self.lost += 1
+            return
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if self._previous is not None:
+            self._jitter_total += abs(value - self._previous)
+            self._jitter_count += 1
+        self._previous = value
+
+    @property
+    def sent(self):
+        return self.count + self.lost
+
+    @property
+    def loss(self):
+        """Lost probes as a percentage of probes sent"""
+        return self.lost / self.sent * 100 if self.sent else 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def jitter(self):
+        return self._jitter_total / self._jitter_count if self._jitter_count else None
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile of recorded (non-lost) samples
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            float: Estimate clamped to [min, max], or None if nothing was recorded
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Bucket midpoint (geometric), clamped to the exact extremes
+                estimate = self._bound(index) / math.sqrt(self.growth) if index else self.floor
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """Dict of min/p50/p95/p99/max/mean/jitter/loss/sent for the window"""
+        return {
+            "min": self.min,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "mean": self.mean,
+            "jitter": self.jitter,
+            "loss": self.loss,
+            "sent": self.sent,
+        }